@@ -0,0 +1,4 @@
+from pathlib import Path
+
+# Where the benchmarks write their results unless told otherwise, ignored by git
+RESULTS_DIR = Path(__file__).parent / "results"
@@ -0,0 +1,105 @@
+"""Benchmark of reading the stored configuration: the sqlite3 reader versus the ORM.
+
+Every measurement is made in a fresh process, since what matters is the cost a single
+command pays: importing the config module, and the first read including whatever it
+imports and sets up on the way.
+
+    python -m benchmarks.config_read
+"""
+
+import platform
+import subprocess
+import sys
+from argparse import ArgumentParser
+from datetime import datetime
+from json import dump
+from pathlib import Path
+from statistics import mean, median
+from tempfile import TemporaryDirectory
+
+from benchmarks import RESULTS_DIR
+from benchmarks.run import REPO_ROOT, configure_services, isolate_environment
+
+# A url nothing listens on, reading config never sends requests
+UNUSED_URL = "http://127.0.0.1:9"
+
+TIMED_READ = """
+from time import perf_counter
+start = perf_counter()
+from ttcli.config.{module} import {function}
+{function}()
+print(perf_counter() - start)
+"""
+
+TIMED_IMPORT = """
+from time import perf_counter
+start = perf_counter()
+import ttcli.config.settings
+print(perf_counter() - start)
+"""
+
+
+def measure_in_subprocess(code: str, repeat: int) -> dict:
+    timings = [
+        float(
+            subprocess.run(
+                [sys.executable, "-c", code],
+                check=True,
+                capture_output=True,
+                text=True,
+                cwd=REPO_ROOT,
+            ).stdout
+        )
+        for _ in range(repeat)
+    ]
+    return {
+        "runs": repeat,
+        "median": median(timings),
+        "mean": mean(timings),
+        "min": min(timings),
+        "max": max(timings),
+    }
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", type=Path, default=RESULTS_DIR / "config-read.json")
+    args = parser.parse_args()
+
+    with TemporaryDirectory(prefix="ttcli-bench-") as scratch_dir:
+        urls = {name: UNUSED_URL for name in ("severa", "noa", "tripletex")}
+        isolate_environment(Path(scratch_dir), urls)
+        configure_services(UNUSED_URL)
+
+        results = {
+            "import_config": measure_in_subprocess(TIMED_IMPORT, args.repeat),
+            "read_sqlite3": measure_in_subprocess(
+                TIMED_READ.format(module="settings", function="read_config"),
+                args.repeat,
+            ),
+            "read_orm": measure_in_subprocess(
+                TIMED_READ.format(module="config", function="read_configs_with_orm"),
+                args.repeat,
+            ),
+        }
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with args.output.open("w") as output:
+        dump(report, output, indent=2)
+
+    for name, stats in results.items():
+        print(f"{name:32} {stats['median'] * 1000:10.1f} ms")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
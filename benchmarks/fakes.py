@@ -0,0 +1,524 @@
+"""Local stand-ins for Severa, Noa Workbook and TripleTex.
+
+Each fake is a small threaded http server that answers just enough of the real api for
+the ttcli clients to log in, write hours and read timesheets. Every response is delayed
+by a configurable latency to approximate a real round trip. A fake can also be given
+a rate limit and a limit on concurrent requests, which it enforces like a real service
+would, with a 429 and a Retry-After header.
+"""
+
+import re
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps, loads
+from threading import Lock, Thread
+from time import monotonic, sleep
+from typing import Any, Callable, Optional
+from urllib.parse import parse_qs, unquote, urlparse
+
+Route = tuple[str, re.Pattern, Callable[["FakeRequest"], Any]]
+
+
+@dataclass
+class FakeRequest:
+    method: str
+    path: str
+    query: dict[str, str]
+    body: bytes
+    match: re.Match
+
+    def json(self) -> Any:
+        return loads(self.body or b"null")
+
+
+@dataclass
+class FakeResponse:
+    body: Any
+    status: int = 200
+    content_type: str = "application/json"
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class FakeServer:
+    name: str
+    latency: float = 0.0
+    routes: list[Route] = field(default_factory=list)
+    request_count: int = 0
+    # Requests per second, and requests at once, before answering 429
+    rate_limit: Optional[float] = None
+    max_in_flight: Optional[int] = None
+    throttled_count: int = 0
+    in_flight: int = 0
+    # What a fake serves that a benchmark may want to change, like project versions
+    state: dict = field(default_factory=dict)
+    # A full bucket to begin with
+    _tokens: Optional[float] = None
+    _refilled_at: float = field(default_factory=monotonic)
+    _lock: Lock = field(default_factory=Lock)
+
+    def route(self, method: str, pattern: str):
+        def register(handler: Callable[[FakeRequest], Any]):
+            self.routes.append((method, re.compile(pattern + "$"), handler))
+            return handler
+
+        return register
+
+    def throttle(self) -> Optional[FakeResponse]:
+        """A 429 if this request goes over the limits, otherwise it's in flight"""
+        with self._lock:
+            if self.rate_limit is not None:
+                now = monotonic()
+                tokens = self.rate_limit if self._tokens is None else self._tokens
+                self._tokens = min(
+                    self.rate_limit,
+                    tokens + (now - self._refilled_at) * self.rate_limit,
+                )
+                self._refilled_at = now
+                if self._tokens < 1:
+                    self.throttled_count += 1
+                    wait = (1 - self._tokens) / self.rate_limit
+                    return FakeResponse(
+                        {"status": 429, "message": "Too many requests"},
+                        status=429,
+                        headers={"retry-after": f"{wait:.3f}"},
+                    )
+                self._tokens -= 1
+
+            if self.max_in_flight is not None and self.in_flight >= self.max_in_flight:
+                self.throttled_count += 1
+                return FakeResponse(
+                    {"status": 429, "message": "Too many concurrent requests"},
+                    status=429,
+                    headers={"retry-after": "1"},
+                )
+            self.in_flight += 1
+            return None
+
+    def handle(self, request: BaseHTTPRequestHandler):
+        self.request_count += 1
+        parsed = urlparse(request.path)
+        path = unquote(parsed.path)
+        length = int(request.headers.get("content-length") or 0)
+        body = request.rfile.read(length) if length else b""
+        query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+
+        throttled = self.throttle()
+        if throttled is not None:
+            response = throttled
+        else:
+            response = FakeResponse({"status": 404, "message": "Not found"}, status=404)
+            try:
+                for method, pattern, handler in self.routes:
+                    if method == request.command and (match := pattern.match(path)):
+                        result = handler(FakeRequest(method, path, query, body, match))
+                        if isinstance(result, FakeResponse):
+                            response = result
+                        else:
+                            response = FakeResponse(result)
+                        break
+
+                if self.latency:
+                    sleep(self.latency)
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+
+        payload = (
+            response.body
+            if isinstance(response.body, str)
+            else dumps(response.body, default=str)
+        ).encode()
+        request.send_response(response.status)
+        request.send_header("content-type", response.content_type)
+        for name, value in response.headers.items():
+            request.send_header(name, value)
+        request.send_header("content-length", str(len(payload)))
+        request.end_headers()
+        request.wfile.write(payload)
+
+    def start(self) -> str:
+        """Serve in a daemon thread, returning the base url"""
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                fake.handle(self)
+
+            do_POST = do_PUT = do_PATCH = do_DELETE = do_GET
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def week_dates(start: date) -> list[date]:
+    monday = start - timedelta(days=start.weekday())
+    return [monday + timedelta(days=i) for i in range(7)]
+
+
+def date_range(start: date, end: date) -> list[date]:
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def parse_day(value: str) -> date:
+    return datetime.fromisoformat(value[:10]).date()
+
+
+def fake_severa(latency: float = 0.0) -> FakeServer:
+    """Severa's rest api and the Visma Connect login pages, served from the same host.
+    Point both TTCLI_SEVERA_URL and TTCLI_VISMA_CONNECT_URL at it."""
+    server = FakeServer("Severa", latency)
+    api = "/psarest/v0.1"
+    user_guid = "bench-user"
+
+    def hidden_inputs(**values: str) -> str:
+        inputs = "".join(
+            f'<input type="hidden" name="{k}" value="{v}">' for k, v in values.items()
+        )
+        return f"<html><body><form>{inputs}</form></body></html>"
+
+    @server.route("GET", f"{api}/authentication/ExternalLogin")
+    def login_page(request: FakeRequest):
+        return FakeResponse(
+            hidden_inputs(__RequestVerificationToken="csrf", ReturnUrl="/callback"),
+            content_type="text/html",
+        )
+
+    @server.route("POST", "/password")
+    def password(request: FakeRequest):
+        return FakeResponse(
+            hidden_inputs(
+                id_token="id", scope="openid", code="code", session_state="s"
+            ),
+            content_type="text/html",
+        )
+
+    @server.route("POST", f"{api}/authentication/vismaConnect/obtainLocalAccessToken")
+    def access_token(request: FakeRequest):
+        expires = datetime.now(tz=timezone.utc) + timedelta(hours=1)
+        return {
+            "accessToken": "bench-access-token",
+            "expiresUtc": expires.isoformat(),
+            "user": {"guid": user_guid},
+        }
+
+    @server.route("GET", f"{api}/users/[^/]+/+phasetreephases")
+    def phases(request: FakeRequest):
+        return [
+            {
+                "guid": "phase-guid",
+                "name": "Development",
+                "defaultWorkType": {"guid": "work-type"},
+                "customer": {"guid": "customer"},
+                "project": {"guid": "project"},
+            }
+        ]
+
+    @server.route("POST", f"{api}/workhours")
+    def write(request: FakeRequest):
+        return request.json() | {"guid": "workhour-guid"}
+
+    @server.route("PATCH", f"{api}/users/[^/]+/workdays/(?P<day>[0-9-]+)")
+    def lock(request: FakeRequest):
+        return {"eventDate": request.match["day"], "isCompleted": True}
+
+    @server.route("GET", f"{api}/users/[^/]+/+workhours")
+    def workhours(request: FakeRequest):
+        days = date_range(
+            parse_day(request.query["startDate"]), parse_day(request.query["endDate"])
+        )
+        first_row = int(request.query.get("firstRow", 0))
+        row_count = int(request.query.get("rowCount", 100))
+        return [
+            {
+                "guid": f"workhour-{day.isoformat()}",
+                "eventDate": day.isoformat(),
+                "quantity": 7.5,
+                "description": f"Worked on benchmarks {day.isoformat()}",
+                "phase": {"guid": "phase-guid", "name": "Development"},
+            }
+            for day in days
+            if day.weekday() < 5
+        ][first_row : first_row + row_count]
+
+    return server
+
+
+NOA_ENTRY_FIELDS: dict[str, Any] = {
+    "ActivityId": 1,
+    "ApprovalStatus": 0,
+    "Billable": True,
+    "Correction": 0,
+    "Cost": 0.0,
+    "CostCurrencyAmount": 0.0,
+    "CostCurrencyId": 1,
+    "CostMethod": 0,
+    "CreateResourceId": 1,
+    "DeletedMarked": False,
+    "DescriptionRequired": False,
+    "HoursMoved": 0.0,
+    "JobId": 1,
+    "JournalNumber": 0,
+    "PricelistId": 1,
+    "Public": True,
+    "ResourceId": 1,
+    "Sale": 0.0,
+    "SaleCurrencyAmount": 0.0,
+    "SaleCurrencyId": 1,
+    "SequenceNumber": 0,
+    "TariffAdditionalPercentCost": 0.0,
+    "TariffAdditionalPercentIcSale": 0.0,
+    "TariffAdditionalPercentSale": 0.0,
+    "TaskId": 1,
+    "UpdateResourceId": 1,
+    "UpdateType": 0,
+}
+
+NOA_WEEK_ENTRY_FIELDS: dict[str, Any] = {
+    "Access": True,
+    "CanEdit": True,
+    "CanEditWeek": True,
+    "LockDescription": "",
+    "LockNumber": 0,
+    "Locked": False,
+    "Pinned": True,
+    "SequenceHasEntry": True,
+    "TaskHours": 0.0,
+    "TaskHoursTimeRegistration": 0.0,
+    "TaskPhaseName": "Development",
+    "IsCostingCodeValid": True,
+}
+
+
+def noa_entry(day: date, week: bool = True, **overrides) -> dict:
+    timestamp = datetime.combine(day, datetime.min.time()).isoformat()
+    entry = NOA_ENTRY_FIELDS | {
+        "Id": day.toordinal(),
+        "CreateDate": timestamp,
+        "PostDate": timestamp,
+        "RegistrationDate": timestamp,
+        "UpdateDate": timestamp,
+    }
+    if day.weekday() < 5:
+        entry |= {"Hours": 7.5, "Description": f"Worked on benchmarks {day}"}
+    if week:
+        entry |= NOA_WEEK_ENTRY_FIELDS
+    return entry | overrides
+
+
+def fake_noa(latency: float = 0.0) -> FakeServer:
+    server = FakeServer("Noa Workbook", latency)
+
+    @server.route("POST", "/api/auth/handshake")
+    def handshake(request: FakeRequest):
+        return {"Id": 1, "Name": "Bench Marksen"}
+
+    @server.route("GET", "/api/json/reply/TimeEntryDailyRequest")
+    def week(request: FakeRequest):
+        return [noa_entry(day) for day in week_dates(parse_day(request.query["Date"]))]
+
+    @server.route("POST", "/api/json/reply/TimeEntryUpdateRequest")
+    def update(request: FakeRequest):
+        body = request.json()
+        day = date.fromordinal(body["Id"])
+        return noa_entry(
+            day, week=False, Hours=body["Hours"], Description=body["Description"]
+        )
+
+    @server.route("GET", "/api/json/reply/TimeEntrySheetVisualizationRequest")
+    def visualization(request: FakeRequest):
+        return [
+            {
+                "Access": True,
+                "ActivityId": 1,
+                "ActivityText": "Development",
+                "CustomerId": 1,
+                "CustomerName": "Bench AS",
+                "FirstRegDate": request.query["Date"],
+                "Id": 1,
+                "JobId": 1,
+                "JobName": "Benchmarks",
+                "Pinned": True,
+                "ProjectId": 1,
+                "ProjectName": "Benchmarks",
+                "ResourceId": 1,
+                "SequenceNumber": 0,
+                "TaskDescription": "Benchmarking",
+                "TaskHours": 0.0,
+                "TaskHoursTimeRegistration": 0.0,
+                "TaskId": 1,
+                "TaskPhaseName": "Development",
+            }
+        ]
+
+    return server
+
+
+TRIPLETEX_ACTIVITY = {
+    "id": 1,
+    "isProjectActivity": False,
+    "name": "Development",
+    "displayName": "Development",
+}
+
+
+def tripletex_entry(day: date, entry_id: int | None = None, **overrides) -> dict:
+    return {
+        "id": entry_id or day.toordinal(),
+        "activity": TRIPLETEX_ACTIVITY,
+        "project": None,
+        "date": day.isoformat(),
+        "hours": 7.5,
+        "comment": f"Worked on benchmarks {day}",
+    } | overrides
+
+
+def tripletex_activity(activity_id: int, name: str, is_project: bool) -> dict:
+    return {
+        "id": activity_id,
+        "isProjectActivity": is_project,
+        "name": name,
+        "displayName": name,
+    }
+
+
+def paged(request: FakeRequest, values: list) -> dict:
+    first = int(request.query.get("from", 0))
+    count = int(request.query.get("count", 1000))
+    page = values[first : first + count]
+    return {"fullResultSize": len(values), "count": len(page), "values": page}
+
+
+def fake_tripletex(latency: float = 0.0, projects: int = 50) -> FakeServer:
+    """The tripletex api under /v2 and the auth broker under /login.
+    `server.state["projects"]` has the projects that can be logged to, by id, with a
+    version and their activity names."""
+    server = FakeServer("TripleTex", latency)
+    written: set[str] = set()
+    server.state["projects"] = {
+        1000
+        + i: {
+            "name": f"Project {i}",
+            "version": 1,
+            "activities": ["Development", "Meetings", f"Support {i}"],
+        }
+        for i in range(projects)
+    }
+    general = [TRIPLETEX_ACTIVITY, tripletex_activity(2, "Internal", False)]
+
+    @server.route("GET", "/v2/project/>forTimeSheet")
+    def projects_for_timesheet(request: FakeRequest):
+        return paged(
+            request,
+            [
+                {
+                    "id": project_id,
+                    "name": project["name"],
+                    "displayName": f"{project_id} {project['name']}",
+                    "number": project_id,
+                    "version": project["version"],
+                }
+                for project_id, project in server.state["projects"].items()
+            ],
+        )
+
+    @server.route("GET", "/v2/activity/>forTimeSheet")
+    def activities_for_timesheet(request: FakeRequest):
+        project_id = int(request.query["projectId"])
+        names = server.state["projects"][project_id]["activities"]
+        return paged(
+            request,
+            [
+                tripletex_activity(project_id * 100 + i, name, True)
+                for i, name in enumerate(names)
+            ],
+        )
+
+    @server.route("GET", "/v2/activity")
+    def activities(request: FakeRequest):
+        return paged(request, general)
+
+    @server.route("POST", "/login")
+    def login(request: FakeRequest):
+        base_url = f"http://127.0.0.1:{server.server.server_port}"
+        return {
+            "id": 1,
+            "url": f"{base_url}/v2/token/session/1",
+            "token": "bench-session-token",
+            "expirationDate": (date.today() + timedelta(days=7)).isoformat(),
+            "apiUrl": f"{base_url}/v2/",
+        }
+
+    @server.route("GET", "/v2/token/session/>whoAmI")
+    def who_am_i(request: FakeRequest):
+        return {
+            "value": {
+                "employeeId": 1,
+                "employee": {"id": 1},
+                "companyId": 1,
+                "company": {"id": 1},
+            }
+        }
+
+    @server.route("POST", "/v2/timesheet/entry")
+    def write(request: FakeRequest):
+        body = request.json()
+        if body["date"] in written:
+            return FakeResponse({"status": 409, "message": "Duplicate"}, status=409)
+        written.add(body["date"])
+        return {"value": tripletex_entry(parse_day(body["date"]))}
+
+    @server.route("GET", "/v2/timesheet/entry")
+    def search(request: FakeRequest):
+        days = date_range(
+            parse_day(request.query["dateFrom"]),
+            parse_day(request.query["dateTo"]) - timedelta(days=1),
+        )
+        values = [
+            tripletex_entry(day)
+            for day in days
+            if day.weekday() < 5 or day.isoformat() in written
+        ]
+        first = int(request.query.get("from", 0))
+        count = int(request.query.get("count", 1000))
+        return {
+            "fullResultSize": len(values),
+            "values": values[first : first + count],
+        }
+
+    @server.route("PUT", "/v2/timesheet/entry/(?P<id>[0-9]+)")
+    def update(request: FakeRequest):
+        body = request.json()
+        day = date.fromordinal(int(request.match["id"]))
+        return {
+            "value": tripletex_entry(day, hours=body["hours"], comment=body["comment"])
+        }
+
+    @server.route("GET", "/v2/timesheet/week")
+    def week(request: FakeRequest):
+        year, week_number = map(int, request.query["weekYear"].split("-"))
+        monday = date.fromisocalendar(year, week_number, 1)
+        entries = [tripletex_entry(day) for day in week_dates(monday)]
+        return {
+            "values": [
+                {
+                    "timesheetEntries": [
+                        e for e in entries if parse_day(e["date"]).weekday() < 5
+                    ]
+                }
+            ]
+        }
+
+    return server
@@ -0,0 +1,39 @@
+"""A plaintext file keyring so benchmarks never touch the real system keyring.
+
+Select it with PYTHON_KEYRING_BACKEND=benchmarks.keyring_backend.FileKeyring and point
+BENCH_KEYRING_FILE at a scratch file.
+"""
+
+from json import dump, load
+from os import environ
+
+from keyring.backend import KeyringBackend
+
+
+class FileKeyring(KeyringBackend):
+    priority = 1  # type: ignore
+
+    @property
+    def path(self) -> str:
+        return environ["BENCH_KEYRING_FILE"]
+
+    def _read(self) -> dict[str, str]:
+        try:
+            with open(self.path) as store:
+                return load(store)
+        except FileNotFoundError:
+            return {}
+
+    def get_password(self, service: str, username: str) -> str | None:
+        return self._read().get(f"{service}:{username}")
+
+    def set_password(self, service: str, username: str, password: str):
+        passwords = self._read() | {f"{service}:{username}": password}
+        with open(self.path, "w") as store:
+            dump(passwords, store)
+
+    def delete_password(self, service: str, username: str):
+        passwords = self._read()
+        passwords.pop(f"{service}:{username}", None)
+        with open(self.path, "w") as store:
+            dump(passwords, store)
@@ -0,0 +1,252 @@
+"""End-to-end benchmarks for tt-cli against local stand-ins of every service.
+
+Runs entirely offline: the real Severa, NoaWorkbook and TripleTex clients are pointed
+at the fakes in benchmarks.fakes, configuration lives in a scratch directory and the
+keyring is replaced by a plaintext file keyring.
+
+    python -m benchmarks.run --latency 0.05
+"""
+
+import csv
+import platform
+import subprocess
+import sys
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from datetime import date, datetime, timedelta
+from io import StringIO
+from json import dump, dumps
+from os import environ, pathsep
+from pathlib import Path
+from statistics import mean, median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable
+
+from benchmarks import RESULTS_DIR
+from benchmarks.fakes import fake_noa, fake_severa, fake_tripletex
+
+REPO_ROOT = Path(__file__).parent.parent
+
+
+def measure(fn: Callable[[], object], repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        fn()
+        timings.append(perf_counter() - start)
+
+    return {
+        "runs": repeat,
+        "median": median(timings),
+        "mean": mean(timings),
+        "min": min(timings),
+        "max": max(timings),
+    }
+
+
+def isolate_environment(scratch: Path, urls: dict[str, str]):
+    """Must run before anything from ttcli is imported"""
+    environ["XDG_CONFIG_HOME"] = str(scratch / "config")
+    environ["PYTHON_KEYRING_BACKEND"] = "benchmarks.keyring_backend.FileKeyring"
+    environ["BENCH_KEYRING_FILE"] = str(scratch / "keyring.json")
+    environ["TTCLI_SEVERA_TOKEN_CACHE"] = str(scratch / "severauth")
+    environ["TTCLI_SEVERA_URL"] = urls["severa"]
+    environ["TTCLI_VISMA_CONNECT_URL"] = urls["severa"]
+    environ["TTCLI_NOA_URL"] = urls["noa"] + "/api/"
+    environ["PYTHONPATH"] = pathsep.join(
+        filter(None, [str(REPO_ROOT), environ.get("PYTHONPATH")])
+    )
+
+
+def configure_services(tripletex_url: str):
+    from benchmarks.fakes import TRIPLETEX_ACTIVITY
+    from ttcli.config.config import write_config
+    from ttcli.config.settings import source_config
+    from ttcli.noa.NoaWorkbook import NOA_PASSWORD_KEY, NOA_USERNAME_KEY, NoaWorkbook
+    from ttcli.Severa import SEVERA_PASSWORD_KEY, SEVERA_USERNAME_KEY, Severa
+    from ttcli.tripletex.TripleTex import (
+        TT_CONFIGURED_ACTIVITY_KEY,
+        TT_EMPLOYEE_TOKEN_KEY,
+        TT_SERVICE_URL_KEY,
+        TripleTex,
+    )
+
+    write_config(Severa, {SEVERA_USERNAME_KEY: "bench", SEVERA_PASSWORD_KEY: "bench"})
+    write_config(NoaWorkbook, {NOA_USERNAME_KEY: "bench", NOA_PASSWORD_KEY: "bench"})
+    write_config(
+        TripleTex,
+        {
+            TT_EMPLOYEE_TOKEN_KEY: "bench",
+            TT_SERVICE_URL_KEY: f"{tripletex_url}/login",
+            TT_CONFIGURED_ACTIVITY_KEY: dumps(
+                {"activity": TRIPLETEX_ACTIVITY, "is_project": False}
+            ),
+        },
+    )
+    source_config()
+
+
+def bench_cli_startup(repeat: int) -> dict:
+    return measure(
+        lambda: subprocess.run(
+            [sys.executable, "-m", "ttcli.main", "--help"],
+            check=True,
+            capture_output=True,
+            cwd=REPO_ROOT,
+        ),
+        repeat,
+    )
+
+
+def bench_logins(repeat: int, scratch: Path) -> dict[str, dict]:
+    from ttcli.config.config import write_config
+    from ttcli.config.settings import read_service_config
+    from ttcli.noa.NoaWorkbook import NoaWorkbook
+    from ttcli.Severa import Severa
+    from ttcli.tripletex.TripleTex import TripleTex
+
+    def severa():
+        (scratch / "severauth").unlink(missing_ok=True)
+        Severa().login
+
+    def noa():
+        NoaWorkbook().employee_id
+
+    def tripletex():
+        config = read_service_config(TripleTex)
+        assert config is not None
+        config.config.pop("SESSION_TOKEN", None)
+        write_config(TripleTex, config.config)
+        TripleTex().employee
+
+    return {
+        "login/severa": measure(severa, repeat),
+        "login/noa": measure(noa, repeat),
+        "login/tripletex": measure(tripletex, repeat),
+    }
+
+
+def bench_write_to_all(repeat: int) -> dict:
+    from ttcli.main import write_to_all
+
+    def write():
+        with redirect_stdout(StringIO()):
+            write_to_all(7.5, "Benchmarking", datetime.today(), lock=True)
+
+    return measure(write, repeat)
+
+
+def invoke(*args: str):
+    from click.testing import CliRunner
+
+    from ttcli.main import cli
+
+    result = CliRunner().invoke(cli, list(args), catch_exceptions=False)
+    if result.exit_code != 0:
+        raise RuntimeError(f"tt-cli {' '.join(args)} failed:\n{result.output}")
+
+
+def bench_timesheets(repeat: int) -> dict[str, dict]:
+    results = {}
+    month = str(date.today().month)
+    for group in ("severa", "noa", "tripletex"):
+        results[f"timesheet_week/{group}"] = measure(
+            lambda: invoke(group, "timesheet"), repeat
+        )
+        results[f"timesheet_month/{group}"] = measure(
+            lambda: invoke(group, "timesheet-month", month, "--include-future"),
+            repeat,
+        )
+
+    return results
+
+
+def bench_csv_imports(repeat: int, sizes: list[int], scratch: Path) -> dict[str, dict]:
+    results = {}
+    for size in sizes:
+        path = scratch / f"import-{size}.csv"
+        with path.open("w", newline="") as csv_file:
+            writer = csv.DictWriter(
+                csv_file, fieldnames=["date", "hours", "description"]
+            )
+            writer.writeheader()
+            first_day = date.today() - timedelta(days=size)
+            for offset in range(size):
+                writer.writerow(
+                    {
+                        "date": (first_day + timedelta(days=offset)).isoformat(),
+                        "hours": 7.5,
+                        "description": f"Imported row {offset}",
+                    }
+                )
+
+        results[f"csv_import/{size}"] = measure(
+            lambda: invoke("write-to-all-csv", "--no-lock", str(path)), repeat
+        )
+
+    return results
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds per request"
+    )
+    parser.add_argument("--severa-latency", type=float)
+    parser.add_argument("--noa-latency", type=float)
+    parser.add_argument("--tripletex-latency", type=float)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--csv-sizes", default="1,10,50")
+    parser.add_argument(
+        "--output", type=Path, default=RESULTS_DIR / "benchmark-results.json"
+    )
+    args = parser.parse_args()
+
+    def latency(specific: float | None) -> float:
+        return args.latency if specific is None else specific
+
+    fakes = {
+        "severa": fake_severa(latency(args.severa_latency)),
+        "noa": fake_noa(latency(args.noa_latency)),
+        "tripletex": fake_tripletex(latency(args.tripletex_latency)),
+    }
+    urls = {name: fake.start() for name, fake in fakes.items()}
+
+    with TemporaryDirectory(prefix="ttcli-bench-") as scratch_dir:
+        scratch = Path(scratch_dir)
+        isolate_environment(scratch, urls)
+        configure_services(urls["tripletex"])
+
+        results: dict[str, dict] = {}
+        results["cli_startup"] = bench_cli_startup(args.repeat)
+        results |= bench_logins(args.repeat, scratch)
+        results["write_to_all"] = bench_write_to_all(args.repeat)
+        results |= bench_timesheets(args.repeat)
+        sizes = [int(size) for size in args.csv_sizes.split(",") if size]
+        results |= bench_csv_imports(args.repeat, sizes, scratch)
+
+    for fake in fakes.values():
+        fake.stop()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "latency": {name: fake.latency for name, fake in fakes.items()},
+            "requests": {name: fake.request_count for name, fake in fakes.items()},
+        },
+        "results": results,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with args.output.open("w") as output:
+        dump(report, output, indent=2)
+
+    for name, stats in results.items():
+        print(f"{name:32} {stats['median'] * 1000:10.1f} ms")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Benchmark of batch commands against services that enforce rate limits.
+
+Starts the stand-ins with a rate limit and a limit on concurrent requests, which they
+enforce with 429 and Retry-After, then times a csv import and a year summary. Reports
+how long each took, how many requests the services saw and turned away, and whether
+any writes were left undelivered.
+
+    python -m benchmarks.scheduling --rate-limit 20 --max-in-flight 6 --rows 100
+"""
+
+import csv
+import platform
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from datetime import date, datetime, timedelta
+from io import StringIO
+from json import dump
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from benchmarks import RESULTS_DIR
+from benchmarks.fakes import fake_noa, fake_severa, fake_tripletex
+from benchmarks.run import configure_services, invoke, isolate_environment
+
+
+def write_import(path: Path, rows: int):
+    with path.open("w", newline="") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=["date", "hours", "description"])
+        writer.writeheader()
+        first_day = date.today() - timedelta(days=rows)
+        for offset in range(rows):
+            writer.writerow(
+                {
+                    "date": (first_day + timedelta(days=offset)).isoformat(),
+                    "hours": 7.5,
+                    "description": f"Imported row {offset}",
+                }
+            )
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="Seconds per request"
+    )
+    parser.add_argument("--rate-limit", type=float, default=20.0, help="Per second")
+    parser.add_argument("--max-in-flight", type=int, default=6)
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--output", type=Path, default=RESULTS_DIR / "scheduling.json")
+    args = parser.parse_args()
+
+    fakes = {
+        "severa": fake_severa(args.latency),
+        "noa": fake_noa(args.latency),
+        "tripletex": fake_tripletex(args.latency),
+    }
+    for fake in fakes.values():
+        fake.rate_limit, fake.max_in_flight = args.rate_limit, args.max_in_flight
+    urls = {name: fake.start() for name, fake in fakes.items()}
+
+    results = {}
+    with TemporaryDirectory(prefix="ttcli-bench-") as scratch_dir:
+        scratch = Path(scratch_dir)
+        isolate_environment(scratch, urls)
+        configure_services(urls["tripletex"])
+
+        def run(name: str, *command: str):
+            before = {key: fake.request_count for key, fake in fakes.items()}
+            throttled = {key: fake.throttled_count for key, fake in fakes.items()}
+            start = perf_counter()
+            with redirect_stdout(StringIO()):
+                invoke(*command)
+            results[name] = {
+                "seconds": perf_counter() - start,
+                "requests": {
+                    key: fake.request_count - before[key] for key, fake in fakes.items()
+                },
+                "throttled": {
+                    key: fake.throttled_count - throttled[key]
+                    for key, fake in fakes.items()
+                },
+            }
+
+        path = scratch / "import.csv"
+        write_import(path, args.rows)
+        run("csv_import", "write-to-all-csv", "--no-lock", str(path))
+
+        from ttcli.outbox import PENDING, read_items
+
+        results["csv_import"]["undelivered"] = len(read_items([PENDING]))
+
+        for group in ("severa", "noa", "tripletex"):
+            run(f"summary/{group}", group, "summary", "--year", str(date.today().year))
+
+    for fake in fakes.values():
+        fake.stop()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "latency": args.latency,
+            "rate_limit": args.rate_limit,
+            "max_in_flight": args.max_in_flight,
+            "rows": args.rows,
+        },
+        "results": results,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with args.output.open("w") as output:
+        dump(report, output, indent=2)
+
+    for name, result in results.items():
+        requests = sum(result["requests"].values())
+        throttled = sum(result["throttled"].values())
+        print(
+            f"{name:24} {result['seconds'] * 1000:10.1f} ms "
+            f"{requests:6} requests {throttled:5} throttled"
+        )
+    print(f"Undelivered writes: {results['csv_import']['undelivered']}")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
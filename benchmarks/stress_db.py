@@ -0,0 +1,132 @@
+"""Stress test of many tt-cli processes using the local database at once.
+
+Starts N processes against a fresh scratch database, so they also race to run the
+migrations, and has each of them write and read config and queue writes in a tight
+loop. Reports throughput and every error, like "database is locked".
+
+    python -m benchmarks.stress_db --processes 8 --iterations 50
+"""
+
+import multiprocessing
+import platform
+from argparse import ArgumentParser
+from collections import Counter
+from datetime import date, datetime, timedelta
+from json import dump
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter, sleep, time
+
+from benchmarks import RESULTS_DIR
+from benchmarks.run import isolate_environment
+
+# A url nothing listens on, nothing here sends requests
+UNUSED_URL = "http://127.0.0.1:9"
+# Time for every process to start, so they hit the database together
+START_DELAY = 3.0
+
+
+def worker(index: int, iterations: int, start_at: float) -> dict:
+    from ttcli.config.config import write_config
+    from ttcli.config.settings import read_config
+    from ttcli.outbox import PENDING, enqueue, read_items
+    from ttcli.Severa import SEVERA_PASSWORD_KEY, SEVERA_USERNAME_KEY, Severa
+
+    sleep(max(0.0, start_at - time()))
+    errors: Counter[str] = Counter()
+    operations = 0
+    start = perf_counter()
+    for i in range(iterations):
+        steps = (
+            lambda: write_config(
+                Severa,
+                {SEVERA_USERNAME_KEY: f"stress-{index}", SEVERA_PASSWORD_KEY: str(i)},
+            ),
+            read_config,
+            lambda: enqueue(
+                "Severa",
+                date.today() - timedelta(days=i),
+                7.5,
+                f"stress {index}",
+                False,
+            ),
+            lambda: read_items([PENDING]),
+        )
+        for step in steps:
+            try:
+                step()
+                operations += 1
+            except Exception as e:
+                errors[f"{e.__class__.__name__}: {e}"[:200]] += 1
+
+    return {
+        "operations": operations,
+        "elapsed": perf_counter() - start,
+        "errors": dict(errors),
+    }
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--output", type=Path, default=RESULTS_DIR / "stress-db.json")
+    args = parser.parse_args()
+
+    with TemporaryDirectory(prefix="ttcli-stress-") as scratch_dir:
+        urls = {name: UNUSED_URL for name in ("severa", "noa", "tripletex")}
+        isolate_environment(Path(scratch_dir), urls)
+
+        # Created up front, the processes would otherwise each generate their own
+        from ttcli.key import get_key
+
+        get_key()
+
+        context = multiprocessing.get_context("spawn")
+        start_at = time() + START_DELAY
+        with context.Pool(args.processes) as pool:
+            results = pool.starmap(
+                worker,
+                [(i, args.iterations, start_at) for i in range(args.processes)],
+            )
+
+        from ttcli.config.settings import read_config
+
+        readable = read_config() is not None
+
+    errors: Counter[str] = Counter()
+    for result in results:
+        errors.update(result["errors"])
+    operations = sum(result["operations"] for result in results)
+    elapsed = max(result["elapsed"] for result in results)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processes": args.processes,
+            "iterations": args.iterations,
+        },
+        "results": {
+            "operations": operations,
+            "seconds": elapsed,
+            "operations_per_second": operations / elapsed if elapsed else None,
+            "errors": dict(errors),
+            "config_readable_after": readable,
+        },
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with args.output.open("w") as output:
+        dump(report, output, indent=2)
+
+    print(f"{operations} operations in {elapsed:.2f}s from {args.processes} processes")
+    for error, count in errors.most_common():
+        print(f"{count:6} x {error}")
+    if not errors:
+        print("No errors")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Micro-benchmark of validating timesheet payloads, one model at a time versus whole
+lists through a TypeAdapter, and full models versus the narrow projections.
+
+Payloads come from a cassette recorded with TTCLI_RECORD, or if none is given, from a
+year of responses shaped like the stand-ins in benchmarks.fakes produce.
+
+    python -m benchmarks.validation --cassette cassette.jsonl
+"""
+
+import platform
+import subprocess
+import sys
+from argparse import ArgumentParser
+from datetime import date, datetime, timedelta
+from json import dump, loads
+from pathlib import Path
+from typing import Optional
+
+from benchmarks import RESULTS_DIR
+from benchmarks.fakes import noa_entry, tripletex_entry
+from benchmarks.run import REPO_ROOT, measure
+
+NOA_WEEK_URL = "TimeEntryDailyRequest"
+TRIPLETEX_SEARCH_URL = "/timesheet/entry?"
+
+
+def recorded_payloads(cassette: Path) -> tuple[list[list[dict]], list[list[dict]]]:
+    """Noa weeks and TripleTex result pages found in a cassette"""
+    noa_weeks, tripletex_pages = [], []
+    with cassette.open() as interactions:
+        for line in interactions:
+            if not line.strip():
+                continue
+            interaction = loads(line)
+            if interaction["status"] != 200:
+                continue
+            if NOA_WEEK_URL in interaction["url"]:
+                rows = loads(interaction["body"])
+                noa_weeks.append([row for row in rows if "TaskId" in row])
+            elif TRIPLETEX_SEARCH_URL in interaction["url"]:
+                tripletex_pages.append(loads(interaction["body"])["values"])
+
+    return noa_weeks, tripletex_pages
+
+
+def generated_payloads(year: int) -> tuple[list[list[dict]], list[list[dict]]]:
+    monday = date.fromisocalendar(year, 1, 1)
+    noa_weeks = []
+    while monday.year <= year:
+        noa_weeks.append([noa_entry(monday + timedelta(days=i)) for i in range(7)])
+        monday += timedelta(weeks=1)
+
+    days = [date(year, 1, 1) + timedelta(days=i) for i in range(365)]
+    return noa_weeks, [[tripletex_entry(day) for day in days if day.weekday() < 5]]
+
+
+def bench_imports(repeat: int) -> dict:
+    return measure(
+        lambda: subprocess.run(
+            [sys.executable, "-c", "import ttcli.noa.types, ttcli.tripletex.types"],
+            check=True,
+            capture_output=True,
+            cwd=REPO_ROOT,
+        ),
+        repeat,
+    )
+
+
+def bench_noa(weeks: list[list[dict]], repeat: int) -> dict[str, dict]:
+    from ttcli.noa.types import NoaLoggedHours, NoaTimesheetEntry
+    from ttcli.utils import list_adapter
+
+    return {
+        "noa_per_model": measure(
+            lambda: [
+                [NoaTimesheetEntry.model_validate(row) for row in rows]
+                for rows in weeks
+            ],
+            repeat,
+        ),
+        "noa_list_adapter": measure(
+            lambda: [
+                list_adapter(NoaTimesheetEntry).validate_python(rows) for rows in weeks
+            ],
+            repeat,
+        ),
+        "noa_projection": measure(
+            lambda: [
+                list_adapter(NoaLoggedHours).validate_python(rows) for rows in weeks
+            ],
+            repeat,
+        ),
+    }
+
+
+def bench_tripletex(pages: list[list[dict]], repeat: int) -> dict[str, dict]:
+    from ttcli.tripletex.types import TimesheetEntry, TimesheetHours
+    from ttcli.utils import list_adapter
+
+    return {
+        "tripletex_per_model": measure(
+            lambda: [[TimesheetEntry(**data) for data in page] for page in pages],
+            repeat,
+        ),
+        "tripletex_list_adapter": measure(
+            lambda: [
+                list_adapter(TimesheetEntry).validate_python(page) for page in pages
+            ],
+            repeat,
+        ),
+        "tripletex_projection": measure(
+            lambda: [
+                list_adapter(TimesheetHours).validate_python(page) for page in pages
+            ],
+            repeat,
+        ),
+    }
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cassette", type=Path, help="Recorded with TTCLI_RECORD")
+    parser.add_argument("--year", type=int, default=date.today().year)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument(
+        "--output", type=Path, default=RESULTS_DIR / "validation-results.json"
+    )
+    args = parser.parse_args()
+
+    source: Optional[str] = str(args.cassette) if args.cassette else None
+    if args.cassette:
+        noa_weeks, tripletex_pages = recorded_payloads(args.cassette)
+    else:
+        noa_weeks, tripletex_pages = generated_payloads(args.year)
+
+    results: dict[str, dict] = {"import_types": bench_imports(args.repeat)}
+    if noa_weeks:
+        results |= bench_noa(noa_weeks, args.repeat)
+    if tripletex_pages:
+        results |= bench_tripletex(tripletex_pages, args.repeat)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cassette": source,
+            "noa_rows": sum(len(rows) for rows in noa_weeks),
+            "tripletex_rows": sum(len(page) for page in tripletex_pages),
+        },
+        "results": results,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with args.output.open("w") as output:
+        dump(report, output, indent=2)
+
+    for name, stats in results.items():
+        print(f"{name:32} {stats['median'] * 1000:10.2f} ms")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
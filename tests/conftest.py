@@ -0,0 +1,6 @@
+import os
+from tempfile import mkdtemp
+
+# Before anything from ttcli is imported, so the tests get a database of their own
+os.environ["XDG_CONFIG_HOME"] = mkdtemp(prefix="ttcli-tests-")
+os.environ.pop("TTCLI_CONFIG_PROFILE", None)
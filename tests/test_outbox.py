@@ -0,0 +1,38 @@
+from datetime import date
+
+from ttcli.ApiClient import ConfigurationException
+from ttcli.outbox import DELIVERED, FAILED, PENDING, enqueue, flush, read_items
+
+
+class FakeClient:
+    def __init__(self, error: BaseException | None = None):
+        self.error = error
+        self.written: list[date] = []
+
+    def refresh_session(self):
+        pass
+
+    def write_hours(self, hours: float, description: str, day: date):
+        if self.error is not None:
+            raise self.error
+        self.written.append(day)
+
+    def lock_day(self, day: date):
+        pass
+
+
+def test_flush_fails_writes_to_a_misconfigured_service():
+    day = date(2024, 3, 4)
+    enqueue("tripletex", day, 7.5, "Work", False)
+    enqueue("severa", day, 7.5, "Work", False)
+    severa = FakeClient()
+    tripletex = FakeClient(ConfigurationException("No activity configured"))
+
+    pending = flush(verbose=False, clients={"tripletex": tripletex, "severa": severa})
+
+    assert pending == 0
+    assert severa.written == [day]
+    items = {item.service: item for item in read_items([PENDING, FAILED, DELIVERED])}
+    assert items["tripletex"].state == FAILED
+    assert items["tripletex"].last_error == "No activity configured"
+    assert items["severa"].state == DELIVERED
@@ -1,19 +1,52 @@
 from abc import ABC, ABCMeta, abstractmethod
 from dataclasses import dataclass
 from datetime import date
+from functools import cache
 from time import time
-from typing import Any, Iterable, Optional, Type
+from typing import Any, Iterable, Optional, Type, TypeVar
 
 from requests import Session
 
+from ttcli import cassette, health, scheduler, timings
+from ttcli.services import configured_specs, service_spec, service_specs
+from ttcli.utils import Entry, TimeSpan, clear_instance_cache
+
 
 def cachebust():
     return time() * 1000
 
 
+T = TypeVar("T", bound="ApiClient")
+
+# Set by a long lived process (the agent) to reuse logged in clients across commands
+_warm_instances: Optional[dict[type, "ApiClient"]] = None
+
+
+def keep_instances_warm():
+    global _warm_instances
+    if _warm_instances is None:
+        _warm_instances = {}
+
+
+def warm_instances() -> list["ApiClient"]:
+    return list((_warm_instances or {}).values())
+
+
+def drop_warm_instances():
+    if _warm_instances is not None:
+        _warm_instances.clear()
+
+
 class ApiClient(ABC, metaclass=ABCMeta):
+    # The profile whose settings the client uses, None for the current one
+    profile: Optional[str] = None
+
     def __init__(self, client: Session = Session(), base_url: str = ""):
         self.client = client
+        timings.instrument(self.client)
+        cassette.install(self.client, self.name())
+        scheduler.install(self.client, self.name())
+        health.install(self.client, self.name(), self.profile)
         self.base_url = base_url.rstrip("/")
         super().__init__()
 
@@ -22,6 +55,26 @@ class ApiClient(ABC, metaclass=ABCMeta):
     def name(cls) -> str:
         return "Generic"
 
+    @classmethod
+    def instance(cls: Type[T]) -> T:
+        """A client to work with, which is a kept warm one if we're running as an agent.
+        :raises: ConfigurationException"""
+        if _warm_instances is None:
+            return cls()
+
+        if cls not in _warm_instances:
+            _warm_instances[cls] = cls()
+        return _warm_instances[cls]  # type: ignore
+
+    def refresh_session(self):
+        """Log in, or log in again if the session is about to expire.
+        Used to keep clients warm."""
+        pass
+
+    def reset_caches(self):
+        """Forget any cached data, so a kept warm client doesn't serve stale results"""
+        clear_instance_cache(self)
+
     def api_get(self, path: str, params: Optional[dict] = None) -> str:
         if params is None:
             params = {}
@@ -52,6 +105,11 @@ class ApiClient(ABC, metaclass=ABCMeta):
         """:raises: ConfigurationException"""
         pass
 
+    @abstractmethod
+    def get_entries(self, span: TimeSpan) -> list[Entry]:
+        """Everything logged between the first and last day of the span, inclusive"""
+        pass
+
     @abstractmethod
     def is_configured(self) -> bool:
         """Ensure that all configuration necessary for successful operation is present"""
@@ -65,18 +123,14 @@ class ConfigurationException(BaseException):
 
 
 def get_all_services() -> Iterable[Type[ApiClient]]:
-    from ttcli.noa.NoaWorkbook import NoaWorkbook
-    from ttcli.Severa import Severa
-    from ttcli.tripletex.TripleTex import TripleTex
-
-    return TripleTex, Severa, NoaWorkbook
+    return [spec.load_client() for spec in service_specs()]
 
 
 def get_configured_services_instances() -> Iterable[ApiClient]:
     services = []
-    for cls in get_all_services():
+    for spec in configured_specs():
         try:
-            services.append(cls())
+            services.append(spec.load_client().instance())
         except ConfigurationException:
             pass
 
@@ -84,10 +138,11 @@ def get_configured_services_instances() -> Iterable[ApiClient]:
 
 
 def get_configured_services() -> Iterable[Type[ApiClient]]:
-    services = get_configured_services_instances()
-    return [service.__class__ for service in services]
+    """The configured services, found from the config keys, without creating them"""
+    return [spec.load_client() for spec in configured_specs()]
 
 
+@cache
 def get_service_by_name(name: str) -> Type[ApiClient]:
-    lookup = {service.name(): service for service in get_all_services()}
-    return lookup[name]
+    """:raises: KeyError if there's no such service"""
+    return service_spec(name).load_client()
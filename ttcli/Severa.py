@@ -1,7 +1,7 @@
 from datetime import date, datetime, timedelta
 from functools import cached_property
 from json import load, loads
-from os import environ, getenv
+from os import getenv
 from pathlib import Path
 from typing import Dict, List, Optional
 
@@ -14,30 +14,51 @@ from dateutil.tz import tzutc
 from rich import print
 from rich.prompt import Prompt
 
+from ttcli import timings
 from ttcli.ApiClient import ApiClient, ConfigurationException, cachebust
-from ttcli.config.config import (
-    clear_service_config,
-    configure_command,
-    source_config,
-    write_config,
-)
+from ttcli.config.config import clear_service_config, configure_command, write_config
+from ttcli.config.settings import service_settings, source_config
+from ttcli.export import format_option, write_entries
 from ttcli.output import print
-from ttcli.utils import get_month_span, get_week_number
+from ttcli.reports import Summary, print_summary, resolve_span, span_options
+from ttcli.utils import (
+    Entry,
+    TimeSpan,
+    get_mondays,
+    get_month_span,
+    get_week_span,
+    instance_cache,
+    prefetch,
+)
 
 SEVERA_USERNAME_KEY = "SEVERA_USERNAME"
 SEVERA_PASSWORD_KEY = "SEVERA_PASSWORD"
 
+# Overridable so the client can be pointed at a staging or stand-in server
+SEVERA_URL_KEY = "TTCLI_SEVERA_URL"
+VISMA_CONNECT_URL_KEY = "TTCLI_VISMA_CONNECT_URL"
+SEVERA_TOKEN_CACHE_KEY = "TTCLI_SEVERA_TOKEN_CACHE"
+
 
 class Severa(ApiClient):
-    def __init__(self):
+    def __init__(self, profile: Optional[str] = None):
+        self.profile = profile
+        self.settings = service_settings(Severa, profile)
         self.raise_configuration_exception()
         self._token: Optional[dict] = None
         self.client = requests.session()
         api_version = "v0.1"
-        base_url = "https://severa.visma.com/psarest/{api_version}/".format(
-            api_version=api_version
+        self.severa_url = getenv(SEVERA_URL_KEY, "https://severa.visma.com").rstrip("/")
+        self.connect_url = getenv(
+            VISMA_CONNECT_URL_KEY, "https://connect.visma.com"
+        ).rstrip("/")
+        base_url = "{severa_url}/psarest/{api_version}/".format(
+            severa_url=self.severa_url, api_version=api_version
         )
-        self.cachepath = Path("/tmp/severauth")
+        cachepath = getenv(SEVERA_TOKEN_CACHE_KEY, "/tmp/severauth")
+        if profile is not None:
+            cachepath = f"{cachepath}-{profile}"
+        self.cachepath = Path(cachepath)
         super(Severa, self).__init__(client=self.client, base_url=base_url)
 
     @classmethod
@@ -45,19 +66,20 @@ class Severa(ApiClient):
         return "Severa"
 
     @cached_property
+    @timings.timed("Severa login")
     def login(self) -> dict:
         def fetch_fresh_access_token() -> dict:
             login_page = self.api_get(
                 "/authentication/ExternalLogin",
                 {
                     "provider": "VismaConnect",
-                    "redirect_uri": "https://severa.visma.com",
+                    "redirect_uri": self.severa_url,
                 },
             )
 
             login_soup = BeautifulSoup(login_page, "html5lib")
             login_response = self.client.post(
-                "https://connect.visma.com/password",
+                f"{self.connect_url}/password",
                 data=self.get_login_post_body(login_soup),
             )
 
@@ -100,8 +122,10 @@ class Severa(ApiClient):
         if not access_token_container:
             access_token_container = fetch_fresh_access_token()
 
-        self.client.headers["authorization"] = "bearer " + self.login["accessToken"]
-        self.client.headers["referer"] = "https://severa.visma.com/"
+        self.client.headers["authorization"] = (
+            "bearer " + access_token_container["accessToken"]
+        )
+        self.client.headers["referer"] = f"{self.severa_url}/"
 
         return access_token_container
 
@@ -111,8 +135,8 @@ class Severa(ApiClient):
         )["value"]
         return_url = login_soup.find("input", attrs={"name": "ReturnUrl"})["value"]
         postbody = {
-            "Username": getenv(SEVERA_USERNAME_KEY),
-            "Password": getenv(SEVERA_PASSWORD_KEY),
+            "Username": self.settings.get(SEVERA_USERNAME_KEY),
+            "Password": self.settings.get(SEVERA_PASSWORD_KEY),
             "RememberUsername": False,
             "IsPlatformAuthenticatorAvailable": True,
             "ClientId": "severa",
@@ -194,22 +218,73 @@ class Severa(ApiClient):
         return loads(result)
 
     def raise_configuration_exception(self):
-        if SEVERA_USERNAME_KEY not in environ:
+        if SEVERA_USERNAME_KEY not in self.settings:
             raise ConfigurationException(
                 message="Missing username", missing_key=SEVERA_USERNAME_KEY
             )
-        elif SEVERA_PASSWORD_KEY not in environ:
+        elif SEVERA_PASSWORD_KEY not in self.settings:
             raise ConfigurationException(
                 message="Missing password", missing_key=SEVERA_PASSWORD_KEY
             )
 
     def is_configured(self) -> bool:
-        return all(k in environ for k in (SEVERA_USERNAME_KEY, SEVERA_PASSWORD_KEY))
+        return all(
+            k in self.settings for k in (SEVERA_USERNAME_KEY, SEVERA_PASSWORD_KEY)
+        )
+
+    def refresh_session(self):
+        token = self.__dict__.get("login")
+        if token is None:
+            self.login
+            return
+
+        expires_in = parse(token["expiresUtc"]) - datetime.now(tz=tzutc())
+        if expires_in < timedelta(minutes=5):
+            self.cachepath.unlink(missing_ok=True)
+            del self.__dict__["login"]
+            self.login
+
+    def get_logged_between(self, span: TimeSpan) -> list[dict]:
+        page_size = 100
+        entries: list[dict] = []
+        while True:
+            page = loads(
+                self.api_get(
+                    self.user_endpoint("/workhours"),
+                    params={
+                        "firstRow": len(entries),
+                        "rowCount": page_size,
+                        "calculateRowCount": False,
+                        "startDate": datetime.combine(
+                            span.start_date, datetime.min.time()
+                        ).isoformat(),
+                        "endDate": datetime.combine(
+                            span.end_date, datetime.min.time()
+                        ).isoformat(),
+                    },
+                )
+            )
+            entries.extend(page)
+            if len(page) < page_size:
+                return entries
+
+    def get_entries(self, span: TimeSpan) -> list[Entry]:
+        return [
+            Entry(
+                service=self.name(),
+                day=date.fromisoformat(entry["eventDate"][:10]),
+                hours=float(entry["quantity"]),
+                description=entry.get("description") or "",
+                project=(entry.get("project") or entry.get("phase") or {}).get("name"),
+            )
+            for entry in self.get_logged_between(span)
+        ]
 
-    def get_logged_during_week(self, week: int):
-        year = date.today().year
-        starting_datetime = datetime.strptime(f"{year}-W{week}-1", "%Y-W%W-%w")
-        ending_datetime = starting_datetime + timedelta(days=6)
+    @instance_cache
+    def get_logged_during_week(self, week: int, year: Optional[int] = None):
+        span = get_week_span(week, year)
+        starting_datetime = datetime.combine(span.start_date, datetime.min.time())
+        ending_datetime = datetime.combine(span.end_date, datetime.min.time())
 
         return loads(
             self.api_get(
@@ -233,11 +308,13 @@ def severa_command():
     pass
 
 
-def timesheet(week: int, client: Optional[Severa]) -> List[Dict]:
+def timesheet(
+    week: int, client: Optional[Severa], year: Optional[int] = None
+) -> List[Dict]:
     if not client:
-        client = Severa()
+        client = Severa.instance()
 
-    result: List[Dict] = client.get_logged_during_week(week)
+    result: List[Dict] = list(client.get_logged_during_week(week, year))
     result.sort(key=lambda entry: entry.get("eventDate"))  # type: ignore
     for entry in result:
         hours = entry["quantity"]
@@ -258,24 +335,49 @@ def timesheet(week: int, client: Optional[Severa]) -> List[Dict]:
 
 @severa_command.command(name="timesheet")
 @click.argument("week", type=int, default=datetime.today().isocalendar()[1])
-def timesheet_week(week: int):
-    timesheet(week, Severa())
+@click.option("-y", "--year", type=int, help="Defaults to this year")
+@format_option
+def timesheet_week(week: int, year: Optional[int], output_format: str):
+    if output_format != "text":
+        span = get_week_span(week, year)
+        write_entries(Severa.instance().get_entries(span), output_format)
+        return
+
+    timesheet(week, Severa.instance(), year)
 
 
 @severa_command.command()
 @click.argument("month", type=int, default=datetime.today().month)
+@click.option("-y", "--year", type=int, help="Defaults to this year")
 @click.option("--include-future/--no-include-future", default=False)
-def timesheet_month(month: int, include_future: bool):
-    client = Severa()
-    first_day, last_day = get_month_span(month, include_future=include_future)
+@format_option
+def timesheet_month(
+    month: int, year: Optional[int], include_future: bool, output_format: str
+):
+    client = Severa.instance()
+    span = get_month_span(month, include_future=include_future, year=year)
+    if output_format != "text":
+        write_entries(client.get_entries(span), output_format)
+        return
+
+    first_day = span.start_date
+    weeks_of_month = [monday.isocalendar() for monday in get_mondays(span)]
+
+    # Log in first, so the prefetching threads share one session
+    client.refresh_session()
+    prefetch(
+        lambda w: client.get_logged_during_week(w.week, w.year),
+        weeks_of_month,
+        client.name(),
+    )
 
     weeks = []
 
-    for week in range(get_week_number(first_day), get_week_number(last_day) + 1):
+    for iso_week in weeks_of_month:
         result = list(
             filter(
                 lambda entry: date.fromisoformat(entry["eventDate"]).month == month,
-                timesheet(week, client),
+                timesheet(iso_week.week, client, iso_week.year),
             )
         )
         if len(result):
@@ -294,6 +396,20 @@ def timesheet_month(month: int, include_future: bool):
     print(f"[green]Total {first_day.strftime('%b')}:[/green] {month_total}")
 
 
+@severa_command.command()
+@span_options
+def summary(
+    year: Optional[int],
+    from_date: Optional[datetime],
+    to_date: Optional[datetime],
+    include_future: bool,
+):
+    """Totals per week, month and project, for a year or --from/--to"""
+    client = Severa.instance()
+    span = resolve_span(year, from_date, to_date, include_future)
+    print_summary(client.name(), Summary.of(span, client.get_entries(span)))
+
+
 def _configure():
     print("[yellow]Please fill in your Severa credentials[/yellow]")
     username = Prompt.ask("Username")
@@ -0,0 +1,365 @@
+"""A long lived process that keeps service clients logged in, and runs commands for
+the cli over a unix socket.
+
+The forwarding side (`forward`) is used by the console scripts before anything heavy
+is imported, so this module only imports from the standard library at the top.
+Commands that prompt for input are never forwarded, and if no agent answers the cli
+simply runs the command itself. Forwarded commands run with the caller's environment,
+with the stored config and .env read again on top of it, the way they would have run
+in the caller's own process.
+
+The socket is only used in a directory that belongs to us and nobody else can get
+into, so another user can't put a socket of their own where we'd look for the agent.
+"""
+
+import json
+import os
+import socket
+import stat
+import sys
+import tempfile
+from pathlib import Path
+from typing import IO, Any, Optional, cast
+
+NO_AGENT_KEY = "TTCLI_NO_AGENT"
+AGENT_SOCKET_KEY = "TTCLI_AGENT_SOCKET"
+# The same as ttcli.config.reader.PROFILE_KEY and ttcli.profiling.PROFILER_KEY, this
+# module only imports the stdlib
+CONFIG_PROFILE_KEY = "TTCLI_CONFIG_PROFILE"
+PROFILER_KEY = "TTCLI_PROFILER"
+
+# Non-interactive commands, by top level command, that the agent may run for us.
+# None means every subcommand is fine.
+FORWARDABLE: dict[str, Optional[set[str]]] = {
+    "list": None,
+    "write-to-all": None,
+    "write-to-all-csv": None,
+    "queue": None,
+    "timesheet": None,
+    "reconcile": None,
+    "tripletex": {"find", "hours", "index", "timesheet", "timesheet-month"},
+    "severa": {"timesheet", "timesheet-month"},
+    # Not report, which renders in worker processes that can't be forked safely from
+    # the agent's threads
+    "noa": {"hours", "timesheet", "timesheet-month"},
+}
+# Options that are about the calling process, so they must run locally. The agent's
+# clients are logged in with the default profile, so other profiles run locally too.
+LOCAL_ONLY_OPTIONS = {"--timings", "--timings-json", "--profile"}
+REFRESH_INTERVAL = 60
+# Environment variables, besides services' required keys, that decide how clients are
+# set up, so the warm ones are dropped when a command comes with other values
+CLIENT_KEY_PREFIXES = ("TT_", "TTCLI_", "SEVERA_", "NOA_")
+
+
+def socket_path() -> Path:
+    if path := os.environ.get(AGENT_SOCKET_KEY):
+        return Path(path)
+
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        directory = Path(runtime_dir) / "tt-cli"
+    else:
+        directory = Path(tempfile.gettempdir()) / f"tt-cli-{os.getuid()}"
+    return directory / "agent.sock"
+
+
+def is_private(directory: Path) -> bool:
+    """Whether the directory is ours, and nobody else can get into it"""
+    try:
+        info = os.lstat(directory)
+    except OSError:
+        return False
+    return (
+        stat.S_ISDIR(info.st_mode)
+        and info.st_uid == os.getuid()
+        and not info.st_mode & (stat.S_IRWXG | stat.S_IRWXO)
+    )
+
+
+def is_our_socket(path: Path) -> bool:
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return False
+    return (
+        stat.S_ISSOCK(info.st_mode)
+        and info.st_uid == os.getuid()
+        and is_private(path.parent)
+    )
+
+
+def make_socket_dir(path: Path):
+    """Create the directory for the socket, if it isn't there already.
+
+    :raises: click.ClickException if the directory isn't private to us
+    """
+    import click
+
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    if not is_private(path.parent):
+        raise click.ClickException(
+            f"{path.parent} must belong to you and have no group or other permissions"
+        )
+
+
+def is_forwardable(prog: str, args: list[str]) -> bool:
+    if any(
+        os.environ.get(key) for key in (NO_AGENT_KEY, PROFILER_KEY, CONFIG_PROFILE_KEY)
+    ):
+        return False
+    if any(arg.split("=")[0] in LOCAL_ONLY_OPTIONS for arg in args):
+        return False
+    if prog == "tt-a":
+        return True
+
+    commands = [arg for arg in args[:2] if not arg.startswith("-")]
+    if not commands or args[0].startswith("-") or commands[0] not in FORWARDABLE:
+        return False
+
+    subcommands = FORWARDABLE[commands[0]]
+    return subcommands is None or (len(commands) > 1 and commands[1] in subcommands)
+
+
+def _send(connection: socket.socket, message: dict):
+    connection.sendall(json.dumps(message).encode() + b"\n")
+
+
+def forward(prog: str, args: list[str]) -> Optional[int]:
+    """Run the command in the agent, returning its exit code.
+    None means there was no agent to run it, and the caller should run it itself."""
+    if not hasattr(socket, "AF_UNIX") or not is_forwardable(prog, args):
+        return None
+
+    path = socket_path()
+    if not is_our_socket(path):
+        return None
+
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(str(path))
+        terminal = sys.stdout.isatty()
+        _send(
+            connection,
+            {
+                "prog": prog,
+                "args": args,
+                "cwd": os.getcwd(),
+                "environ": dict(os.environ),
+                "color": terminal and "NO_COLOR" not in os.environ,
+                "width": os.get_terminal_size().columns if terminal else None,
+            },
+        )
+    except OSError:
+        connection.close()
+        return None
+
+    started = False
+    with connection, connection.makefile("r") as replies:
+        for line in replies:
+            reply = json.loads(line)
+            started = True
+            if "out" in reply:
+                sys.stdout.write(reply["out"])
+                sys.stdout.flush()
+            elif "err" in reply:
+                sys.stderr.write(reply["err"])
+                sys.stderr.flush()
+            elif "exit" in reply:
+                return reply["exit"]
+
+    if not started:
+        return None
+
+    print("Lost connection to the tt-cli agent", file=sys.stderr)
+    return 1
+
+
+class _StreamWriter:
+    """A text file that sends everything written to it back to the cli"""
+
+    def __init__(self, connection: socket.socket, stream: str, tty: bool):
+        self.connection = connection
+        self.stream = stream
+        self.tty = tty
+
+    def write(self, text: str) -> int:
+        if text:
+            _send(self.connection, {self.stream: text})
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self) -> bool:
+        return self.tty
+
+
+class Agent:
+    def __init__(self):
+        from threading import Lock
+
+        self.lock = Lock()
+        self._config_fingerprint: Optional[str] = None
+        self._environ = dict(os.environ)
+
+    def load_environment(self, environ: dict[str, str]):
+        """Set up the environment a command would have had in the calling process:
+        its environment, then the stored config and .env, read again so changes made
+        by other processes since last time are picked up"""
+        from ttcli.ApiClient import drop_warm_instances
+        from ttcli.config.settings import load_environment
+        from ttcli.services import service_specs
+
+        os.environ.clear()
+        os.environ.update(environ)
+        load_environment.cache_clear()
+        load_environment()
+
+        keys = {key for spec in service_specs() for key in spec.required_keys}
+        # Session tokens are rewritten on every tripletex login, they don't count
+        fingerprint = json.dumps(
+            sorted(
+                (key, value)
+                for key, value in os.environ.items()
+                if (key in keys or key.startswith(CLIENT_KEY_PREFIXES))
+                and key != "SESSION_TOKEN"
+            )
+        )
+        if fingerprint != self._config_fingerprint:
+            drop_warm_instances()
+        self._config_fingerprint = fingerprint
+
+    def run(self, request: dict[str, Any], connection: socket.socket) -> int:
+        from contextlib import redirect_stderr, redirect_stdout
+        from traceback import format_exc
+
+        from rich.console import Console
+
+        from ttcli import timings
+        from ttcli.ApiClient import warm_instances
+        from ttcli.main import cli, write_to_all_cmd
+        from ttcli.output import print as printer
+
+        command = write_to_all_cmd if request["prog"] == "tt-a" else cli
+        # Stand-ins for text files, as far as anything printing is concerned
+        stdout = cast(IO[str], _StreamWriter(connection, "out", request["color"]))
+        stderr = cast(IO[str], _StreamWriter(connection, "err", request["color"]))
+
+        with self.lock, redirect_stdout(stdout), redirect_stderr(stderr):
+            previous_console, previous_cwd = printer.console, os.getcwd()
+            printer.console = Console(
+                file=stdout,
+                force_terminal=request["color"],
+                width=request["width"],
+                highlight=False,
+            )
+            timings.recorder.spans.clear()
+            try:
+                os.chdir(request["cwd"])
+                self.load_environment(request.get("environ", self._environ))
+                for client in warm_instances():
+                    client.reset_caches()
+
+                command.main(
+                    args=request["args"],
+                    prog_name=request["prog"],
+                    standalone_mode=True,
+                )
+                return 0
+            except SystemExit as e:
+                return e.code if isinstance(e.code, int) else int(e.code is not None)
+            except Exception:
+                stderr.write(format_exc())
+                return 1
+            finally:
+                printer.console = previous_console
+                os.chdir(previous_cwd)
+
+    def refresh_sessions(self):
+        from ttcli.ApiClient import drop_warm_instances, warm_instances
+
+        with self.lock:
+            try:
+                for client in warm_instances():
+                    client.refresh_session()
+            except Exception as e:
+                print(
+                    f"Refreshing sessions failed, dropping clients: {e}",
+                    file=sys.stderr,
+                )
+                drop_warm_instances()
+
+    def serve(self, path: Path):
+        from socketserver import StreamRequestHandler, ThreadingUnixStreamServer
+        from threading import Event, Thread
+
+        from ttcli.ApiClient import (
+            get_configured_services_instances,
+            keep_instances_warm,
+        )
+
+        agent = self
+        stopped = Event()
+
+        class Handler(StreamRequestHandler):
+            def handle(self):
+                request = json.loads(self.rfile.readline())
+                if request.get("command") == "stop":
+                    _send(self.connection, {"exit": 0})
+                    stopped.set()
+                    Thread(target=server.shutdown).start()
+                    return
+                if request.get("command") == "status":
+                    _send(
+                        self.connection, {"out": f"Agent running, pid {os.getpid()}\n"}
+                    )
+                    _send(self.connection, {"exit": 0})
+                    return
+
+                _send(self.connection, {"exit": agent.run(request, self.connection)})
+
+        def refresh_periodically():
+            while not stopped.wait(REFRESH_INTERVAL):
+                self.refresh_sessions()
+
+        keep_instances_warm()
+        self.load_environment(self._environ)
+        # Log in up front, so the first forwarded command is warm as well
+        for client in get_configured_services_instances():
+            try:
+                client.refresh_session()
+            except Exception as e:
+                print(f"Warming up {client.name()} failed: {e}", file=sys.stderr)
+
+        make_socket_dir(path)
+        path.unlink(missing_ok=True)
+        server = ThreadingUnixStreamServer(str(path), Handler)
+        server.daemon_threads = True
+        os.chmod(path, 0o600)
+        Thread(target=refresh_periodically, daemon=True).start()
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            path.unlink(missing_ok=True)
+
+
+def control(command: str, out: IO[str] = sys.stdout) -> bool:
+    """Send a control command (status, stop) to a running agent"""
+    path = socket_path()
+    if not is_our_socket(path):
+        return False
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.connect(str(path))
+            _send(connection, {"command": command})
+            for line in connection.makefile("r"):
+                reply = json.loads(line)
+                if "out" in reply:
+                    out.write(reply["out"])
+    except OSError:
+        return False
+
+    return True
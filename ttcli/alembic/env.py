@@ -1,8 +1,10 @@
 from alembic import context
-from sqlalchemy import engine_from_config, pool
+from sqlalchemy import engine_from_config, event, pool
 
-from ttcli.config.config import mapper_registry
-from ttcli.db import get_db_location
+from ttcli.config.models import mapper_registry
+from ttcli.config.reader import BUSY_TIMEOUT
+from ttcli.db import set_sqlite_pragmas
+from ttcli.migrations import get_db_location
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -58,7 +60,9 @@ def run_migrations_online() -> None:
         configuration,  # type: ignore
         prefix="sqlalchemy.",
         poolclass=pool.NullPool,
+        connect_args={"timeout": BUSY_TIMEOUT},
     )
+    event.listen(connectable, "connect", set_sqlite_pragmas)
 
     with connectable.connect() as connection:  # type: ignore
         context.configure(connection=connection, target_metadata=target_metadata)
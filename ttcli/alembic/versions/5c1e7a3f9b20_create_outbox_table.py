@@ -0,0 +1,43 @@
+"""Create outbox table
+
+Revision ID: 5c1e7a3f9b20
+Revises: 142f6d9e1bc6
+Create Date: 2026-10-18 22:40:12.118204
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5c1e7a3f9b20"
+down_revision = "142f6d9e1bc6"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "outbox",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("service", sa.String(length=50), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("hours", sa.Float(), nullable=False),
+        sa.Column("description", sa.Text(), nullable=False),
+        sa.Column("lock", sa.Boolean(), nullable=False),
+        sa.Column("state", sa.String(length=16), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("next_attempt_at", sa.DateTime(), nullable=False),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_outbox_state_service_day", "outbox", ["state", "service", "day"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_outbox_state_service_day", table_name="outbox")
+    op.drop_table("outbox")
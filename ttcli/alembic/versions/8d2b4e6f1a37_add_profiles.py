@@ -0,0 +1,64 @@
+"""Add profiles to config and outbox
+
+Revision ID: 8d2b4e6f1a37
+Revises: 5c1e7a3f9b20
+Create Date: 2026-10-18 23:55:41.506118
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy_utils.types import StringEncryptedType
+
+# revision identifiers, used by Alembic.
+revision = "8d2b4e6f1a37"
+down_revision = "5c1e7a3f9b20"
+branch_labels = None
+depends_on = None
+
+# The table as it was, instead of reflecting it, so the primary key can be replaced
+# rather than added to
+config_before = sa.Table(
+    "config",
+    sa.MetaData(),
+    sa.Column("service", sa.String(length=50), nullable=False),
+    sa.Column("config", StringEncryptedType(), nullable=False),
+)
+
+
+def upgrade() -> None:
+    # Existing rows become the default profile. The primary key changes, which sqlite
+    # can only do by recreating the table.
+    with op.batch_alter_table(
+        "config", recreate="always", copy_from=config_before
+    ) as batch_op:
+        batch_op.add_column(
+            sa.Column(
+                "profile",
+                sa.String(length=50),
+                nullable=False,
+                server_default="default",
+            )
+        )
+        batch_op.create_primary_key("pk_config", ["profile", "service"])
+
+    with op.batch_alter_table("outbox") as batch_op:
+        batch_op.add_column(
+            sa.Column(
+                "profile",
+                sa.String(length=50),
+                nullable=False,
+                server_default="default",
+            )
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("outbox") as batch_op:
+        batch_op.drop_column("profile")
+
+    op.execute("DELETE FROM config WHERE profile != 'default'")
+    with op.batch_alter_table("config", recreate="always") as batch_op:
+        batch_op.drop_constraint("pk_config", type_="primary")
+        batch_op.drop_column("profile")
+        batch_op.create_primary_key("pk_config", ["service"])
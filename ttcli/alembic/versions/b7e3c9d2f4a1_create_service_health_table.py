@@ -0,0 +1,32 @@
+"""Create service health table
+
+Revision ID: b7e3c9d2f4a1
+Revises: 8d2b4e6f1a37
+Create Date: 2026-10-19 00:41:08.271934
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b7e3c9d2f4a1"
+down_revision = "8d2b4e6f1a37"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "service_health",
+        sa.Column("service", sa.String(length=50), nullable=False),
+        sa.Column("state", sa.String(length=16), nullable=False),
+        sa.Column("failures", sa.Integer(), nullable=False),
+        sa.Column("open_until", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("service"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("service_health")
@@ -0,0 +1,52 @@
+"""Add profiles to service health
+
+Revision ID: e41a6c8d0b57
+Revises: b7e3c9d2f4a1
+Create Date: 2026-10-19 00:12:37.604219
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e41a6c8d0b57"
+down_revision = "b7e3c9d2f4a1"
+branch_labels = None
+depends_on = None
+
+# The table as it was, instead of reflecting it, so the primary key can be replaced
+# rather than added to
+service_health_before = sa.Table(
+    "service_health",
+    sa.MetaData(),
+    sa.Column("service", sa.String(length=50), nullable=False),
+    sa.Column("state", sa.String(length=16), nullable=False),
+    sa.Column("failures", sa.Integer(), nullable=False),
+    sa.Column("open_until", sa.DateTime(), nullable=True),
+    sa.Column("updated_at", sa.DateTime(), nullable=False),
+)
+
+
+def upgrade() -> None:
+    # Existing rows become the default profile's
+    with op.batch_alter_table(
+        "service_health", recreate="always", copy_from=service_health_before
+    ) as batch_op:
+        batch_op.add_column(
+            sa.Column(
+                "profile",
+                sa.String(length=50),
+                nullable=False,
+                server_default="default",
+            )
+        )
+        batch_op.create_primary_key("pk_service_health", ["profile", "service"])
+
+
+def downgrade() -> None:
+    op.execute("DELETE FROM service_health WHERE profile != 'default'")
+    with op.batch_alter_table("service_health", recreate="always") as batch_op:
+        batch_op.drop_constraint("pk_service_health", type_="primary")
+        batch_op.drop_column("profile")
+        batch_op.create_primary_key("pk_service_health", ["service"])
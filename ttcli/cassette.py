@@ -0,0 +1,201 @@
+"""Record http traffic to a cassette file and replay it later, without the network.
+
+Set TTCLI_RECORD=<file> to append every request/response pair the service clients make
+to a cassette, and TTCLI_REPLAY=<file> to serve responses from one instead of talking
+to the services. By default replayed responses take as long as they originally did,
+TTCLI_REPLAY_LATENCY=zero serves them immediately.
+
+Cassettes are json lines, one interaction per line. Credentials, tokens and session
+identifiers are scrubbed from urls and response bodies before anything is written,
+and only the content type header is kept.
+"""
+
+import re
+from collections import defaultdict, deque
+from datetime import timedelta
+from functools import cache
+from json import JSONDecodeError, dumps, loads
+from os import getenv
+from threading import Lock
+from time import perf_counter, sleep
+from typing import Any, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from requests import PreparedRequest, Response, Session
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.exceptions import ConnectionError
+from requests.structures import CaseInsensitiveDict
+
+RECORD_KEY = "TTCLI_RECORD"
+REPLAY_KEY = "TTCLI_REPLAY"
+REPLAY_LATENCY_KEY = "TTCLI_REPLAY_LATENCY"
+
+REDACTED = "REDACTED"
+# Compared case insensitively, against query parameters, json keys and form inputs
+SENSITIVE_NAMES = {
+    "accesstoken",
+    "code",
+    "consumertoken",
+    "employeetoken",
+    "encryptionkey",
+    "id_token",
+    "password",
+    "refreshtoken",
+    "session_state",
+    "token",
+    "__requestverificationtoken",
+}
+# Cache busters and the like, which would stop requests from ever matching
+VOLATILE_PARAMS = {"_"}
+
+_INPUT_TAG = re.compile(r"<input\b[^>]*>", re.IGNORECASE)
+_INPUT_NAME = re.compile(r'name="([^"]*)"', re.IGNORECASE)
+_INPUT_VALUE = re.compile(r'(value=")[^"]*(")', re.IGNORECASE)
+
+
+def is_sensitive(name: str) -> bool:
+    return name.lower() in SENSITIVE_NAMES
+
+
+def scrub_url(url: str) -> str:
+    parts = urlsplit(url)
+    query = sorted(
+        (k, REDACTED if is_sensitive(k) else v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k not in VOLATILE_PARAMS
+    )
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+
+def scrub_json(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {
+            k: REDACTED if is_sensitive(k) and isinstance(v, str) else scrub_json(v)
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [scrub_json(v) for v in value]
+    return value
+
+
+def scrub_html(body: str) -> str:
+    def scrub_input(tag: re.Match) -> str:
+        name = _INPUT_NAME.search(tag[0])
+        if name and is_sensitive(name[1]):
+            return _INPUT_VALUE.sub(rf"\g<1>{REDACTED}\g<2>", tag[0])
+        return tag[0]
+
+    return _INPUT_TAG.sub(scrub_input, body)
+
+
+def scrub_body(body: str) -> str:
+    try:
+        return dumps(scrub_json(loads(body)), separators=(",", ":"))
+    except (JSONDecodeError, ValueError):
+        return scrub_html(body)
+
+
+class RecordingAdapter(HTTPAdapter):
+    """Sends requests as usual, appending every exchange to a cassette"""
+
+    _lock = Lock()
+
+    def __init__(self, path: str, service: str):
+        self.path = path
+        self.service = service
+        super().__init__()
+
+    def send(self, request: PreparedRequest, *args, **kwargs) -> Response:
+        start = perf_counter()
+        response = super().send(request, *args, **kwargs)
+        elapsed = perf_counter() - start
+        interaction = {
+            "service": self.service,
+            "method": request.method,
+            "url": scrub_url(request.url or ""),
+            "status": response.status_code,
+            "content_type": response.headers.get("content-type"),
+            "elapsed": round(elapsed, 4),
+            "body": scrub_body(response.text),
+        }
+        with self._lock, open(self.path, "a") as cassette:
+            cassette.write(dumps(interaction, separators=(",", ":")) + "\n")
+
+        return response
+
+
+class Cassette:
+    def __init__(self, path: str):
+        self.interactions: dict[tuple[str, str], deque[dict]] = defaultdict(deque)
+        self.last: dict[tuple[str, str], dict] = {}
+        self._lock = Lock()
+        with open(path) as cassette:
+            for line in cassette:
+                if line.strip():
+                    interaction = loads(line)
+                    key = (interaction["method"], interaction["url"])
+                    self.interactions[key].append(interaction)
+
+    def next(self, method: str, url: str) -> Optional[dict]:
+        """Recorded responses are served in order, the last one repeating forever"""
+        key = (method, scrub_url(url))
+        with self._lock:
+            if self.interactions[key]:
+                self.last[key] = self.interactions[key].popleft()
+            return self.last.get(key)
+
+
+@cache
+def load_cassette(path: str) -> Cassette:
+    return Cassette(path)
+
+
+class ReplayAdapter(BaseAdapter):
+    """Serves responses from a cassette, never touching the network"""
+
+    def __init__(self, path: str, zero_latency: bool = False):
+        self.cassette = load_cassette(path)
+        self.zero_latency = zero_latency
+        super().__init__()
+
+    def send(self, request: PreparedRequest, *args, **kwargs) -> Response:
+        method, url = request.method or "GET", request.url or ""
+        interaction = self.cassette.next(method, url)
+        if interaction is None:
+            raise ConnectionError(
+                f"No recorded response for {method} {scrub_url(url)}", request=request
+            )
+
+        if not self.zero_latency:
+            sleep(interaction["elapsed"])
+
+        response = Response()
+        response.status_code = interaction["status"]
+        response.headers = CaseInsensitiveDict(
+            {"content-type": interaction["content_type"] or "application/json"}
+        )
+        response._content = interaction["body"].encode()
+        response.encoding = "utf-8"
+        response.url = url
+        response.request = request
+        response.elapsed = timedelta(seconds=interaction["elapsed"])
+        return response
+
+    def close(self):
+        pass
+
+
+def install(session: Session, service: str):
+    """Mount a recording or replaying adapter on the session, if asked to"""
+    adapter: Optional[BaseAdapter] = None
+    if path := getenv(REPLAY_KEY):
+        zero_latency = getenv(REPLAY_LATENCY_KEY, "original").lower() == "zero"
+        adapter = ReplayAdapter(path, zero_latency=zero_latency)
+    elif path := getenv(RECORD_KEY):
+        adapter = RecordingAdapter(path, service)
+
+    if adapter is None or isinstance(session.get_adapter("https://"), type(adapter)):
+        return
+
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
@@ -0,0 +1,401 @@
+"""Shell completion, answered from a precomputed file.
+
+Click completes by importing the whole cli and resolving the command line against it,
+which on every tab press takes as long as starting any command. Instead the console
+scripts check for click's completion variables, _TT_CLI_COMPLETE and _TT_A_COMPLETE,
+before importing anything else, and answer from a json file with every command,
+option and argument, and the values they complete to. The answers follow click's
+bash, zsh and fish protocols, so the scripts printed by
+`_TT_CLI_COMPLETE=bash_source tt-cli` work as they are.
+
+The file is rebuilt, by importing the cli the usual way, whenever it's missing or
+stale: when the stored config changed, when service keys were set or unset in the
+environment, or when a watched file changed, like the modules the commands are in or
+the Tripletex activity index.
+Serving from it only imports the standard library.
+"""
+
+import hashlib
+import json
+import os
+import shlex
+import sqlite3
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Iterable, Optional
+
+if TYPE_CHECKING:
+    import click
+
+CACHE_VERSION = 1
+# The same as ttcli.config.reader.PROFILE_KEY, that module isn't imported here
+PROFILE_KEY = "TTCLI_CONFIG_PROFILE"
+
+# A completion as [value, type, help], with the types click uses: plain, file and dir
+Item = list
+
+
+def complete_var(prog: str) -> str:
+    return f"_{prog}_COMPLETE".replace("-", "_").upper()
+
+
+def cache_dir() -> Path:
+    from appdirs import user_cache_dir
+
+    return Path(user_cache_dir(appname="tt-cli", appauthor="brbcoffee"))
+
+
+def cache_file() -> Path:
+    return cache_dir() / "completion.json"
+
+
+def config_db_file() -> Path:
+    from appdirs import user_config_dir
+
+    # Like ttcli.config.reader.config_db_file
+    location = user_config_dir(appname="tt-cli", appauthor="brbcoffee")
+    return Path(location) / "config.sqlite"
+
+
+def config_digest() -> Optional[str]:
+    """A digest of the stored config, still encrypted, so it changes when the config
+    does, but not when the outbox or anything else in the database does"""
+    path = config_db_file()
+    if not path.exists():
+        return None
+
+    try:
+        connection = sqlite3.connect(path, timeout=1.0)
+    except sqlite3.Error:
+        return None
+    try:
+        rows = connection.execute(
+            "SELECT profile, service, config FROM config ORDER BY profile, service"
+        ).fetchall()
+    except sqlite3.Error:
+        return None
+    finally:
+        connection.close()
+    return hashlib.sha256(json.dumps(rows).encode()).hexdigest()
+
+
+def modified(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def stamp(environ_keys: Iterable[str], files: Iterable[str]) -> dict[str, Any]:
+    """What the completions depend on, to tell whether the file is stale"""
+    return {
+        "version": CACHE_VERSION,
+        "config": config_digest(),
+        "profile": os.environ.get(PROFILE_KEY),
+        "environ": sorted(key for key in environ_keys if key in os.environ),
+        "files": {path: modified(path) for path in files},
+    }
+
+
+def read_cache() -> Optional[dict[str, Any]]:
+    """The precomputed completions, or None if there are none or they're stale"""
+    try:
+        cache = json.loads(cache_file().read_text())
+    except (OSError, ValueError):
+        return None
+
+    if cache.get("stamp", {}).get("version") != CACHE_VERSION:
+        return None
+    current = stamp(cache["environ_keys"], cache["stamp"]["files"])
+    return cache if current == cache["stamp"] else None
+
+
+def split_arg_string(string: str) -> list[str]:
+    """Like click's, shlex but keeping an unfinished last word as it is"""
+    lex = shlex.shlex(string, posix=True)
+    lex.whitespace_split = True
+    lex.commenters = ""
+    out: list[str] = []
+    try:
+        out.extend(lex)
+    except ValueError:
+        out.append(lex.token)
+    return out
+
+
+def completion_args(shell: str) -> tuple[list[str], str]:
+    """The complete words and the word being completed, from the variables the
+    completion scripts set"""
+    words = split_arg_string(os.environ["COMP_WORDS"])
+    if shell == "fish":
+        incomplete = os.environ["COMP_CWORD"]
+        if incomplete:
+            incomplete = split_arg_string(incomplete)[0]
+        args = words[1:]
+        # Fish has the partial word in both
+        if incomplete and args and args[-1] == incomplete:
+            args.pop()
+        return args, incomplete
+
+    cword = int(os.environ["COMP_CWORD"])
+    return words[1:cword], words[cword] if cword < len(words) else ""
+
+
+def find_option(node: dict, name: str) -> Optional[dict]:
+    for option in node["options"]:
+        if name in option["opts"] or name in option["secondary"]:
+            return option
+    return None
+
+
+def resolve(tree: dict, args: list[str]) -> tuple[dict, set[str], Optional[dict], int]:
+    """Follow the complete words down the command tree, the way click parses them.
+    Returns the command, the options already given, an option still waiting for its
+    value if any, and how many argument values were given."""
+    node, used, pending, waiting, positional = tree, set(), None, 0, 0
+    options_done = False
+    for arg in args:
+        if pending is not None:
+            waiting -= 1
+            if waiting <= 0:
+                pending = None
+            continue
+        if arg == "--" and not options_done:
+            options_done = True
+            continue
+        if arg.startswith("-") and len(arg) > 1 and not options_done:
+            name, equals, _ = arg.partition("=")
+            option = find_option(node, name)
+            if option is not None:
+                used.add(option["opts"][0])
+                if not option["flag"] and not equals:
+                    pending, waiting = option, option["nargs"]
+            continue
+        if arg in node["commands"]:
+            node, used, positional = node["commands"][arg], set(), 0
+            options_done = False
+            continue
+        positional += 1
+    return node, used, pending, positional
+
+
+def values(param: dict, incomplete: str) -> list[Item]:
+    """The param's completions that start with what's been typed"""
+    fold = str if param["case_sensitive"] else str.lower
+    completions = []
+    for value, kind, help in param["items"]:
+        if kind != "plain":
+            # Files and directories are left to the shell
+            completions.append([incomplete, kind, help])
+        elif fold(value).startswith(fold(incomplete)):
+            completions.append([value, kind, help])
+    return completions
+
+
+def complete(tree: dict, args: list[str], incomplete: str) -> list[Item]:
+    args = list(args)
+    if incomplete == "=":
+        incomplete = ""
+    elif "=" in incomplete and incomplete.startswith("-"):
+        name, _, incomplete = incomplete.partition("=")
+        args.append(name)
+
+    node, used, pending, positional = resolve(tree, args)
+    if incomplete.startswith("-") and "--" not in args:
+        return [
+            [name, "plain", option["help"]]
+            for option in node["options"]
+            if not option["hidden"]
+            and (option["multiple"] or option["opts"][0] not in used)
+            for name in [*option["opts"], *option["secondary"]]
+            if name.startswith(incomplete)
+        ]
+
+    if pending is not None:
+        return values(pending, incomplete)
+
+    for argument in node["arguments"]:
+        if argument["nargs"] == -1 or positional < argument["nargs"]:
+            return values(argument, incomplete)
+        positional -= argument["nargs"]
+
+    return [
+        [name, "plain", command["help"]]
+        for name, command in node["commands"].items()
+        if name.startswith(incomplete)
+    ]
+
+
+def format_item(shell: str, item: Item) -> str:
+    value, kind, help = item
+    if shell == "zsh":
+        help = help or "_"
+        # Colons separate the value from the help, when there is help
+        value = value.replace(":", r"\:") if help != "_" else value
+        return f"{kind}\n{value}\n{help}"
+    if shell == "fish" and help:
+        help = help.replace("\n", "\\n").replace("\t", " ")
+        return f"{kind},{value}\t{help}"
+    return f"{kind},{value}"
+
+
+def serve(prog: str) -> bool:
+    """Answer a completion request, if this is one that can be answered from the
+    file. False means the cli should run as usual, which may be click completing."""
+    instruction = os.environ.get(complete_var(prog))
+    if not instruction:
+        return False
+    shell, _, action = instruction.partition("_")
+    if action != "complete" or shell not in ("bash", "zsh", "fish"):
+        return False
+
+    cache = read_cache()
+    if cache is None:
+        try:
+            cache = rebuild()
+        except Exception:
+            return False
+    tree = cache["programs"].get(prog)
+    if tree is None:
+        return False
+
+    args, incomplete = completion_args(shell)
+    items = complete(tree, args, incomplete)
+    output = "\n".join(format_item(shell, item) for item in items) + "\n"
+    sys.stdout.buffer.write(output.encode())
+    sys.stdout.flush()
+    return True
+
+
+def param_items(param: "click.Parameter", ctx: "click.Context") -> list[Item]:
+    try:
+        completions = param.shell_complete(ctx, "")
+    except Exception:
+        # A value source that isn't available shouldn't break completing the rest
+        return []
+    return [[item.value, item.type, item.help] for item in completions]
+
+
+def case_sensitive(param: "click.Parameter") -> bool:
+    # Only choices can be matched without regard to case
+    return getattr(param.type, "case_sensitive", True)
+
+
+def build_node(command: "click.Command", ctx: "click.Context", files: set[str]) -> dict:
+    import click
+
+    if command.callback is not None:
+        module = sys.modules.get(command.callback.__module__)
+        if module is not None and getattr(module, "__file__", None):
+            files.add(module.__file__)
+
+    node: dict[str, Any] = {
+        "help": command.get_short_help_str(),
+        "options": [],
+        "arguments": [],
+        "commands": {},
+    }
+    for param in command.get_params(ctx):
+        if isinstance(param, click.Option):
+            flag = param.is_flag or param.count
+            node["options"].append(
+                {
+                    "opts": param.opts,
+                    "secondary": param.secondary_opts,
+                    "flag": flag,
+                    "nargs": param.nargs,
+                    "multiple": param.multiple,
+                    "hidden": param.hidden,
+                    "help": param.help,
+                    "items": [] if flag else param_items(param, ctx),
+                    "case_sensitive": case_sensitive(param),
+                }
+            )
+        elif isinstance(param, click.Argument):
+            node["arguments"].append(
+                {
+                    "nargs": param.nargs,
+                    "items": param_items(param, ctx),
+                    "case_sensitive": case_sensitive(param),
+                }
+            )
+
+    if isinstance(command, click.Group):
+        for name in command.list_commands(ctx):
+            subcommand = command.get_command(ctx, name)
+            if subcommand is None or subcommand.hidden:
+                continue
+            with click.Context(
+                subcommand, info_name=name, parent=ctx, resilient_parsing=True
+            ) as sub_ctx:
+                node["commands"][name] = build_node(subcommand, sub_ctx, files)
+    return node
+
+
+def watched_paths() -> list[str]:
+    """Files besides the command modules that completions are read from"""
+    import dotenv
+
+    from ttcli.tripletex.index import index_dir
+
+    # The directory, which changes when an index is written, or a first one is
+    paths = [__file__, str(index_dir())]
+    if env_file := dotenv.find_dotenv():
+        paths.append(env_file)
+    return paths
+
+
+def rebuild() -> dict[str, Any]:
+    """Import the cli, work out every completion and write them to the file"""
+    import click
+
+    from ttcli.main import cli, write_to_all_cmd
+    from ttcli.services import service_specs
+
+    files = set(watched_paths())
+    programs = {}
+    for prog, command in (("tt-cli", cli), ("tt-a", write_to_all_cmd)):
+        with click.Context(command, info_name=prog, resilient_parsing=True) as ctx:
+            programs[prog] = build_node(command, ctx, files)
+
+    environ_keys = sorted(
+        {PROFILE_KEY, *(key for spec in service_specs() for key in spec.required_keys)}
+    )
+    cache = {
+        "stamp": stamp(environ_keys, sorted(files)),
+        "environ_keys": environ_keys,
+        "programs": programs,
+    }
+
+    path = cache_file()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(f"{path.name}.{os.getpid()}")
+    partial.write_text(json.dumps(cache))
+    os.replace(partial, path)
+    return cache
+
+
+def complete_services(
+    ctx: "click.Context", param: "click.Parameter", incomplete: str
+) -> list[str]:
+    from ttcli.services import service_specs
+
+    return [spec.name for spec in service_specs() if spec.name.startswith(incomplete)]
+
+
+def complete_configured_services(
+    ctx: "click.Context", param: "click.Parameter", incomplete: str
+) -> list[str]:
+    from ttcli.services import configured_specs
+
+    return [
+        spec.name for spec in configured_specs() if spec.name.startswith(incomplete)
+    ]
+
+
+def complete_profiles(
+    ctx: "click.Context", param: "click.Parameter", incomplete: str
+) -> list[str]:
+    from ttcli.config.config import list_profiles
+
+    return [profile for profile in list_profiles() if profile.startswith(incomplete)]
@@ -1,98 +1,94 @@
-from dataclasses import dataclass
-from functools import wraps
-from os import environ
-from typing import Callable, Optional, ParamSpec, Sequence, Type, TypeVar
+"""Writing the stored configuration, and the `configure` commands.
+
+Writes go through the ORM, which is imported by the functions that need it, so
+importing this module for its commands doesn't import SQLAlchemy. Reading is in
+`ttcli.config.settings`.
+"""
+
+from typing import TYPE_CHECKING, Optional, Type
 
 import click
 from click_help_colors.core import HelpColorsGroup
 from rich import print
 from rich.table import Table as RichTable
-from sqlalchemy import Column, String, Table, delete, select
-from sqlalchemy_utils.types import JSONType, StringEncryptedType
-
-from ttcli.ApiClient import ApiClient, get_all_services, get_service_by_name
-from ttcli.db import Session, mapper_registry, requires_db
-from ttcli.key import get_key
-
-
-@mapper_registry.mapped
-@dataclass
-class DBConfig:
-    __table__ = Table(
-        "config",
-        mapper_registry.metadata,
-        Column("service", String(50), primary_key=True, nullable=False),
-        Column(
-            "config",
-            StringEncryptedType(JSONType, key=get_key()),
-            nullable=False,
-        ),
-    )
-    service: str
-    config: dict[str, str]
 
+from ttcli import timings
+from ttcli.config.reader import DEFAULT_PROFILE, StoredConfig, current_profile
+from ttcli.config.settings import read_config
+from ttcli.migrations import requires_db
+from ttcli.services import service_specs
+
+if TYPE_CHECKING:
+    from ttcli.ApiClient import ApiClient
 
+
+@timings.timed("config write")
 @requires_db
-def write_config(service: Type[ApiClient], data: dict[str, str]):
-    with Session() as session:
-        existing_config = read_service_config(service)
-        if existing_config is not None:
-            existing_config.config = data
-            session.add(existing_config)
-        else:
-            entry = DBConfig(service=service.name(), config=data)
-            session.add(entry)
+def write_config(
+    service: Type["ApiClient"], data: dict[str, str], profile: Optional[str] = None
+):
+    from sqlalchemy import update
+
+    from ttcli.config.models import DBConfig
+    from ttcli.db import Session
 
+    profile = profile or current_profile()
+    # Updating first takes the write lock right away, so two processes writing the
+    # same service can't both decide to insert it
+    with Session() as session:
+        updated = session.execute(
+            update(DBConfig)
+            .where(DBConfig.profile == profile, DBConfig.service == service.name())
+            .values(config=data)
+        )
+        if updated.rowcount == 0:
+            session.add(DBConfig(profile=profile, service=service.name(), config=data))
         session.commit()
 
 
 @requires_db
 def clear_config():
+    from sqlalchemy import delete
+
+    from ttcli.config.models import DBConfig
+    from ttcli.db import Session
+
     with Session() as session:
         session.execute(delete(DBConfig))
         session.commit()
 
 
-P = ParamSpec("P")
-R = TypeVar("R")
-
-
-def clears_on_decrypt_exception(func: Callable[P, R]) -> Callable[P, Optional[R]]:
-    @wraps(func)
-    def wrapper(*args: P.args, **kwargs: P.kwargs) -> Optional[R]:
-        try:
-            return func(*args, **kwargs)
-        except ValueError as e:
-            if len(e.args[0]) > 0 and e.args[0] == "Invalid decryption key":
-                print("[red]Decryption error[/red]")
-                print(
-                    "The decryption key in the keyring could not decrypt your service credentials."
-                )
-                print(
-                    "Sadly we have to clear the configured credentials and you will need to log in to your services anew."
-                )
-                clear_config()
-                return None
-            raise e
-
-    return wrapper
-
-
-@clears_on_decrypt_exception
 @requires_db
-def read_config() -> Sequence[DBConfig]:
+def read_configs_with_orm(
+    service: Optional[str] = None, profile: Optional[str] = None
+) -> list[StoredConfig]:
+    """Like `read_stored_configs`, but migrates the database first if needed"""
+    from sqlalchemy import select
+
+    from ttcli.config.models import DBConfig
+    from ttcli.db import Session
+
+    query = select(DBConfig).where(DBConfig.profile == (profile or current_profile()))
+    if service is not None:
+        query = query.where(DBConfig.service == service)
     with Session() as session:
-        result = session.execute(select(DBConfig))
-        return result.scalars().all()
+        return [
+            StoredConfig(config.service, config.config)
+            for config in session.execute(query).scalars()
+        ]
 
 
-@clears_on_decrypt_exception
 @requires_db
-def read_service_config(service: Type[ApiClient]) -> Optional[DBConfig]:
-    name = service.name()
+def list_profiles() -> list[str]:
+    """Every profile something is configured in, the default one first"""
+    from sqlalchemy import select
+
+    from ttcli.config.models import DBConfig
+    from ttcli.db import Session
+
     with Session() as session:
-        result = session.execute(select(DBConfig).where(DBConfig.service == name))
-        return result.scalar_one_or_none()
+        profiles = session.execute(select(DBConfig.profile).distinct()).scalars()
+        return sorted(profiles, key=lambda name: (name != DEFAULT_PROFILE, name))
 
 
 @click.group(
@@ -119,17 +115,30 @@ def list_config():
         print(table)
 
 
-def source_config():
-    for config in read_config() or []:
-        for k, v in config.config.items():
-            environ[k] = str(v)
+@configure_command.command(name="profiles")
+def list_profiles_cmd():
+    """List the profiles that have configured services"""
+    current = current_profile()
+    for profile in list_profiles():
+        marker = " [green](current)[/green]" if profile == current else ""
+        print(f"{profile}{marker}")
 
 
 @requires_db
-def clear_service_config(service: Type[ApiClient]):
+def clear_service_config(service: Type["ApiClient"], profile: Optional[str] = None):
+    from sqlalchemy import delete
+
+    from ttcli.config.models import DBConfig
+    from ttcli.db import Session
+
     name = service.name()
     with Session() as session:
-        session.execute(delete(DBConfig).where(DBConfig.service == name))
+        session.execute(
+            delete(DBConfig).where(
+                DBConfig.profile == (profile or current_profile()),
+                DBConfig.service == name,
+            )
+        )
         session.commit()
 
 
@@ -137,8 +146,10 @@ def clear_service_config(service: Type[ApiClient]):
 @click.argument(
     "service",
     nargs=1,
-    type=click.Choice([service.name() for service in get_all_services()]),
+    type=click.Choice([spec.name for spec in service_specs()]),
 )
 def delete_config(service: str):
+    from ttcli.ApiClient import get_service_by_name
+
     Service = get_service_by_name(service)
     clear_service_config(Service)
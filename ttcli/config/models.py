@@ -0,0 +1,33 @@
+"""The ORM mapping of the config table, used for writes and migrations.
+
+Reads normally go through `ttcli.config.reader` instead, which is why this is only
+imported when needed: sqlalchemy_utils is slow to import.
+"""
+
+from dataclasses import dataclass
+
+from sqlalchemy import Column, String, Table
+from sqlalchemy_utils.types import JSONType, StringEncryptedType
+
+from ttcli.db import mapper_registry
+from ttcli.key import get_key
+
+
+@mapper_registry.mapped
+@dataclass
+class DBConfig:
+    __table__ = Table(
+        "config",
+        mapper_registry.metadata,
+        Column("profile", String(50), primary_key=True, nullable=False),
+        Column("service", String(50), primary_key=True, nullable=False),
+        Column(
+            "config",
+            # Called on first decryption, so importing this doesn't ask the keyring
+            StringEncryptedType(JSONType, key=get_key),
+            nullable=False,
+        ),
+    )
+    profile: str
+    service: str
+    config: dict[str, str]
@@ -0,0 +1,156 @@
+"""Reads the config table with the stdlib sqlite3 module, without the ORM.
+
+Reading three rows doesn't need SQLAlchemy's startup or an alembic migration check.
+Decryption matches sqlalchemy_utils' StringEncryptedType with AesEngine: AES-CBC
+keyed by the sha256 of the key, the first 16 bytes of that as iv, naive '*' padding
+and base64. The plaintext is json.
+
+Every row belongs to a profile, so several people's credentials can live side by side.
+The profile used is the one named by TTCLI_CONFIG_PROFILE, or "default".
+
+If the database doesn't exist or isn't at the latest migration, `read_stored_configs`
+returns None and the ORM path, which migrates first, should be used instead.
+"""
+
+import json
+import os
+import re
+import sqlite3
+from base64 import b64decode
+from dataclasses import dataclass
+from functools import cache
+from hashlib import sha256
+from pathlib import Path
+from typing import Optional
+
+from appdirs import user_config_dir
+
+VERSIONS_DIR = Path(__file__).parent.parent / "alembic" / "versions"
+# Seconds to wait for another process to finish writing, rather than failing
+BUSY_TIMEOUT = 30.0
+
+PROFILE_KEY = "TTCLI_CONFIG_PROFILE"
+DEFAULT_PROFILE = "default"
+
+
+@dataclass
+class StoredConfig:
+    service: str
+    config: dict[str, str]
+
+
+def current_profile() -> str:
+    return os.environ.get(PROFILE_KEY) or DEFAULT_PROFILE
+
+
+def config_db_file() -> Path:
+    location = user_config_dir(appname="tt-cli", appauthor="brbcoffee")
+    return Path(location) / "config.sqlite"
+
+
+@cache
+def head_revision() -> Optional[str]:
+    """The newest migration, found by reading the revision ids of the migration
+    scripts instead of loading them through alembic"""
+    revisions, parents = set(), set()
+    for script in VERSIONS_DIR.glob("*.py"):
+        source = script.read_text()
+        revision = re.search(r"^revision\s*=\s*['\"](\w+)['\"]", source, re.M)
+        down = re.search(r"^down_revision\s*=\s*(.+)$", source, re.M)
+        if revision:
+            revisions.add(revision.group(1))
+        if down:
+            parents.update(re.findall(r"['\"](\w+)['\"]", down.group(1)))
+
+    heads = revisions - parents
+    return heads.pop() if len(heads) == 1 else None
+
+
+def decrypt(value: str, key: str) -> dict[str, str]:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+    secret = sha256(key.encode()).digest()
+    decryptor = Cipher(algorithms.AES(secret), modes.CBC(secret[:16])).decryptor()
+    padded = decryptor.update(b64decode(value)) + decryptor.finalize()
+    try:
+        plaintext = padded.rstrip(b"*").decode()
+    except UnicodeDecodeError:
+        # What sqlalchemy_utils raises, see clears_on_decrypt_exception
+        raise ValueError("Invalid decryption key")
+    return json.loads(plaintext)
+
+
+def connect() -> Optional[sqlite3.Connection]:
+    path = config_db_file()
+    if not path.exists():
+        return None
+
+    try:
+        return sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+    except sqlite3.Error:
+        return None
+
+
+def at_head(connection: sqlite3.Connection) -> bool:
+    head = head_revision()
+    try:
+        version = connection.execute("SELECT version_num FROM alembic_version")
+        return head is not None and version.fetchone() == (head,)
+    except sqlite3.Error:
+        return False
+
+
+def is_migrated() -> bool:
+    """Whether the database exists and is at the newest migration"""
+    connection = connect()
+    if connection is None:
+        return False
+
+    try:
+        return at_head(connection)
+    finally:
+        connection.close()
+
+
+def fetch_rows(
+    profile: str, service: Optional[str] = None
+) -> Optional[list[tuple[str, str]]]:
+    """Encrypted config rows, or None if the database isn't ready to be read"""
+    connection = connect()
+    if connection is None:
+        return None
+
+    try:
+        if not at_head(connection):
+            return None
+        if service is None:
+            rows = connection.execute(
+                "SELECT service, config FROM config WHERE profile = ?", (profile,)
+            )
+        else:
+            rows = connection.execute(
+                "SELECT service, config FROM config WHERE profile = ? AND service = ?",
+                (profile, service),
+            )
+        return rows.fetchall()
+    except sqlite3.Error:
+        return None
+    finally:
+        connection.close()
+
+
+def read_stored_configs(
+    service: Optional[str] = None, profile: Optional[str] = None
+) -> Optional[list[StoredConfig]]:
+    """Every service's config in a profile, or just one service's, or None to use the
+    ORM. The profile defaults to the current one."""
+    rows = fetch_rows(profile or current_profile(), service)
+    if rows is None:
+        return None
+    if not rows:
+        return []
+
+    from ttcli.key import get_key
+
+    key = get_key()
+    return [StoredConfig(name, decrypt(value, key)) for name, value in rows]
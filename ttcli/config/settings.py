@@ -0,0 +1,117 @@
+"""Reading the stored configuration, and the settings clients are created with.
+
+Everything here reads through `ttcli.config.reader`, with the stdlib sqlite3 module,
+so reading config doesn't import SQLAlchemy or create an engine. The ORM is only
+imported when the database has to be migrated first, or the config cleared.
+"""
+
+from functools import cache, wraps
+from os import environ
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Mapping,
+    Optional,
+    ParamSpec,
+    Sequence,
+    Type,
+    TypeVar,
+)
+
+import dotenv
+
+from ttcli import timings
+from ttcli.config.reader import StoredConfig, read_stored_configs
+
+if TYPE_CHECKING:
+    from ttcli.ApiClient import ApiClient
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+
+def clears_on_decrypt_exception(func: Callable[P, R]) -> Callable[P, Optional[R]]:
+    @wraps(func)
+    def wrapper(*args: P.args, **kwargs: P.kwargs) -> Optional[R]:
+        from ttcli.key import invalidate_cached_key
+
+        try:
+            return func(*args, **kwargs)
+        except ValueError as e:
+            if len(e.args[0]) > 0 and e.args[0] == "Invalid decryption key":
+                # A stale cached key isn't a reason to throw the config away
+                if invalidate_cached_key():
+                    return wrapper(*args, **kwargs)
+
+                from rich import print
+
+                from ttcli.config.config import clear_config
+
+                print("[red]Decryption error[/red]")
+                print(
+                    "The decryption key in the keyring could not decrypt your "
+                    "service credentials."
+                )
+                print(
+                    "Sadly we have to clear the configured credentials and you will "
+                    "need to log in to your services anew."
+                )
+                clear_config()
+                return None
+            raise e
+
+    return wrapper
+
+
+@timings.timed("config read")
+@clears_on_decrypt_exception
+def read_config(profile: Optional[str] = None) -> Sequence[StoredConfig]:
+    configs = read_stored_configs(profile=profile)
+    if configs is None:
+        from ttcli.config.config import read_configs_with_orm
+
+        configs = read_configs_with_orm(profile=profile)
+    return configs
+
+
+@timings.timed("config read")
+@clears_on_decrypt_exception
+def read_service_config(
+    service: Type["ApiClient"], profile: Optional[str] = None
+) -> Optional[StoredConfig]:
+    configs = read_stored_configs(service.name(), profile)
+    if configs is None:
+        from ttcli.config.config import read_configs_with_orm
+
+        configs = read_configs_with_orm(service.name(), profile)
+    return configs[0] if configs else None
+
+
+def service_settings(
+    service: Type["ApiClient"], profile: Optional[str] = None
+) -> Mapping[str, str]:
+    """The settings a client is created with. Without a profile that's the
+    environment, which holds the current profile's stored config and whatever .env
+    and the shell add. A named profile only has what is stored for it."""
+    if profile is None:
+        load_environment()
+        return environ
+
+    stored = read_service_config(service, profile)
+    return stored.config if stored else {}
+
+
+def source_config():
+    for config in read_config() or []:
+        for k, v in config.config.items():
+            environ[k] = str(v)
+
+
+@cache
+def load_environment():
+    """Put the stored configuration in the environment, once per process. Clients
+    call this when they're created, so commands that don't need any configuration
+    never open the database or ask the keyring for the key."""
+    source_config()
+    # Values in a .env file win over stored ones
+    dotenv.load_dotenv(override=True)
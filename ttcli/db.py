@@ -1,55 +1,47 @@
-import logging
-from functools import cache, wraps
-from pathlib import Path
-from typing import Callable, ParamSpec, TypeVar
-
-from alembic import command
-from alembic.config import Config
-from appdirs import user_config_dir
-from sqlalchemy import create_engine
+"""The SQLAlchemy side of the local database: the mapper registry the tables are
+mapped with, and sessions. The engine is only created when the first session is.
+"""
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session as OrmSession
 from sqlalchemy.orm import registry, sessionmaker
 
+from ttcli import timings
+from ttcli.config.reader import BUSY_TIMEOUT
+from ttcli.migrations import get_db_location
 from ttcli.utils import typed_cache
 
 mapper_registry = registry()
 
 
-def get_db_location() -> str:
-    location = user_config_dir(appname="tt-cli", appauthor="brbcoffee")
-    db_file = f"sqlite:///{location}/config.sqlite"
-
-    as_path = Path(location)
-    if not as_path.exists():
-        as_path.mkdir(parents=True)
-
-    return db_file
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Several tt-cli processes may use the database at once, like a cron job and an
+    interactive tt-a. With a write ahead log readers don't block the writer, and
+    writers wait for each other instead of failing with "database is locked"."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(BUSY_TIMEOUT * 1000)}")
+    # Safe with WAL, a crash can only lose the last transactions, not corrupt
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
 
 
 @typed_cache
+@timings.timed("db engine")
 def get_engine() -> Engine:
-    return create_engine(get_db_location(), future=True)  # type: ignore
-
-
-@cache
-def ensure_latest_db_exists():
-    logging.getLogger("alembic").setLevel(logging.CRITICAL)
-    ini_location = Path(__file__).parent.parent / "alembic.ini"
-    alembic_cfg = Config(str(ini_location))
-    command.upgrade(alembic_cfg, "head")
+    engine = create_engine(
+        get_db_location(), future=True, connect_args={"timeout": BUSY_TIMEOUT}
+    )
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    return engine  # type: ignore
 
 
-P = ParamSpec("P")
-R = TypeVar("R")
-
-
-def requires_db(func: Callable[P, R]) -> Callable[P, R]:
-    @wraps(func)
-    def wrapped(*args: P.args, **kwargs: P.kwargs) -> R:
-        ensure_latest_db_exists()
-        return func(*args, **kwargs)
-
-    return wrapped
+@typed_cache
+def session_factory() -> sessionmaker:
+    return sessionmaker(get_engine())
 
 
-Session = sessionmaker(get_engine())
+def Session() -> OrmSession:
+    """A new session, used like `with Session() as session:`"""
+    return session_factory()()
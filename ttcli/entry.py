@@ -0,0 +1,40 @@
+"""Console script entry points.
+
+These stay light on imports: before paying for the full startup they answer shell
+completion from the precomputed completions, and check whether a tt-cli agent is
+running, and if so let it run the command instead.
+"""
+
+import sys
+
+from ttcli import completion
+
+
+def cli():
+    if completion.serve("tt-cli"):
+        return
+
+    from ttcli import agent
+
+    exit_code = agent.forward("tt-cli", sys.argv[1:])
+    if exit_code is not None:
+        sys.exit(exit_code)
+
+    from ttcli.main import cli as main_cli
+
+    main_cli()
+
+
+def write_to_all():
+    if completion.serve("tt-a"):
+        return
+
+    from ttcli import agent
+
+    exit_code = agent.forward("tt-a", sys.argv[1:])
+    if exit_code is not None:
+        sys.exit(exit_code)
+
+    from ttcli.main import write_to_all_cmd
+
+    write_to_all_cmd()
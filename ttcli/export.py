@@ -0,0 +1,91 @@
+"""Timesheet entries as json, ndjson or csv, for scripts and dashboards.
+
+Entries are written straight to stdout as they come, without going through rich. On a
+terminal every line is flushed right away; otherwise output is buffered in large
+chunks, so big exports are limited by I/O rather than by console rendering.
+"""
+
+import csv
+import json
+import sys
+from typing import IO, Iterable, Optional
+
+import click
+
+from ttcli.utils import Entry
+
+FORMATS = ("text", "json", "ndjson", "csv")
+FIELDS = ("service", "date", "hours", "description", "project")
+BUFFER_SIZE = 64 * 1024
+
+
+class BufferedWriter:
+    """Collects writes and passes them on in large chunks, or per line on a tty"""
+
+    def __init__(self, stream: IO[str], line_buffered: bool):
+        self.stream = stream
+        self.line_buffered = line_buffered
+        self._chunks: list[str] = []
+        self._size = 0
+
+    def write(self, text: str) -> int:
+        self._chunks.append(text)
+        self._size += len(text)
+        if self._size >= BUFFER_SIZE or (self.line_buffered and "\n" in text):
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self._chunks:
+            self.stream.write("".join(self._chunks))
+            self._chunks.clear()
+            self._size = 0
+        self.stream.flush()
+
+
+def format_option(func):
+    return click.option(
+        "--format",
+        "output_format",
+        type=click.Choice(FORMATS),
+        default="text",
+        help="Print entries as json, ndjson or csv instead of for humans",
+    )(func)
+
+
+def as_row(entry: Entry) -> dict:
+    return {
+        "service": entry.service,
+        "date": entry.day.isoformat(),
+        "hours": entry.hours,
+        "description": entry.description,
+        "project": entry.project,
+    }
+
+
+def write_entries(
+    entries: Iterable[Entry], format: str, stream: Optional[IO[str]] = None
+):
+    """Stream entries to stdout (or stream) in one of the machine readable formats"""
+    if stream is None:
+        stream = sys.stdout
+    out = BufferedWriter(stream, line_buffered=stream.isatty())
+
+    if format == "csv":
+        writer = csv.DictWriter(out, fieldnames=FIELDS)
+        writer.writeheader()
+        for entry in entries:
+            writer.writerow(as_row(entry))
+    elif format == "ndjson":
+        for entry in entries:
+            out.write(json.dumps(as_row(entry), ensure_ascii=False) + "\n")
+    elif format == "json":
+        separator = "[\n"
+        for entry in entries:
+            out.write(separator + json.dumps(as_row(entry), ensure_ascii=False))
+            separator = ",\n"
+        out.write("\n]\n" if separator != "[\n" else "[]\n")
+    else:
+        raise ValueError(f"Can't stream entries as {format}")
+
+    out.flush()
@@ -0,0 +1,349 @@
+"""A circuit breaker per service and profile, with its state kept in the local database
+so it carries over from one command to the next. Profiles have their own credentials
+and tenants, so one profile's failures don't keep another from trying.
+
+A service starts out closed, and requests go through. After FAILURE_THRESHOLD
+failures in a row, whether connection errors, timeouts or 5xx answers, it opens: for
+a while, requests fail right away with `ServiceUnavailable` instead of waiting on a
+service that's down, and queued writes stay in the outbox. When that while is over it
+goes half-open, and a single request is let through as a probe. If the probe succeeds
+the circuit closes again, if not it opens for twice as long as before.
+
+Every request also gets a timeout, TTCLI_TIMEOUT seconds (default 30) to answer and
+CONNECT_TIMEOUT to connect, so a service that's down can't hang a command.
+
+Every client imports this, so like the config it's read with sqlite3, and SQLAlchemy
+is only imported to write.
+"""
+
+import sqlite3
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from functools import cache
+from os import getenv
+from threading import Lock
+from time import monotonic
+from typing import TYPE_CHECKING, Optional
+
+import click
+from click_help_colors import HelpColorsGroup
+from requests import PreparedRequest, Response, Session
+from requests.adapters import BaseAdapter
+from requests.exceptions import ConnectionError
+from rich.table import Table as RichTable
+
+from ttcli.completion import complete_services
+from ttcli.config.reader import at_head, connect, current_profile
+from ttcli.migrations import requires_db
+from ttcli.output import print
+from ttcli.services import service_specs
+
+if TYPE_CHECKING:
+    from sqlalchemy import Table
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+FAILURE_THRESHOLD = 3
+OPEN_FOR = timedelta(seconds=30)
+OPEN_FOR_MAX = timedelta(minutes=15)
+# How often a long lived process picks up what other processes found out
+REFRESH_INTERVAL = 30.0
+
+TIMEOUT_KEY = "TTCLI_TIMEOUT"
+CONNECT_TIMEOUT = 5.0
+
+
+class ServiceUnavailable(ConnectionError):
+    """Raised instead of sending a request while the service's circuit is open"""
+
+
+@dataclass
+class ServiceHealth:
+    service: str
+    state: str = CLOSED
+    failures: int = 0
+    open_until: Optional[datetime] = None
+    updated_at: datetime = field(default_factory=datetime.now)
+    profile: str = field(default_factory=current_profile)
+
+
+@cache
+def health_table() -> "Table":
+    """The service_health table, defined on first write"""
+    from sqlalchemy import Column, DateTime, Integer, String, Table
+
+    from ttcli.db import mapper_registry
+
+    return Table(
+        "service_health",
+        mapper_registry.metadata,
+        Column("profile", String(50), primary_key=True),
+        Column("service", String(50), primary_key=True),
+        Column("state", String(16), nullable=False),
+        Column("failures", Integer, nullable=False),
+        Column("open_until", DateTime, nullable=True),
+        Column("updated_at", DateTime, nullable=False),
+    )
+
+
+def read_health(
+    service: Optional[str] = None, profile: Optional[str] = None
+) -> Optional[list[ServiceHealth]]:
+    """Stored health in the profile, the current one by default, read with sqlite3
+    like the config, or None if the database isn't ready yet"""
+    profile = profile or current_profile()
+    connection = connect()
+    if connection is None:
+        return None
+
+    try:
+        if not at_head(connection):
+            return None
+        query = (
+            "SELECT service, state, failures, open_until FROM service_health "
+            "WHERE profile = ?"
+        )
+        if service is None:
+            rows = connection.execute(query, (profile,))
+        else:
+            rows = connection.execute(query + " AND service = ?", (profile, service))
+        return [
+            ServiceHealth(
+                name,
+                state,
+                failures,
+                datetime.fromisoformat(open_until) if open_until else None,
+                profile=profile,
+            )
+            for name, state, failures, open_until in rows.fetchall()
+        ]
+    except sqlite3.Error:
+        return None
+    finally:
+        connection.close()
+
+
+@requires_db
+def save_health(health: ServiceHealth):
+    from sqlalchemy import insert, update
+
+    from ttcli.db import Session
+
+    table = health_table()
+    values = dict(
+        state=health.state,
+        failures=health.failures,
+        open_until=health.open_until,
+        updated_at=datetime.now(),
+    )
+    with Session() as session:
+        updated = session.execute(
+            update(table)
+            .where(table.c.profile == health.profile, table.c.service == health.service)
+            .values(**values)
+        )
+        if updated.rowcount == 0:
+            session.execute(
+                insert(table).values(
+                    profile=health.profile, service=health.service, **values
+                )
+            )
+        session.commit()
+
+
+class CircuitBreaker:
+    def __init__(self, service: str, profile: str):
+        self.service = service
+        self.profile = profile
+        self.health = ServiceHealth(service, profile=profile)
+        self.probing = False
+        self.read_at: Optional[float] = None
+        self._lock = Lock()
+
+    def refresh(self):
+        if self.read_at is not None and monotonic() - self.read_at < REFRESH_INTERVAL:
+            return
+        stored = read_health(self.service, self.profile)
+        if stored is not None:
+            # Nothing stored means it's healthy, or was reset by `tt-cli health reset`
+            self.health = (
+                stored[0]
+                if stored
+                else ServiceHealth(self.service, profile=self.profile)
+            )
+        self.read_at = monotonic()
+
+    def unavailable_until(self) -> Optional[datetime]:
+        """When the circuit is open, until when, otherwise None"""
+        with self._lock:
+            self.refresh()
+            health = self.health
+            if health.state == OPEN and health.open_until is not None:
+                if datetime.now() < health.open_until:
+                    return health.open_until
+            return None
+
+    def before_request(self):
+        """:raises: ServiceUnavailable if the request shouldn't be sent"""
+        with self._lock:
+            self.refresh()
+            health = self.health
+            if health.state == CLOSED:
+                return
+
+            if health.state == OPEN and health.open_until is not None:
+                if datetime.now() < health.open_until:
+                    raise ServiceUnavailable(
+                        f"{self.service} is unavailable, not trying again until "
+                        f"{health.open_until.strftime('%H:%M:%S')}"
+                    )
+
+            # Due for a probe, which only one request at a time gets to be
+            if self.probing:
+                raise ServiceUnavailable(
+                    f"{self.service} is unavailable, checking whether it's back"
+                )
+            self.probing = True
+            health.state = HALF_OPEN
+
+    def succeeded(self):
+        with self._lock:
+            self.probing = False
+            if self.health.state == CLOSED and self.health.failures == 0:
+                return
+            self.health = ServiceHealth(self.service, profile=self.profile)
+        save_health(self.health)
+
+    def failed(self):
+        with self._lock:
+            self.probing = False
+            health = self.health
+            health.failures += 1
+            if health.state == HALF_OPEN or health.failures >= FAILURE_THRESHOLD:
+                health.state = OPEN
+                open_for = OPEN_FOR * 2 ** max(0, health.failures - FAILURE_THRESHOLD)
+                health.open_until = datetime.now() + min(open_for, OPEN_FOR_MAX)
+        save_health(health)
+
+
+_breakers: dict[tuple[str, str], CircuitBreaker] = {}
+_breakers_lock = Lock()
+
+
+def breaker_for(service: str, profile: Optional[str] = None) -> CircuitBreaker:
+    """The service's breaker in the profile, the current one by default"""
+    key = (profile or current_profile(), service)
+    with _breakers_lock:
+        if key not in _breakers:
+            _breakers[key] = CircuitBreaker(service, key[0])
+        return _breakers[key]
+
+
+def default_timeout() -> tuple[float, float]:
+    return CONNECT_TIMEOUT, float(getenv(TIMEOUT_KEY, 30))
+
+
+class CircuitBreakerAdapter(BaseAdapter):
+    """Fails fast while the service's circuit is open, and otherwise sends requests
+    through another adapter with a timeout, keeping track of how they went"""
+
+    def __init__(self, adapter: BaseAdapter, service: str, profile: Optional[str]):
+        self.adapter = adapter
+        self.breaker = breaker_for(service, profile)
+        super().__init__()
+
+    def send(self, request: PreparedRequest, *args, **kwargs) -> Response:
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = default_timeout()
+
+        self.breaker.before_request()
+        try:
+            response = self.adapter.send(request, *args, **kwargs)
+        except Exception:
+            self.breaker.failed()
+            raise
+
+        if response.status_code >= 500:
+            self.breaker.failed()
+        else:
+            self.breaker.succeeded()
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+def install(session: Session, service: str, profile: Optional[str] = None):
+    """Guard the session's requests with the service's breaker in the profile,
+    outside everything else that's mounted, so an open circuit doesn't even wait for
+    its turn"""
+    for prefix in ("https://", "http://"):
+        adapter = session.get_adapter(prefix)
+        if not isinstance(adapter, CircuitBreakerAdapter):
+            session.mount(prefix, CircuitBreakerAdapter(adapter, service, profile))
+
+
+@click.group(
+    cls=HelpColorsGroup,
+    help_headers_color="yellow",
+    help_options_color="green",
+    invoke_without_command=True,
+)
+@click.pass_context
+def health_command(ctx: click.Context):
+    """Whether the services are considered up.
+
+    Without a subcommand, lists services that have been failing in the current
+    profile.
+    """
+    if ctx.invoked_subcommand is not None:
+        return
+
+    stored = {health.service: health for health in read_health() or []}
+    table = RichTable()
+    table.add_column("Service", style="cyan")
+    table.add_column("State")
+    table.add_column("Failures", justify="right")
+    table.add_column("Open until")
+    for spec in service_specs():
+        health = stored.get(spec.name, ServiceHealth(spec.name))
+        state, open_until = health.state, ""
+        if state == OPEN and health.open_until is not None:
+            if datetime.now() < health.open_until:
+                open_until = health.open_until.strftime("%Y-%m-%d %H:%M:%S")
+            else:
+                # The next request is a probe
+                state = HALF_OPEN
+        color = {CLOSED: "green", OPEN: "red"}.get(state, "yellow")
+        table.add_row(
+            health.service,
+            f"[{color}]{state}[/{color}]",
+            str(health.failures),
+            open_until,
+        )
+    print(table)
+
+
+@health_command.command(name="reset")
+@click.argument("services", nargs=-1, shell_complete=complete_services)
+@requires_db
+def reset_cmd(services: tuple[str, ...]):
+    """Close the circuits of SERVICES, or of every service, in the current profile so
+    they're tried again"""
+    from sqlalchemy import delete
+
+    from ttcli.db import Session
+
+    table = health_table()
+    profile = current_profile()
+    with Session() as session:
+        query = delete(table).where(table.c.profile == profile)
+        if services:
+            query = query.where(table.c.service.in_(services))
+        session.execute(query)
+        session.commit()
+    for key, breaker in list(_breakers.items()):
+        if key[0] == profile and (not services or key[1] in services):
+            breaker.health = ServiceHealth(breaker.service, profile=profile)
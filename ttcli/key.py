@@ -1,12 +1,97 @@
-import secrets
+"""The key the stored configuration is encrypted with, kept in the OS keyring.
+
+Asking the keyring is a round trip to the keyring daemon, so it only happens the
+first time something is decrypted. With TTCLI_KEY_CACHE_TTL set to a number of
+seconds, the key is also kept that long in a file only the user can read, in
+XDG_RUNTIME_DIR, and later commands within that time don't ask the keyring at all.
+"""
 
-import keyring
+import os
+import secrets
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from time import time
+from typing import Optional
 
+from ttcli import timings
 from ttcli.utils import typed_cache
 
+KEY_CACHE_TTL_KEY = "TTCLI_KEY_CACHE_TTL"
+
+
+def key_cache_ttl() -> int:
+    """:raises: click.ClickException if TTCLI_KEY_CACHE_TTL isn't a number of seconds"""
+    value = os.environ.get(KEY_CACHE_TTL_KEY) or "0"
+    try:
+        ttl = int(value)
+    except ValueError:
+        ttl = -1
+    if ttl < 0:
+        import click
+
+        raise click.ClickException(
+            f"{KEY_CACHE_TTL_KEY} must be a whole number of seconds, not {value!r}"
+        )
+    return ttl
+
+
+def key_cache_path() -> Optional[Path]:
+    """Only in the runtime dir, which is private to the user and gone on logout"""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if not runtime_dir or not key_cache_ttl():
+        return None
+    return Path(runtime_dir) / "tt-cli" / "key"
+
+
+def read_cached_key() -> Optional[str]:
+    path = key_cache_path()
+    if path is None:
+        return None
+
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+
+    ttl = key_cache_ttl()
+    if (
+        stat.st_uid != os.getuid()
+        or stat.st_mode & 0o077
+        or stat.st_mtime + ttl < time()
+    ):
+        path.unlink(missing_ok=True)
+        return None
+
+    return path.read_text() or None
+
+
+def cache_key(key: str):
+    path = key_cache_path()
+    if path is None:
+        return
+
+    path.parent.mkdir(mode=0o700, exist_ok=True)
+    # NamedTemporaryFile creates files readable by the owner only
+    with NamedTemporaryFile("w", dir=path.parent, delete=False) as tmp:
+        tmp.write(key)
+    os.replace(tmp.name, path)
+
+
+def invalidate_cached_key() -> bool:
+    """Forget the cached key, returning whether there was one"""
+    get_key.cache_clear()  # type: ignore
+    path = key_cache_path()
+    if path is None or not path.exists():
+        return False
+
+    path.unlink(missing_ok=True)
+    return True
+
+
+@timings.timed("keyring")
+def get_keyring_key() -> str:
+    import keyring
 
-@typed_cache
-def get_key() -> str:
     key = keyring.get_password("ttcli", "sqlite")
 
     if key is not None:
@@ -16,3 +101,13 @@ def get_key() -> str:
     keyring.set_password("ttcli", "sqlite", key)
 
     return key
+
+
+@typed_cache
+def get_key() -> str:
+    key = read_cached_key()
+    if key is None:
+        key = get_keyring_key()
+        cache_key(key)
+
+    return key
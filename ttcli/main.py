@@ -1,33 +1,133 @@
 #!/usr/bin/env python
 
+# Imported first, so the time spent on the imports below can be measured
+from ttcli import timings  # isort: skip
+
 import csv
+import os
+import subprocess
+import sys
 from datetime import date, datetime, timedelta
-from io import BufferedReader
+from io import BufferedReader, StringIO
+from typing import Optional
 
 import click
 from click_help_colors import HelpColorsCommand, HelpColorsGroup
 from rich import traceback
 
+from ttcli.completion import complete_profiles
 from ttcli.config.config import configure_command
+from ttcli.config.reader import DEFAULT_PROFILE, PROFILE_KEY, current_profile
 
 traceback.install()
 
-from ttcli.ApiClient import (
-    ConfigurationException,
-    get_all_services,
-    get_configured_services,
-    get_configured_services_instances,
-)
-from ttcli.noa.NoaWorkbook import noa_command
+from ttcli.ApiClient import get_configured_services_instances
+from ttcli.health import health_command
+from ttcli.outbox import deliver, delivery_options, enqueue, queue_command
 from ttcli.output import print
-from ttcli.Severa import severa_command
-from ttcli.tripletex.TripleTex import tripletex_command
+from ttcli.profiling import profile, profiling_requested
+from ttcli.reconcile import reconcile_command
+from ttcli.services import configured_specs, service_specs
+from ttcli.team import team_command
+from ttcli.timesheet import timesheet_command
 from ttcli.utils import days_of_week
 
+timings.mark("imports")
+
+
+def command_name(ctx: click.Context) -> str:
+    """The invoked subcommand path, like tripletex-timesheet, for naming profiles"""
+    parts = [ctx.command.name or ctx.info_name or "tt-cli"]
+    command = ctx.command
+    # Click 8.2 renamed protected_args, and deprecated the public name
+    fields = vars(ctx)
+    protected_args = fields.get("_protected_args", fields.get("protected_args", []))
+    for arg in [*protected_args, *ctx.args]:
+        if not isinstance(command, click.Group):
+            break
+        subcommand = command.get_command(ctx, arg)
+        if subcommand is not None:
+            command = subcommand
+            parts.append(arg)
+        elif not arg.startswith("-"):
+            break
+
+    return "-".join(parts[1:] if len(parts) > 1 else parts)
+
+
+class ProfiledGroup(HelpColorsGroup):
+    """The tt-cli group, which also has a command group for every service that has
+    one, imported only when it's used"""
+
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        services = [spec.command_name for spec in service_specs() if spec.command_name]
+        return sorted({*super().list_commands(ctx), *services})
+
+    def get_command(self, ctx: click.Context, name: str) -> Optional[click.Command]:
+        command = super().get_command(ctx, name)
+        if command is not None:
+            return command
+
+        for spec in service_specs():
+            if spec.command_name == name:
+                command = spec.load_command()
+                if command is not None:
+                    self.add_command(command, name=name)
+                return command
+        return None
+
+    def invoke(self, ctx: click.Context):
+        name = command_name(ctx) if profiling_requested() else ""
+        with profile(lambda: name):
+            return super().invoke(ctx)
+
+
+class ProfiledCommand(HelpColorsCommand):
+    def invoke(self, ctx: click.Context):
+        with profile(lambda: ctx.command.name or "tt-cli"):
+            return super().invoke(ctx)
 
-@click.group(
-    cls=HelpColorsGroup, help_headers_color="yellow", help_options_color="green"
+
+def timings_options(func):
+    """--timings and --timings-json, shared by tt-cli and tt-a"""
+
+    def enable(ctx: click.Context, param: click.Parameter, value):
+        if value:
+            timings.enable(value if param.name == "timings_json" else None)
+
+    func = click.option(
+        "--timings-json",
+        type=click.Path(dir_okay=False, writable=True),
+        expose_value=False,
+        callback=enable,
+        help="Also write the timings as json to this file",
+    )(func)
+    return click.option(
+        "--timings",
+        is_flag=True,
+        expose_value=False,
+        callback=enable,
+        help="Print where the time went at exit",
+    )(func)
+
+
+def use_profile(ctx: click.Context, param: click.Parameter, value: Optional[str]):
+    # Through the environment, so background flushes and anything else started from
+    # here use the same profile
+    if value:
+        os.environ[PROFILE_KEY] = value
+
+
+@click.group(cls=ProfiledGroup, help_headers_color="yellow", help_options_color="green")
+@click.option(
+    "--profile",
+    expose_value=False,
+    is_eager=True,
+    callback=use_profile,
+    shell_complete=complete_profiles,
+    help="Use the services configured in this profile",
 )
+@timings_options
 def cli():
     """Program for interacting with timesheet providers from the cli"""
     pass
@@ -45,16 +145,12 @@ def cli():
 )
 def list(configured: bool):
     """List all known timesheet services"""
-    if not configured:
-        for service in get_all_services():
-            print(service.name())
-    else:
-        for service in get_configured_services():
-            print(service.name())
+    for spec in configured_specs() if configured else service_specs():
+        print(spec.name)
 
 
 @cli.command(
-    cls=HelpColorsCommand,
+    cls=ProfiledCommand,
     help_headers_color="yellow",
     help_options_color="green",
     name="write-to-all",
@@ -76,15 +172,23 @@ def list(configured: bool):
         case_sensitive=False,
     ),
 )
+@delivery_options
+@timings_options
 def write_to_all_cmd(
-    hours: float, description: str, date: datetime, lock: bool, weekday: str
+    hours: float,
+    description: str,
+    date: datetime,
+    lock: bool,
+    weekday: str,
+    deadline: Optional[float],
+    background: bool,
 ):
     if weekday is not None:
         weekday_index = days_of_week.index(weekday) % 7
         monday = date - timedelta(days=date.weekday())
         date = monday + timedelta(days=weekday_index)
 
-    write_to_all(hours, description, date, lock)
+    write_to_all(hours, description, date, lock, deadline, background)
 
 
 @cli.command(
@@ -92,42 +196,112 @@ def write_to_all_cmd(
 )
 @click.option("--lock/--no-lock", default=True)
 @click.argument("file", type=click.File("rb"))
-def write_to_all_csv(file: BufferedReader, lock: bool):
+@delivery_options
+def write_to_all_csv(
+    file: BufferedReader, lock: bool, deadline: Optional[float], background: bool
+):
     lines = [line.decode() for line in file.readlines()]
     reader = csv.DictReader(lines)
+    services = get_configured_services_instances()
     for item in reader:
-        day = datetime.fromisoformat(item["date"])
-        description = item["description"]
-        hours = float(item["hours"])
-        write_to_all(hours, description, day, lock)
+        day = datetime.fromisoformat(item["date"]).date()
+        hours, description = float(item["hours"]), item["description"]
+        for service in services:
+            enqueue(service.name(), day, hours, description, lock)
+
+    deliver(services, deadline, background)
 
 
-def write_to_all(hours: float, description: str, day: datetime, lock: bool):
-    """Write the given data to all known timesheet services."""
+def write_to_all(
+    hours: float,
+    description: str,
+    day: datetime,
+    lock: bool,
+    deadline: Optional[float] = None,
+    background: bool = False,
+):
+    """Write the given data to all known timesheet services.
+
+    The writes are journaled to the outbox first, so whatever can't be delivered now
+    is delivered by a later flush instead of getting lost.
+    """
     day_actual = day.date()
     services = get_configured_services_instances()
-
     for service in services:
-        print(f"[yellow]Writing to {service.name()}[/yellow]", nl=False)
-
-        try:
-            service.write_hours(hours, description, day_actual)
-            print(" [green]Done[/green]")
-            if lock:
-                print(
-                    f"[yellow]Locking {day_actual.isoformat()} in {service.name()}[/yellow]",
-                    nl=False,
-                )
-                service.lock_day(day=day_actual)
-                print(" [green]Done[/green]")
-        except ConfigurationException as e:
-            print(f"[blink]Warning:[/blink] {e.message}")
-
-
-cli.add_command(tripletex_command, name="tripletex")
-cli.add_command(severa_command, name="severa")
-cli.add_command(noa_command, name="noa")
+        enqueue(service.name(), day_actual, hours, description, lock)
+
+    deliver(services, deadline, background)
+
+
+@cli.group(cls=HelpColorsGroup, help_headers_color="yellow", help_options_color="green")
+def agent():
+    """Keep logged in service clients around in a background process.
+
+    While an agent is running, tt-cli and tt-a hand their commands to it over a unix
+    socket instead of starting up and logging in from scratch every time.
+    """
+    pass
+
+
+@agent.command(name="start")
+@click.option(
+    "--detach/--no-detach",
+    default=False,
+    help="Run in the background instead of in this terminal",
+)
+def agent_start(detach: bool):
+    from ttcli import agent as agent_module
+
+    if current_profile() != DEFAULT_PROFILE:
+        print("[red]The agent only serves the default profile[/red]")
+        return 1
+
+    path = agent_module.socket_path()
+    if agent_module.control("status", out=StringIO()):
+        print(f"[yellow]An agent is already listening on {path}[/yellow]")
+        return
+
+    agent_module.make_socket_dir(path)
+    if detach:
+        with (path.parent / "agent.log").open("a") as log:
+            subprocess.Popen(
+                [sys.executable, "-m", "ttcli.main", "agent", "start"],
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=log,
+                start_new_session=True,
+            )
+        print(f"[green]Agent started[/green], listening on {path}")
+        return
+
+    print(f"[green]Agent listening on {path}[/green]")
+    agent_module.Agent().serve(path)
+
+
+@agent.command(name="stop")
+def agent_stop():
+    from ttcli import agent as agent_module
+
+    if agent_module.control("stop", out=StringIO()):
+        print("[green]Agent stopped[/green]")
+    else:
+        print("[yellow]No agent running[/yellow]")
+
+
+@agent.command(name="status")
+def agent_status():
+    from ttcli import agent as agent_module
+
+    if not agent_module.control("status"):
+        print("[yellow]No agent running[/yellow]")
+
+
 cli.add_command(configure_command, name="configure")
+cli.add_command(queue_command, name="queue")
+cli.add_command(timesheet_command, name="timesheet")
+cli.add_command(reconcile_command, name="reconcile")
+cli.add_command(team_command, name="team")
+cli.add_command(health_command, name="health")
 
 if __name__ == "__main__":
     cli()
@@ -0,0 +1,72 @@
+"""Bringing the local database up to the newest migration before it's used.
+
+This only needs the stdlib to tell whether migrating is necessary, so functions can
+be marked `@requires_db` without importing SQLAlchemy. Alembic is only imported when
+there actually is something to migrate.
+"""
+
+import logging
+from contextlib import contextmanager
+from functools import cache, wraps
+from pathlib import Path
+from typing import Callable, Iterator, ParamSpec, TypeVar
+
+from ttcli import timings
+from ttcli.config.reader import config_db_file, is_migrated
+
+
+def get_db_location() -> str:
+    db_file = config_db_file()
+    db_file.parent.mkdir(parents=True, exist_ok=True)
+    return f"sqlite:///{db_file}"
+
+
+@contextmanager
+def migration_lock() -> Iterator[None]:
+    """Processes starting at the same time take turns to migrate"""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+
+    with (config_db_file().parent / "migrate.lock").open("w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@cache
+@timings.timed("alembic upgrade")
+def ensure_latest_db_exists():
+    if is_migrated():
+        return
+
+    get_db_location()  # Creates the directory
+    with migration_lock():
+        # Whoever held the lock before us may have done it already
+        if is_migrated():
+            return
+
+        from alembic import command
+        from alembic.config import Config
+
+        logging.getLogger("alembic").setLevel(logging.CRITICAL)
+        ini_location = Path(__file__).parent.parent / "alembic.ini"
+        alembic_cfg = Config(str(ini_location))
+        command.upgrade(alembic_cfg, "head")
+
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+
+def requires_db(func: Callable[P, R]) -> Callable[P, R]:
+    @wraps(func)
+    def wrapped(*args: P.args, **kwargs: P.kwargs) -> R:
+        ensure_latest_db_exists()
+        return func(*args, **kwargs)
+
+    return wrapped
@@ -1,79 +1,111 @@
-from dataclasses import dataclass
 from datetime import date, datetime, timedelta
 from functools import cached_property
 from json import loads
 from json.decoder import JSONDecodeError
-from os import environ, getenv
+from os import getenv
 from pathlib import Path
 from textwrap import dedent
 from typing import Optional
 
 import click
-from babel.dates import format_date
 from click_help_colors.core import HelpColorsGroup
-from jinja2 import Environment, FileSystemLoader
 from requests.sessions import Session
-from rich import print
 from rich.console import Console
 from rich.prompt import Prompt
-from weasyprint import HTML
 
+from ttcli import timings
 from ttcli.ApiClient import ApiClient, ConfigurationException
-from ttcli.config.config import (
-    clear_service_config,
-    configure_command,
-    source_config,
-    write_config,
+from ttcli.config.config import clear_service_config, configure_command, write_config
+from ttcli.config.settings import service_settings, source_config
+from ttcli.export import format_option, write_entries
+from ttcli.noa.report import (
+    FORMATS,
+    ReportData,
+    ReportEntry,
+    ReportWeek,
+    write_report,
+    write_reports,
 )
 from ttcli.noa.types import (
     NoaDateVisualization,
+    NoaLoggedHours,
     NoaTimesheetEntry,
     NoaTimesheetEntryPartial,
 )
+from ttcli.output import print
+from ttcli.reports import Summary, print_summary, resolve_span, span_options
 from ttcli.utils import (
+    Entry,
+    TimeSpan,
     days_of_week,
+    get_mondays,
     get_month_span,
     get_week_number,
     get_week_span,
-    typed_cache,
+    instance_cache,
+    list_adapter,
+    prefetch,
 )
 
 NOA_USERNAME_KEY = "NOA_USERNAME"
 NOA_PASSWORD_KEY = "NOA_PASSWORD"
+# Overridable so the client can be pointed at a staging or stand-in server
+NOA_URL_KEY = "TTCLI_NOA_URL"
+# How long we trust a handshake to keep the session cookie valid
+NOA_SESSION_LIFETIME = timedelta(minutes=20)
 
 
 class NoaWorkbook(ApiClient):
     def __init__(
-        self, client: Session = Session(), base_url="https://noa.workbook.net/api/"
+        self,
+        client: Optional[Session] = None,
+        base_url: Optional[str] = None,
+        profile: Optional[str] = None,
     ):
+        self.profile = profile
+        self.settings = service_settings(NoaWorkbook, profile)
         if not self.is_configured():
             missing_keys = [
-                k for k in [NOA_USERNAME_KEY, NOA_PASSWORD_KEY] if k not in environ
+                k
+                for k in [NOA_USERNAME_KEY, NOA_PASSWORD_KEY]
+                if k not in self.settings
             ]
             raise ConfigurationException(
                 "Noa Workbook not configured", missing_key=",".join(missing_keys)
             )
-        super().__init__(client, base_url)
+        if base_url is None:
+            base_url = getenv(NOA_URL_KEY, "https://noa.workbook.net/api/")
+        # Its own session, since the login is a cookie
+        super().__init__(client or Session(), base_url)
 
     @classmethod
     def name(cls) -> str:
         return "Noa Workbook"
 
     def is_configured(self) -> bool:
-        return all(k in environ for k in (NOA_USERNAME_KEY, NOA_PASSWORD_KEY))
+        return all(k in self.settings for k in (NOA_USERNAME_KEY, NOA_PASSWORD_KEY))
 
     @cached_property
+    @timings.timed("Noa Workbook login")
     def login(self):
         response = self.api_post(
             "/auth/handshake",
             post_params={
-                "UserName": getenv(NOA_USERNAME_KEY),
-                "Password": getenv(NOA_PASSWORD_KEY),
+                "UserName": self.settings.get(NOA_USERNAME_KEY),
+                "Password": self.settings.get(NOA_PASSWORD_KEY),
                 "RememberMe": False,
             },
         )
+        self._logged_in_at = datetime.now()
         return loads(response)
 
+    def refresh_session(self):
+        if "login" not in self.__dict__:
+            self.login
+        elif datetime.now() - self._logged_in_at > NOA_SESSION_LIFETIME:
+            del self.__dict__["login"]
+            self.login
+
     @cached_property
     def employee_id(self) -> int:
         return self.login["Id"]
@@ -86,12 +118,12 @@ class NoaWorkbook(ApiClient):
             "json/reply/TimeEntrySheetVisualizationRequest",
             {"ResourceId": self.employee_id, "Date": date.isoformat()},
         )
-        return NoaDateVisualization.parse_obj(loads(result)[0])
+        return NoaDateVisualization.model_validate(loads(result)[0])
 
     def write_hours(
         self, hours: float, description: str, day: date = date.today()
     ) -> NoaTimesheetEntryPartial:
-        days = self.get_week_days(week=get_week_number(day))
+        days = self.get_days_of_week_starting(day - timedelta(days=day.weekday()))
         work_day = next(d for d in days if d.post_date.date() == day)
         result = self.api_post(
             "/json/reply/TimeEntryUpdateRequest",
@@ -104,26 +136,59 @@ class NoaWorkbook(ApiClient):
                 "Description": description,
             },
         )
-        return NoaTimesheetEntryPartial.parse_obj(loads(result))
+        return NoaTimesheetEntryPartial.model_validate_json(result)
+
+    def get_week_days(
+        self, week: int, year: Optional[int] = None
+    ) -> list[NoaTimesheetEntry]:
+        return self.get_days_of_week_starting(get_week_span(week, year).start_date)
 
-    @typed_cache
-    def get_week_days(self, week: int) -> list[NoaTimesheetEntry]:
-        span = get_week_span(week)
+    @instance_cache
+    def get_week_rows(self, monday: date) -> list[dict]:
+        """The raw timesheet rows of a week, validated as needed by the methods below"""
         response = loads(
             self.api_get(
                 "/json/reply/TimeEntryDailyRequest",
-                {"ResourceId": self.employee_id, "Date": span.start_date, "Week": True},
+                {"ResourceId": self.employee_id, "Date": monday, "Week": True},
             )
         )
+        return [entry for entry in response if "TaskId" in entry]
+
+    @instance_cache
+    def get_days_of_week_starting(self, monday: date) -> list[NoaTimesheetEntry]:
+        return list_adapter(NoaTimesheetEntry).validate_python(
+            self.get_week_rows(monday)
+        )
 
+    @instance_cache
+    def get_hours_of_week_starting(self, monday: date) -> list[NoaLoggedHours]:
+        return list_adapter(NoaLoggedHours).validate_python(self.get_week_rows(monday))
+
+    def get_entries(self, span: TimeSpan) -> list[Entry]:
+        self.refresh_session()
+        weeks = prefetch(
+            self.get_hours_of_week_starting, get_mondays(span), self.name()
+        )
         return [
-            NoaTimesheetEntry.parse_obj(entry)
-            for entry in response
-            if "TaskId" in entry
+            Entry(
+                service=self.name(),
+                day=entry.post_date.date(),
+                hours=entry.hours,
+                description=entry.description or "",
+                project=entry.task_phase_name,
+            )
+            for days in weeks.values()
+            for entry in days
+            if entry.hours is not None
+            and span.start_date <= entry.post_date.date() <= span.end_date
         ]
 
-    def get_logged_during_week(self, week: int) -> list[NoaTimesheetEntry]:
-        return [entry for entry in self.get_week_days(week) if entry.hours is not None]
+    def get_logged_during_week(
+        self, week: int, year: Optional[int] = None
+    ) -> list[NoaTimesheetEntry]:
+        return [
+            entry for entry in self.get_week_days(week, year) if entry.hours is not None
+        ]
 
     def get_open_days(self, week: int) -> list[NoaTimesheetEntry]:
         return [entry for entry in self.get_week_days(week) if entry.hours is None]
@@ -141,13 +206,14 @@ def timesheet(
     week: int,
     client: Optional[NoaWorkbook] = None,
     first_day_mask: Optional[date] = None,
+    year: Optional[int] = None,
 ) -> list[NoaTimesheetEntry]:
     if not client:
-        client = NoaWorkbook()
+        client = NoaWorkbook.instance()
 
     result = [
         entry
-        for entry in client.get_logged_during_week(week)
+        for entry in client.get_logged_during_week(week, year)
         if entry.description is not None
     ]
     result.sort(key=lambda entry: entry.post_date)
@@ -176,27 +242,49 @@ def timesheet(
 
 @noa_command.command(name="timesheet")
 @click.argument("week", type=int, default=get_week_number(date.today()))
-def timesheet_week(week: int):
-    timesheet(week)
+@click.option("-y", "--year", type=int, help="Defaults to this year")
+@format_option
+def timesheet_week(week: int, year: Optional[int], output_format: str):
+    if output_format != "text":
+        span = get_week_span(week, year)
+        write_entries(NoaWorkbook.instance().get_entries(span), output_format)
+        return
+
+    timesheet(week, year=year)
+
+
+def prefetch_month(client: NoaWorkbook, span: TimeSpan) -> list[tuple[int, int]]:
+    """Fetch every week of the month at once, returning their (year, week)"""
+    # Log in first, so the prefetching threads share one session
+    client.refresh_session()
+    mondays = get_mondays(span)
+    prefetch(client.get_week_rows, mondays, client.name())
+    return [(monday.isocalendar()[0], monday.isocalendar()[1]) for monday in mondays]
 
 
 @noa_command.command()
 @click.argument("month", type=int, default=datetime.today().month)
+@click.option("-y", "--year", type=int, help="Defaults to this year")
 @click.option("--include-future/--no-include-future", default=False)
-def timesheet_month(month: int, include_future: bool):
-    client = NoaWorkbook()
-    first_day, last_day = get_month_span(month, include_future=include_future)
-    first_week, last_week = get_week_number(first_day), get_week_number(last_day)
-    if first_week > last_week and first_week == 52:
-        first_week = 1
+@format_option
+def timesheet_month(
+    month: int, year: Optional[int], include_future: bool, output_format: str
+):
+    client = NoaWorkbook.instance()
+    span = get_month_span(month, include_future=include_future, year=year)
+    if output_format != "text":
+        write_entries(client.get_entries(span), output_format)
+        return
+
+    first_day = span.start_date
 
     weeks = []
 
-    for week in range(first_week, last_week + 1):
+    for week_year, week in prefetch_month(client, span):
         result = list(
             filter(
                 lambda entry: entry.post_date.month == month,
-                timesheet(week, client, first_day_mask=first_day),
+                timesheet(week, client, first_day_mask=first_day, year=week_year),
             )
         )
         if len(result):
@@ -215,6 +303,20 @@ def timesheet_month(month: int, include_future: bool):
     print(f"[green]Total {first_day.strftime('%b')}:[/green] {month_total}")
 
 
+@noa_command.command()
+@span_options
+def summary(
+    year: Optional[int],
+    from_date: Optional[datetime],
+    to_date: Optional[datetime],
+    include_future: bool,
+):
+    """Totals per week, month and project, for a year or --from/--to"""
+    client = NoaWorkbook.instance()
+    span = resolve_span(year, from_date, to_date, include_future)
+    print_summary(client.name(), Summary.of(span, client.get_entries(span)))
+
+
 def _configure():
     """Configure Noa Workbook"""
     print("[yellow]Please fill in your Noa credentials[/yellow]")
@@ -283,69 +385,206 @@ def hours(hours: float, description: str, date: datetime, weekday: str):
         monday = date - timedelta(days=date.weekday())
         date = monday + timedelta(days=weekday_index)
 
-    client = NoaWorkbook()
+    client = NoaWorkbook.instance()
     client.write_hours(hours, description, date.date())
 
     print("[green]Done![/green]")
 
 
+def build_report(
+    client: NoaWorkbook, year: int, month: int, include_future: bool
+) -> ReportData:
+    """A month's report data, from weeks that were already fetched if possible"""
+    span = get_month_span(month, include_future=include_future, year=year)
+    data = ReportData(name=client.login["Name"], year=year, month=month)
+    for monday in get_mondays(span):
+        entries = sorted(
+            (
+                entry
+                for entry in client.get_hours_of_week_starting(monday)
+                if entry.hours is not None
+                and entry.description is not None
+                and span.start_date <= entry.post_date.date() <= span.end_date
+            ),
+            key=lambda entry: entry.post_date,
+        )
+        if entries:
+            data.weeks[monday.isocalendar()[1]] = ReportWeek(
+                entries=[
+                    ReportEntry(
+                        day=entry.post_date.date(),
+                        hours=entry.hours or 0,
+                        description=entry.description or "",
+                    )
+                    for entry in entries
+                ]
+            )
+
+    return data
+
+
+def parse_months(
+    ctx: click.Context, param: click.Parameter, value: Optional[str]
+) -> Optional[list[int]]:
+    """1-12, or 1,3,5, or a mix like 1-3,7"""
+    if value is None:
+        return None
+
+    months: list[int] = []
+    try:
+        for part in value.split(","):
+            first, _, last = part.partition("-")
+            months.extend(range(int(first), int(last or first) + 1))
+    except ValueError:
+        raise click.BadParameter("expected months like 1-12 or 1,3,5")
+    if not months or not all(1 <= month <= 12 for month in months):
+        raise click.BadParameter("months go from 1 to 12")
+
+    return sorted(set(months))
+
+
+def parse_profiles(
+    ctx: click.Context, param: click.Parameter, value: Optional[str]
+) -> Optional[list[str]]:
+    if value is None:
+        return None
+    return [profile.strip() for profile in value.split(",") if profile.strip()]
+
+
+def write_month_reports(
+    clients: dict[Optional[str], NoaWorkbook],
+    year: int,
+    months: list[int],
+    out_dir: Path,
+    format: str,
+    include_future: bool,
+):
+    """Fetch every week of every month for every client concurrently, then render them
+    all in parallel. Clients are keyed by profile, and a profile's reports go in a
+    directory named after it."""
+    prefetch(
+        lambda client: client.refresh_session(), clients.values(), NoaWorkbook.name()
+    )
+    spans = [
+        get_month_span(month, include_future=include_future, year=year)
+        for month in months
+    ]
+    prefetch(
+        lambda key: key[0].get_week_rows(key[1]),
+        [
+            (client, monday)
+            for client in clients.values()
+            for span in spans
+            for monday in get_mondays(span)
+        ],
+        NoaWorkbook.name(),
+    )
+
+    reports = []
+    for profile, client in clients.items():
+        directory = out_dir / profile if profile else out_dir
+        directory.mkdir(parents=True, exist_ok=True)
+        reports.extend(
+            (
+                build_report(client, year, month, include_future),
+                directory / f"noa-report-{year}-{month:02}.{format}",
+            )
+            for month in months
+        )
+
+    for (data, path), cached in zip(reports, write_reports(reports, format)):
+        print(
+            f"[green]{path}[/green] [bright_black]{data.total:g}h"
+            + (", unchanged, from cache" if cached else "")
+            + "[/bright_black]"
+        )
+
+
 @noa_command.command()
 @click.argument("month", type=int, default=datetime.today().month)
+@click.option("-y", "--year", type=int, help="Defaults to this year")
 @click.option("--include-future/--no-include-future", default=False)
-@click.option("--report")
-def report(month: int, include_future: bool, report: Path | None):
-    client = NoaWorkbook()
-    first_day, last_day = get_month_span(month, include_future=include_future)
-    first_week, last_week = get_week_number(first_day), get_week_number(last_day)
-    if first_week > last_week and first_week == 52:
-        first_week = 1
-
-    class SimplifiedEntry:
-        day: str
-        hours: float
-        description: str
-
-        def __init__(self, entry: NoaTimesheetEntryPartial):
-            self.day = format_date(entry.post_date, format="EEEE", locale="nb_NO")
-            self.hours = entry.hours or 0
-            self.description = entry.description or ""
-
-    @dataclass
-    class Week:
-        entries: list[SimplifiedEntry]
-        total: float
-
-    weeks: dict[int, Week] = {}
-
-    for week in range(first_week, last_week + 1):
-        result: list[NoaTimesheetEntryPartial] = list(
-            filter(
-                lambda entry: entry.post_date.month == month,
-                timesheet(week, client, first_day_mask=first_day),
-            )
+@click.option(
+    "--report",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    help="Write the report to this file",
+)
+@click.option(
+    "-f",
+    "--format",
+    type=click.Choice(FORMATS),
+    help="Report format, guessed from the file extension by default, pdf otherwise",
+)
+@click.option(
+    "-m",
+    "--months",
+    callback=parse_months,
+    help="Write a report for each of these months instead, like 1-12 or 1,3,5",
+)
+@click.option(
+    "-o",
+    "--out-dir",
+    type=click.Path(file_okay=False, writable=True, path_type=Path),
+    default=".",
+    help="Where --months puts its reports",
+)
+@click.option(
+    "-p",
+    "--profiles",
+    callback=parse_profiles,
+    help="Write reports for each of these profiles, like alice,bob, in a directory "
+    "per profile under --out-dir",
+)
+def report(
+    month: int,
+    year: Optional[int],
+    include_future: bool,
+    report: Path | None,
+    format: Optional[str],
+    months: Optional[list[int]],
+    out_dir: Path,
+    profiles: Optional[list[str]],
+):
+    if profiles:
+        clients: dict[Optional[str], NoaWorkbook] = {}
+        for profile in profiles:
+            try:
+                clients[profile] = NoaWorkbook(profile=profile)
+            except ConfigurationException:
+                print(f"[blink]Warning:[/blink] Noa Workbook isn't set up in {profile}")
+        write_month_reports(
+            clients,
+            year or date.today().year,
+            months or [month],
+            out_dir,
+            format or "pdf",
+            include_future,
         )
-        if len(result):
-            weeks[week] = Week(
-                entries=[SimplifiedEntry(entry) for entry in result],
-                total=sum([entry.hours for entry in result if entry.hours is not None]),
-            )
+        return
+
+    client = NoaWorkbook.instance()
+    if months:
+        write_month_reports(
+            {None: client},
+            year or date.today().year,
+            months,
+            out_dir,
+            format or "pdf",
+            include_future,
+        )
+        return
+
+    span = get_month_span(month, include_future=include_future, year=year)
+    first_day = span.start_date
 
-    month_total = sum([week.total for week in weeks.values()])
+    for week_year, week in prefetch_month(client, span):
+        timesheet(week, client, first_day_mask=first_day, year=week_year)
 
     if report:
-        env = Environment(loader=FileSystemLoader(Path(__file__).parent))
-        template = env.get_template("report.html")
-        html_out = template.render(
-            {
-                "weeks": weeks,
-                "month_total": month_total,
-                "month": format_date(first_day, format="MMMM", locale="nb_NO"),
-                "year": first_day.year,
-                "name": client.login["Name"],
-                "total": month_total,
-            }
-        )
-        HTML(string=html_out).write_pdf(report)
+        data = build_report(client, first_day.year, month, include_future)
+        cached = write_report(data, report, format)
+        note = " [bright_black](unchanged, from cache)[/bright_black]" if cached else ""
+        print(f"[green]Report written to {report}[/green]{note}")
 
 
 if __name__ == "__main__":
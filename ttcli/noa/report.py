@@ -0,0 +1,277 @@
+"""Monthly hour reports, as html, csv, json or pdf.
+
+Only pdf needs WeasyPrint, which is slow to import, so it's imported when a pdf is
+actually rendered. Rendered reports are cached on disk keyed by a hash of everything
+that goes into them, so rendering an unchanged month again is a file copy. Many
+reports at once are rendered in a pool of processes, and every file is written
+atomically.
+"""
+
+import csv
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import date
+from functools import cache
+from hashlib import sha256
+from io import StringIO
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Callable, Optional
+
+from appdirs import user_cache_dir
+
+FORMATS = ("pdf", "html", "csv", "json")
+LOCALE = "nb_NO"
+TEMPLATE_DIR = Path(__file__).parent
+TEMPLATE_NAME = "report.html"
+# Bump when a renderer changes, so old cached renders aren't served
+RENDER_VERSION = 1
+RENDER_PROCESSES_KEY = "TTCLI_RENDER_PROCESSES"
+
+
+@dataclass(frozen=True)
+class ReportEntry:
+    day: date
+    hours: float
+    description: str
+
+
+@dataclass
+class ReportWeek:
+    entries: list[ReportEntry] = field(default_factory=list)
+
+    @property
+    def total(self) -> float:
+        return sum(entry.hours for entry in self.entries)
+
+
+@dataclass
+class ReportData:
+    name: str
+    year: int
+    month: int
+    weeks: dict[int, ReportWeek] = field(default_factory=dict)
+
+    @property
+    def total(self) -> float:
+        return sum(week.total for week in self.weeks.values())
+
+    def fingerprint(self) -> str:
+        return sha256(
+            json.dumps(asdict(self), default=str, sort_keys=True).encode()
+        ).hexdigest()
+
+
+@cache
+def format_weekday(day: date) -> str:
+    from babel.dates import format_date
+
+    return format_date(day, format="EEEE", locale=LOCALE)
+
+
+@cache
+def format_month(year: int, month: int) -> str:
+    from babel.dates import format_date
+
+    return format_date(date(year, month, 1), format="MMMM", locale=LOCALE)
+
+
+def cache_dir() -> Path:
+    path = Path(user_cache_dir(appname="tt-cli", appauthor="brbcoffee")) / "reports"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+@cache
+def template():
+    """The report template, compiled once per process. The compiled bytecode is kept
+    on disk too, so other processes skip compiling it"""
+    from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+    bytecode_dir = cache_dir() / "templates"
+    bytecode_dir.mkdir(exist_ok=True)
+    env = Environment(
+        loader=FileSystemLoader(TEMPLATE_DIR),
+        bytecode_cache=FileSystemBytecodeCache(str(bytecode_dir)),
+        auto_reload=False,
+    )
+    return env.get_template(TEMPLATE_NAME)
+
+
+@cache
+def template_hash() -> str:
+    return sha256((TEMPLATE_DIR / TEMPLATE_NAME).read_bytes()).hexdigest()
+
+
+def render_html(data: ReportData) -> bytes:
+    return (
+        template()
+        .render(
+            {
+                "weeks": {
+                    number: {
+                        "entries": [
+                            {
+                                "day": format_weekday(entry.day),
+                                "hours": entry.hours,
+                                "description": entry.description,
+                            }
+                            for entry in week.entries
+                        ],
+                        "total": week.total,
+                    }
+                    for number, week in data.weeks.items()
+                },
+                "month_total": data.total,
+                "month": format_month(data.year, data.month),
+                "year": data.year,
+                "name": data.name,
+                "total": data.total,
+            }
+        )
+        .encode()
+    )
+
+
+def render_pdf(data: ReportData) -> bytes:
+    from weasyprint import HTML
+
+    return HTML(string=render_html(data).decode()).write_pdf()
+
+
+def render_csv(data: ReportData) -> bytes:
+    out = StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["week", "date", "day", "hours", "description"])
+    for number, week in data.weeks.items():
+        for entry in week.entries:
+            writer.writerow(
+                [
+                    number,
+                    entry.day.isoformat(),
+                    format_weekday(entry.day),
+                    entry.hours,
+                    entry.description,
+                ]
+            )
+    return out.getvalue().encode()
+
+
+def render_json(data: ReportData) -> bytes:
+    return json.dumps(
+        {
+            "name": data.name,
+            "year": data.year,
+            "month": data.month,
+            "total": data.total,
+            "weeks": [
+                {
+                    "week": number,
+                    "total": week.total,
+                    "entries": [
+                        {
+                            "date": entry.day.isoformat(),
+                            "hours": entry.hours,
+                            "description": entry.description,
+                        }
+                        for entry in week.entries
+                    ],
+                }
+                for number, week in data.weeks.items()
+            ],
+        },
+        indent=2,
+        ensure_ascii=False,
+    ).encode()
+
+
+RENDERERS: dict[str, Callable[[ReportData], bytes]] = {
+    "pdf": render_pdf,
+    "html": render_html,
+    "csv": render_csv,
+    "json": render_json,
+}
+
+
+def format_for(path: Path, format: Optional[str] = None) -> str:
+    """An explicit format, or the one the file extension says, or pdf"""
+    if format:
+        return format
+    suffix = path.suffix.lstrip(".").lower()
+    return suffix if suffix in FORMATS else "pdf"
+
+
+def cache_key(data: ReportData, format: str) -> str:
+    parts = [data.fingerprint(), format, str(RENDER_VERSION), LOCALE]
+    if format in ("html", "pdf"):
+        parts.append(template_hash())
+    return sha256("|".join(parts).encode()).hexdigest()
+
+
+def write_atomically(path: Path, content: bytes):
+    """Readers see the old file or the new one, never half of one"""
+    prefix = f".{path.name}."
+    with NamedTemporaryFile(dir=path.parent, prefix=prefix, delete=False) as tmp:
+        try:
+            tmp.write(content)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+    os.replace(tmp.name, path)
+
+
+def cached_render(data: ReportData, format: str) -> Optional[bytes]:
+    cached = cache_dir() / f"{cache_key(data, format)}.{format}"
+    return cached.read_bytes() if cached.exists() else None
+
+
+def render(data: ReportData, format: str) -> bytes:
+    """Render and put the result in the render cache"""
+    rendered = RENDERERS[format](data)
+    write_atomically(cache_dir() / f"{cache_key(data, format)}.{format}", rendered)
+    return rendered
+
+
+def write_report(data: ReportData, path: Path, format: Optional[str] = None) -> bool:
+    """Render the report to path, returning whether it came from the render cache"""
+    format = format_for(path, format)
+    rendered = cached_render(data, format)
+    write_atomically(path, rendered or render(data, format))
+    return rendered is not None
+
+
+def write_reports(
+    reports: list[tuple[ReportData, Path]], format: Optional[str] = None
+) -> list[bool]:
+    """Like `write_report` for many reports at once. Rendering is cpu bound, pdfs in
+    particular, so whatever isn't cached is rendered in a pool of processes."""
+    formats = [format_for(path, format) for _, path in reports]
+    cached = [cached_render(data, fmt) for (data, _), fmt in zip(reports, formats)]
+    missing = [i for i, rendered in enumerate(cached) if rendered is None]
+
+    if len(missing) > 1:
+        workers = int(os.getenv(RENDER_PROCESSES_KEY, 0)) or os.cpu_count() or 1
+        # Not forked, the scheduler, keyring and session refresh threads may be
+        # holding locks the children would inherit held
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(missing)),
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            rendered = executor.map(
+                render,
+                [reports[i][0] for i in missing],
+                [formats[i] for i in missing],
+            )
+            fresh = dict(zip(missing, rendered))
+    else:
+        fresh = {i: render(reports[i][0], formats[i]) for i in missing}
+
+    for i, (_, path) in enumerate(reports):
+        write_atomically(path, cached[i] or fresh[i])
+
+    return [rendered is not None for rendered in cached]
@@ -41,7 +41,12 @@ class NoaTimesheetEntryPartial(BaseModel):
     description: Optional[str] = None
     has_approved_resource_initals: Optional[str] = None
     hours: Optional[float] = None
-    model_config = ConfigDict(alias_generator=camelize, populate_by_name=True, extra="forbid")
+    model_config = ConfigDict(
+        alias_generator=camelize,
+        populate_by_name=True,
+        extra="forbid",
+        defer_build=True,
+    )
 
 
 class NoaTimesheetEntry(NoaTimesheetEntryPartial):
@@ -79,4 +84,18 @@ class NoaDateVisualization(BaseModel):
     task_hours_time_registration: float
     task_id: int
     task_phase_name: str
-    model_config = ConfigDict(alias_generator=camelize, populate_by_name=True)
+    model_config = ConfigDict(
+        alias_generator=camelize, populate_by_name=True, defer_build=True
+    )
+
+
+class NoaLoggedHours(BaseModel):
+    """Just what summaries, exports and reports need from a timesheet entry"""
+
+    post_date: datetime
+    description: Optional[str] = None
+    hours: Optional[float] = None
+    task_phase_name: Optional[str] = None
+    model_config = ConfigDict(
+        alias_generator=camelize, populate_by_name=True, defer_build=True
+    )
@@ -0,0 +1,478 @@
+"""A durable outbox for writes to the timesheet services.
+
+Writes are journaled to the local database before anything is sent, one row per
+service, so a slow or unavailable service never loses hours. Writing the same day to
+the same service again before it was delivered replaces the earlier write. A flush
+delivers due items grouped by service, retrying failed deliveries with exponential
+backoff until they either succeed or run out of attempts. Writes to a service whose
+circuit is open (see `ttcli.health`) wait for it without using attempts. Items belong
+to the profile that was current when they were queued, and are only delivered with
+that profile's credentials.
+"""
+
+import subprocess
+import sys
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from time import monotonic
+from typing import Iterable, Iterator, Optional, Sequence, Union
+
+import click
+from click_help_colors import HelpColorsGroup
+from rich.table import Table as RichTable
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Date,
+    DateTime,
+    Float,
+    Integer,
+    String,
+    Table,
+    Text,
+    delete,
+    select,
+    update,
+)
+
+from ttcli.ApiClient import ApiClient, ConfigurationException, get_service_by_name
+from ttcli.config.reader import current_profile
+from ttcli.db import Session, mapper_registry
+from ttcli.health import breaker_for
+from ttcli.migrations import get_db_location, requires_db
+from ttcli.output import print
+from ttcli.scheduler import submit_all
+from ttcli.utils import prefetch
+
+PENDING = "pending"
+DELIVERED = "delivered"
+FAILED = "failed"
+
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = timedelta(seconds=30)
+BACKOFF_MAX = timedelta(hours=6)
+KEEP_DELIVERED = timedelta(days=7)
+
+
+@mapper_registry.mapped
+@dataclass
+class OutboxItem:
+    __table__ = Table(
+        "outbox",
+        mapper_registry.metadata,
+        Column("id", Integer, primary_key=True),
+        Column("profile", String(50), nullable=False),
+        Column("service", String(50), nullable=False),
+        Column("day", Date, nullable=False),
+        Column("hours", Float, nullable=False),
+        Column("description", Text, nullable=False),
+        Column("lock", Boolean, nullable=False),
+        Column("state", String(16), nullable=False),
+        Column("attempts", Integer, nullable=False),
+        Column("next_attempt_at", DateTime, nullable=False),
+        Column("last_error", Text, nullable=True),
+        Column("created_at", DateTime, nullable=False),
+        Column("updated_at", DateTime, nullable=False),
+    )
+    service: str
+    day: date
+    hours: float
+    description: str
+    lock: bool
+    state: str = PENDING
+    attempts: int = 0
+    next_attempt_at: datetime = field(default_factory=datetime.now)
+    last_error: Optional[str] = None
+    created_at: datetime = field(default_factory=datetime.now)
+    updated_at: datetime = field(default_factory=datetime.now)
+    id: Optional[int] = None
+    profile: str = field(default_factory=current_profile)
+
+
+def backoff(attempts: int) -> timedelta:
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+@requires_db
+def enqueue(service: str, day: date, hours: float, description: str, lock: bool):
+    """Journal a write for the current profile, replacing any undelivered write for
+    the same service and day"""
+    now = datetime.now()
+    # Updating first takes the write lock right away, so two processes queueing the
+    # same day can't both decide to insert it
+    with Session() as session:
+        updated = session.execute(
+            update(OutboxItem)
+            .where(
+                OutboxItem.state == PENDING,
+                OutboxItem.profile == current_profile(),
+                OutboxItem.service == service,
+                OutboxItem.day == day,
+            )
+            .values(
+                hours=hours,
+                description=description,
+                lock=lock,
+                attempts=0,
+                next_attempt_at=now,
+                last_error=None,
+                updated_at=now,
+            )
+        )
+        if updated.rowcount == 0:
+            session.add(OutboxItem(service, day, hours, description, lock))
+
+        session.commit()
+
+
+@requires_db
+def read_items(states: Sequence[str]) -> Sequence[OutboxItem]:
+    """The current profile's items in any of the states"""
+    with Session() as session:
+        result = session.execute(
+            select(OutboxItem)
+            .where(
+                OutboxItem.state.in_(states),
+                OutboxItem.profile == current_profile(),
+            )
+            .order_by(OutboxItem.service, OutboxItem.day)
+        )
+        return result.scalars().all()
+
+
+@contextmanager
+def flush_lock() -> Iterator[bool]:
+    """Only one process flushes at a time, so nothing is delivered twice.
+    Yields whether we got the lock."""
+    try:
+        import fcntl
+    except ImportError:
+        yield True
+        return
+
+    location = Path(get_db_location().removeprefix("sqlite:///")).parent
+    with (location / "outbox.lock").open("w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@dataclass
+class PendingWrite:
+    """The parts of an item a delivering thread needs. Items themselves belong to the
+    flushing thread's database session."""
+
+    day: date
+    hours: float
+    description: str
+    lock: bool
+
+
+# Returned for writes that weren't started because the deadline passed
+SKIPPED = object()
+
+
+def _deliver(write: PendingWrite, client: ApiClient, give_up_at: Optional[float]):
+    if give_up_at is not None and monotonic() > give_up_at:
+        return SKIPPED
+
+    client.write_hours(write.hours, write.description, write.day)
+    if write.lock:
+        client.lock_day(day=write.day)
+    return None
+
+
+# ConfigurationException isn't an Exception, but is as much a failed write as one
+WriteError = Union[Exception, ConfigurationException]
+
+
+def _login(client: ApiClient) -> Optional[WriteError]:
+    try:
+        client.refresh_session()
+        return None
+    except (Exception, ConfigurationException) as e:
+        return e
+
+
+def _failed_attempt(item: OutboxItem, error: WriteError, verbose: bool):
+    if isinstance(error, ConfigurationException):
+        item.state, item.last_error = FAILED, error.message
+        if verbose:
+            print(f"[blink]Warning:[/blink] {error.message}")
+        return
+
+    item.last_error = str(error) or error.__class__.__name__
+    if item.attempts >= MAX_ATTEMPTS:
+        item.state = FAILED
+    else:
+        item.next_attempt_at = datetime.now() + backoff(item.attempts)
+    if verbose:
+        print(
+            f"[yellow]Writing {item.day.isoformat()} to {item.service}[/yellow] "
+            f"[red]Failed[/red]: {item.last_error}"
+        )
+
+
+@requires_db
+def flush(
+    deadline: Optional[float] = None,
+    verbose: bool = True,
+    clients: Optional[dict[str, ApiClient]] = None,
+) -> int:
+    """Deliver due writes, giving up on starting new ones after `deadline` seconds.
+    Clients the caller already has can be passed by service name, to be reused.
+    Every service is logged in to at once, and their writes are submitted to the
+    scheduler, which delivers them as fast as each service allows.
+    Returns how many writes are still pending."""
+    clients = dict(clients or {})
+    give_up_at = None if deadline is None else monotonic() + deadline
+
+    with flush_lock() as locked:
+        if not locked:
+            if verbose:
+                print("[yellow]Another process is already delivering writes[/yellow]")
+            return len(read_items([PENDING]))
+
+        with Session() as session:
+            due = (
+                session.execute(
+                    select(OutboxItem)
+                    .where(
+                        OutboxItem.state == PENDING,
+                        OutboxItem.profile == current_profile(),
+                        OutboxItem.next_attempt_at <= datetime.now(),
+                    )
+                    .order_by(OutboxItem.service, OutboxItem.day)
+                )
+                .scalars()
+                .all()
+            )
+
+            by_service: dict[str, list[OutboxItem]] = {}
+            for item in due:
+                by_service.setdefault(item.service, []).append(item)
+
+            for service, items in list(by_service.items()):
+                try:
+                    if service not in clients:
+                        clients[service] = get_service_by_name(service).instance()
+                except (ConfigurationException, KeyError) as e:
+                    message = getattr(e, "message", f"Unknown service {service}")
+                    for item in items:
+                        item.state, item.last_error = FAILED, message
+                        item.updated_at = datetime.now()
+                    session.commit()
+                    if verbose:
+                        print(f"[blink]Warning:[/blink] {service}: {message}")
+                    del by_service[service]
+
+            # A service that's known to be down isn't even tried, its writes stay
+            # pending without using up an attempt
+            for service in list(by_service):
+                until = breaker_for(service).unavailable_until()
+                if until is not None:
+                    if verbose:
+                        print(
+                            f"[yellow]{service} is unavailable[/yellow], its writes "
+                            f"stay queued until at least {until.strftime('%H:%M:%S')}"
+                        )
+                    del by_service[service]
+
+            # Logging in first means the writes to a service share one session
+            logins = prefetch(
+                lambda service: _login(clients[service]), list(by_service)
+            )
+            futures = {
+                service: submit_all(
+                    service,
+                    lambda write, client=clients[service]: _deliver(
+                        write, client, give_up_at
+                    ),
+                    [
+                        PendingWrite(item.day, item.hours, item.description, item.lock)
+                        for item in items
+                    ],
+                )
+                for service, items in by_service.items()
+                if logins[service] is None
+            }
+
+            for service, items in by_service.items():
+                login_error = logins[service]
+                for i, item in enumerate(items):
+                    if login_error is not None:
+                        outcome, error = None, login_error
+                    else:
+                        try:
+                            outcome, error = futures[service][i].result(), None
+                        except (Exception, ConfigurationException) as e:
+                            outcome, error = None, e
+                    if outcome is SKIPPED:
+                        continue
+
+                    item.attempts += 1
+                    item.updated_at = datetime.now()
+                    if error is not None:
+                        _failed_attempt(item, error, verbose)
+                    else:
+                        item.state, item.last_error = DELIVERED, None
+                        if verbose:
+                            print(
+                                f"[yellow]Writing {item.day.isoformat()} to "
+                                f"{item.service}[/yellow] [green]Done[/green]"
+                            )
+                            if item.lock:
+                                print(
+                                    f"[yellow]Locking {item.day.isoformat()} in "
+                                    f"{item.service}[/yellow] [green]Done[/green]"
+                                )
+                    session.commit()
+
+            session.execute(
+                delete(OutboxItem).where(
+                    OutboxItem.state == DELIVERED,
+                    OutboxItem.updated_at < datetime.now() - KEEP_DELIVERED,
+                )
+            )
+            session.commit()
+
+    return len(read_items([PENDING]))
+
+
+def flush_in_background():
+    """Deliver pending writes from a detached process, so the caller can exit"""
+    subprocess.Popen(
+        [sys.executable, "-m", "ttcli.main", "queue", "flush", "--quiet"],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def deliver(services: Iterable[ApiClient], deadline: Optional[float], background: bool):
+    if background:
+        flush_in_background()
+        print("[green]Queued[/green], delivering in the background")
+        return
+
+    clients = {service.name(): service for service in services}
+    pending = flush(deadline=deadline, clients=clients)
+    if pending:
+        print(
+            f"[yellow]{pending} write(s) still queued[/yellow], "
+            "see [cyan]tt-cli queue[/cyan]"
+        )
+
+
+def delivery_options(func):
+    """How long to wait for writes to be delivered, shared by the write commands"""
+    func = click.option(
+        "--background",
+        is_flag=True,
+        default=False,
+        help="Queue the writes and deliver them from a background process",
+    )(func)
+    return click.option(
+        "--deadline",
+        type=float,
+        help="Stop delivering after N seconds, leaving the rest queued",
+    )(func)
+
+
+@click.group(
+    cls=HelpColorsGroup,
+    help_headers_color="yellow",
+    help_options_color="green",
+    invoke_without_command=True,
+)
+@click.pass_context
+def queue_command(ctx: click.Context):
+    """Writes waiting to be delivered, or that failed to be.
+
+    Without a subcommand, lists pending and failed writes.
+    """
+    if ctx.invoked_subcommand is not None:
+        return
+
+    items = read_items([PENDING, FAILED])
+    if not items:
+        print("[green]Nothing queued[/green]")
+        return
+
+    table = RichTable()
+    table.add_column("Id", style="bright_black", justify="right")
+    table.add_column("Service", style="cyan")
+    table.add_column("Date")
+    table.add_column("Hours", justify="right")
+    table.add_column("Description")
+    table.add_column("State")
+    table.add_column("Attempts", justify="right")
+    table.add_column("Next attempt / error")
+    for item in items:
+        failed = item.state == FAILED
+        table.add_row(
+            str(item.id),
+            item.service,
+            item.day.isoformat(),
+            str(item.hours),
+            item.description,
+            f"[red]{item.state}[/red]" if failed else f"[yellow]{item.state}[/yellow]",
+            str(item.attempts),
+            (
+                (item.last_error or "")
+                if failed
+                else item.next_attempt_at.strftime("%Y-%m-%d %H:%M:%S")
+            ),
+        )
+    print(table)
+
+
+@queue_command.command(name="flush")
+@click.option("--deadline", type=float, help="Stop starting new writes after N seconds")
+@click.option("-q", "--quiet", is_flag=True, default=False)
+def flush_cmd(deadline: Optional[float], quiet: bool):
+    """Deliver pending writes now"""
+    pending = flush(deadline=deadline, verbose=not quiet)
+    if pending and not quiet:
+        print(f"[yellow]{pending} write(s) still pending[/yellow]")
+
+
+@queue_command.command(name="retry")
+@click.argument("ids", type=int, nargs=-1)
+@requires_db
+def retry_cmd(ids: tuple[int, ...]):
+    """Move failed writes back to pending, all of them unless IDS are given"""
+    with Session() as session:
+        query = select(OutboxItem).where(
+            OutboxItem.state == FAILED, OutboxItem.profile == current_profile()
+        )
+        if ids:
+            query = query.where(OutboxItem.id.in_(ids))
+        for item in session.execute(query).scalars():
+            item.state, item.attempts = PENDING, 0
+            item.next_attempt_at = item.updated_at = datetime.now()
+        session.commit()
+
+
+@queue_command.command(name="drop")
+@click.argument("ids", type=int, nargs=-1, required=True)
+@requires_db
+def drop_cmd(ids: tuple[int, ...]):
+    """Forget about queued writes without delivering them"""
+    with Session() as session:
+        session.execute(
+            delete(OutboxItem).where(
+                OutboxItem.id.in_(ids), OutboxItem.profile == current_profile()
+            )
+        )
+        session.commit()
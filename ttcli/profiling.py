@@ -0,0 +1,124 @@
+"""Profile any command without editing code.
+
+TTCLI_PROFILER=cprofile writes a pstats file, readable with `python -m pstats` or
+snakeviz. TTCLI_PROFILER=sample runs a sampling profiler in a background thread and
+writes collapsed stacks, which flamegraph.pl, speedscope and inferno all understand.
+Files go to TTCLI_PROFILER_DIR, or the user cache directory, named after the
+subcommand and the time it ran.
+"""
+
+import sys
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from os import getenv
+from pathlib import Path
+from threading import Event, Thread, get_ident
+from typing import Callable, Iterator
+
+PROFILER_KEY = "TTCLI_PROFILER"
+PROFILER_DIR_KEY = "TTCLI_PROFILER_DIR"
+PROFILER_INTERVAL_KEY = "TTCLI_PROFILER_INTERVAL"
+
+_active = False
+
+
+def profile_dir() -> Path:
+    if directory := getenv(PROFILER_DIR_KEY):
+        path = Path(directory)
+    else:
+        from appdirs import user_cache_dir
+
+        cache_dir = user_cache_dir(appname="tt-cli", appauthor="brbcoffee")
+        path = Path(cache_dir) / "profiles"
+
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def output_path(name: str, suffix: str) -> Path:
+    timestamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+    return profile_dir() / f"{name}-{timestamp}.{suffix}"
+
+
+class Sampler:
+    """Samples the stack of the thread that started it at a fixed interval"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self._thread_id = get_ident()
+        self._stop = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def frame_label(frame) -> str:
+        code = frame.f_code
+        filename = Path(code.co_filename).name
+        return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(self.frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path: Path):
+        with path.open("w") as collapsed:
+            for stack, count in self.stacks.most_common():
+                collapsed.write(f"{stack} {count}\n")
+
+
+def profiling_requested() -> bool:
+    return getenv(PROFILER_KEY, "").lower() in ("cprofile", "sample")
+
+
+@contextmanager
+def profile(name: Callable[[], str]) -> Iterator[None]:
+    """Profile the enclosed block if TTCLI_PROFILER asks for it.
+
+    `name` is called once the block is done, so it can depend on what ran.
+    Nested uses only profile the outermost block.
+    """
+    global _active
+    mode = getenv(PROFILER_KEY, "").lower()
+    if _active or not profiling_requested():
+        yield
+        return
+
+    _active = True
+    if mode == "cprofile":
+        from cProfile import Profile
+
+        profiler = Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            _active = False
+            path = output_path(name(), "pstats")
+            profiler.dump_stats(path)
+            print(f"cProfile stats written to {path}", file=sys.stderr)
+    else:
+        sampler = Sampler(float(getenv(PROFILER_INTERVAL_KEY, 0.005)))
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            _active = False
+            path = output_path(name(), "collapsed")
+            sampler.write(path)
+            print(f"Collapsed stacks written to {path}", file=sys.stderr)
@@ -0,0 +1,256 @@
+"""Find days where the services disagree about what was logged, and optionally fix them.
+
+Entries are fetched in bulk for the whole range, one range query per service where the
+service allows it, and compared locally day by day.
+
+Fixing only fills in days a service has nothing for. Writing to a day that already has
+hours adds to them in some services instead of replacing them, so days with different
+hours or descriptions are left for the user to fix by hand.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Optional
+
+import click
+from click_help_colors import HelpColorsCommand
+from rich.table import Table
+
+from ttcli.ApiClient import get_configured_services_instances
+from ttcli.completion import complete_configured_services
+from ttcli.outbox import deliver, delivery_options, enqueue
+from ttcli.output import print
+from ttcli.store import DAY, SERVICE, EntryStore
+from ttcli.timesheet import Timesheet, fetch_timesheet
+from ttcli.utils import TimeSpan
+
+# Hours are floats, and some services round them
+HOURS_TOLERANCE = 0.01
+
+MISSING = "missing"
+HOURS = "hours differ"
+DESCRIPTION = "description differs"
+
+
+@dataclass
+class DayLog:
+    """What a single service has for a single day"""
+
+    hours: float
+    description: str
+
+    @classmethod
+    def from_rows(cls, store: EntryStore, rows: list[int]) -> "DayLog":
+        return cls(
+            hours=store.total(rows),
+            description="; ".join(store.descriptions_of(rows)),
+        )
+
+    def same_hours(self, other: "DayLog") -> bool:
+        return abs(self.hours - other.hours) < HOURS_TOLERANCE
+
+    def same_description(self, other: "DayLog") -> bool:
+        return normalize(self.description) == normalize(other.description)
+
+
+@dataclass
+class Discrepancy:
+    day: date
+    logs: dict[str, Optional[DayLog]]
+    problems: list[str]
+
+    def missing(self, source: str) -> list[str]:
+        """Services with nothing for a day the source has hours for"""
+        if self.logs[source] is None:
+            return []
+
+        return [
+            service
+            for service, log in self.logs.items()
+            if service != source and log is None
+        ]
+
+    def differing(self, source: str) -> list[str]:
+        """Services with hours for the day that don't agree with the source's"""
+        reference = self.logs[source]
+        if reference is None:
+            return []
+
+        return [
+            service
+            for service, log in self.logs.items()
+            if service != source
+            and log is not None
+            and (not log.same_hours(reference) or not log.same_description(reference))
+        ]
+
+
+def normalize(description: str) -> str:
+    return " ".join(description.split()).casefold()
+
+
+def index_by_day(timesheet: Timesheet) -> dict[date, dict[str, DayLog]]:
+    store = timesheet.store
+    by_day: dict[date, dict[str, DayLog]] = defaultdict(dict)
+    for (day, service), rows in store.rows_by(DAY, SERVICE).items():
+        by_day[day][service] = DayLog.from_rows(store, rows)
+
+    return by_day
+
+
+def reconcile(timesheet: Timesheet) -> list[Discrepancy]:
+    services = timesheet.services
+    discrepancies = []
+    for day, logs in sorted(index_by_day(timesheet).items()):
+        present = list(logs.values())
+        problems = []
+        if len(logs) < len(services):
+            problems.append(MISSING)
+        if any(not log.same_hours(present[0]) for log in present[1:]):
+            problems.append(HOURS)
+        described = [log for log in present if log.description]
+        if any(not log.same_description(described[0]) for log in described[1:]):
+            problems.append(DESCRIPTION)
+
+        if problems:
+            discrepancies.append(
+                Discrepancy(
+                    day=day,
+                    logs={service: logs.get(service) for service in services},
+                    problems=problems,
+                )
+            )
+
+    return discrepancies
+
+
+def render_discrepancies(services: list[str], discrepancies: list[Discrepancy]):
+    table = Table(show_lines=True)
+    table.add_column("Day", style="green")
+    for service in services:
+        table.add_column(service)
+    table.add_column("Problem", style="red")
+
+    for discrepancy in discrepancies:
+        cells = []
+        for service in services:
+            log = discrepancy.logs[service]
+            if log is None:
+                cells.append("[red]–[/red]")
+            else:
+                cells.append(f"[yellow]{log.hours}[/yellow]: {log.description}")
+        table.add_row(
+            f"{discrepancy.day.strftime('%A')}\n"
+            f"[bright_black]{discrepancy.day.isoformat()}[/bright_black]",
+            *cells,
+            ", ".join(discrepancy.problems),
+        )
+
+    print(table)
+
+
+@click.command(
+    cls=HelpColorsCommand, help_headers_color="yellow", help_options_color="green"
+)
+@click.option(
+    "--from",
+    "from_date",
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    required=True,
+    help="First day to compare",
+)
+@click.option(
+    "--to",
+    "to_date",
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    help="Last day to compare, defaults to today",
+)
+@click.option(
+    "--fix",
+    is_flag=True,
+    default=False,
+    help="Write the source service's hours to the services missing them",
+)
+@click.option(
+    "-s",
+    "--source",
+    shell_complete=complete_configured_services,
+    help="The service to trust when fixing",
+)
+@click.option("--lock/--no-lock", default=False, help="Lock the days that get fixed")
+@delivery_options
+def reconcile_command(
+    from_date: datetime,
+    to_date: Optional[datetime],
+    fix: bool,
+    source: Optional[str],
+    lock: bool,
+    deadline: Optional[float],
+    background: bool,
+):
+    """Compare what every configured service has logged, day by day.
+
+    Reports days where a service is missing hours, or where the hours or descriptions
+    don't match. With --fix, days missing from a service are written to it from
+    --source. Days where a service has other hours or descriptions are only listed, to
+    be fixed by hand.
+    """
+    span = TimeSpan(from_date.date(), to_date.date() if to_date else date.today())
+    if span.end_date < span.start_date:
+        raise click.BadParameter("--to can't be before --from")
+
+    services = get_configured_services_instances()
+    names = [service.name() for service in services]
+    if fix and source not in names:
+        raise click.BadParameter(
+            f"--fix needs a --source, one of {', '.join(names)}", param_hint="--source"
+        )
+
+    timesheet = fetch_timesheet(span, services)
+    for service, error in timesheet.errors.items():
+        print(f"[blink]Warning:[/blink] couldn't fetch {service}, skipping it: {error}")
+    if len(timesheet.services) < 2:
+        print("[yellow]Need at least two services to compare[/yellow]")
+        return
+
+    discrepancies = reconcile(timesheet)
+    if not discrepancies:
+        print(
+            f"[green]All services agree from {span.start_date.isoformat()} "
+            f"to {span.end_date.isoformat()}[/green]"
+        )
+        return
+
+    render_discrepancies(timesheet.services, discrepancies)
+    print(f"[red]{len(discrepancies)} day(s) disagree[/red]")
+    if not fix or source is None:
+        return
+
+    if source in timesheet.errors:
+        print(f"[red]Can't fix from {source}, it couldn't be fetched[/red]")
+        return
+
+    fixing = 0
+    for discrepancy in discrepancies:
+        reference = discrepancy.logs[source]
+        if reference is None:
+            continue
+        for service in discrepancy.missing(source):
+            enqueue(
+                service,
+                discrepancy.day,
+                reference.hours,
+                reference.description,
+                lock,
+            )
+            fixing += 1
+        # Writing would add to what's there in some services, not replace it
+        for service in discrepancy.differing(source):
+            print(
+                f"[yellow]{discrepancy.day.isoformat()} in {service}[/yellow] differs "
+                f"from {source}, fix it by hand"
+            )
+
+    if fixing:
+        deliver(services, deadline, background)
@@ -0,0 +1,127 @@
+"""Totals per week, month and project over a year or any other span"""
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Iterable, Optional
+
+import click
+from rich.table import Table
+
+from ttcli.output import print
+from ttcli.store import MONTH, PROJECT, WEEK, EntryStore
+from ttcli.utils import Entry, TimeSpan, get_month_span, get_week_span
+
+
+@dataclass
+class Summary:
+    span: TimeSpan
+    by_week: dict[tuple[int, int], float] = field(default_factory=dict)
+    by_month: dict[tuple[int, int], float] = field(default_factory=dict)
+    by_project: dict[str, float] = field(default_factory=dict)
+    total: float = 0.0
+
+    @classmethod
+    def of(cls, span: TimeSpan, entries: Iterable[Entry] | EntryStore) -> "Summary":
+        store = (
+            entries
+            if isinstance(entries, EntryStore)
+            else EntryStore.from_entries(entries)
+        )
+        store = store.within(span)
+        by_project: dict[str, float] = defaultdict(float)
+        for project, hours in store.hours_by(PROJECT).items():
+            by_project[project or "None"] += hours
+
+        return cls(
+            span=span,
+            by_week=dict(sorted(store.hours_by(WEEK).items())),
+            by_month=dict(sorted(store.hours_by(MONTH).items())),
+            by_project=dict(sorted(by_project.items(), key=lambda item: -item[1])),
+            total=store.total(),
+        )
+
+
+def resolve_span(
+    year: Optional[int],
+    from_date: Optional[datetime],
+    to_date: Optional[datetime],
+    include_future: bool,
+    week: Optional[int] = None,
+    month: Optional[int] = None,
+    this_week_by_default: bool = False,
+) -> TimeSpan:
+    """--from/--to if either is given, otherwise --month or --week of --year, or the
+    whole of --year. Without any of them that's this year, or this week if
+    this_week_by_default."""
+    today = date.today()
+    if from_date is not None or to_date is not None:
+        start = from_date.date() if from_date else today
+        end = to_date.date() if to_date else today
+        if end < start:
+            raise click.BadParameter("--to can't be before --from")
+        return TimeSpan(start, end)
+
+    if month is not None:
+        return get_month_span(month, include_future=include_future, year=year)
+
+    if week is not None:
+        return get_week_span(week, year)
+
+    if year is None and this_week_by_default:
+        return TimeSpan(today - timedelta(days=today.weekday()), today)
+
+    year = year or today.year
+    last_day = date(year, 12, 31)
+    if not include_future:
+        last_day = min(last_day, today)
+    return TimeSpan(date(year, 1, 1), last_day)
+
+
+def span_options(func):
+    """--year, --from, --to and --include-future, see `resolve_span`"""
+    func = click.option("--include-future/--no-include-future", default=False)(func)
+    func = click.option(
+        "--to",
+        "to_date",
+        type=click.DateTime(formats=["%Y-%m-%d"]),
+        help="Last day of the span, defaults to today",
+    )(func)
+    func = click.option(
+        "--from",
+        "from_date",
+        type=click.DateTime(formats=["%Y-%m-%d"]),
+        help="First day of the span, instead of a whole year",
+    )(func)
+    return click.option("-y", "--year", type=int, help="Defaults to this year")(func)
+
+
+def print_summary(service: str, summary: Summary):
+    span = summary.span
+    print(
+        f"[yellow bold]{service} from {span.start_date.isoformat()} "
+        f"to {span.end_date.isoformat()}[/yellow bold]"
+    )
+
+    weeks = Table(title="Per week", title_justify="left")
+    weeks.add_column("Week", style="green")
+    weeks.add_column("Hours", justify="right")
+    for (year, week), hours in summary.by_week.items():
+        weeks.add_row(f"{year}-w{week:02}", f"{hours:g}")
+
+    months = Table(title="Per month", title_justify="left")
+    months.add_column("Month", style="green")
+    months.add_column("Hours", justify="right")
+    for (year, month), hours in summary.by_month.items():
+        months.add_row(date(year, month, 1).strftime("%b %Y"), f"{hours:g}")
+
+    projects = Table(title="Per project", title_justify="left")
+    projects.add_column("Project", style="green")
+    projects.add_column("Hours", justify="right")
+    for project, hours in summary.by_project.items():
+        projects.add_row(project, f"{hours:g}")
+
+    print(weeks)
+    print(months)
+    print(projects)
+    print(f"[green]Total:[/green] {summary.total:g}h")
@@ -0,0 +1,262 @@
+"""Pacing of the http requests made to each service.
+
+Every service and host gets one `HostScheduler`, shared by every client in the
+process, which holds requests back so a batch goes as fast as the service allows
+without tripping its limits:
+
+* A token bucket lets through TTCLI_RATE_LIMIT requests per second (default 25),
+  with bursts of as many.
+* An adaptive limit on requests in flight starts at TTCLI_FETCH_CONCURRENCY
+  (default 4). It grows by one for every round of responses with healthy latency,
+  up to TTCLI_MAX_CONCURRENCY (default 16), and halves on 429 or 5xx (AIMD).
+* A 429 or 503 with Retry-After pauses the host for that long, after which the
+  request is sent again.
+
+`SchedulingAdapter` does this below the session, wrapping whatever transport adapter
+is mounted, a cassette's included. Batch work is handed to `submit_all`, which runs
+it on a pool per service as wide as the limit can grow, and leaves it to the adapter
+how many requests are actually out at once.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from os import getenv
+from threading import Condition, Lock, current_thread
+from time import monotonic, sleep, time
+from typing import Callable, Iterable, Optional, TypeVar
+from urllib.parse import urlsplit
+
+from requests import PreparedRequest, Response, Session
+from requests.adapters import BaseAdapter
+
+from ttcli.utils import FETCH_CONCURRENCY_KEY
+
+RATE_LIMIT_KEY = "TTCLI_RATE_LIMIT"
+MAX_CONCURRENCY_KEY = "TTCLI_MAX_CONCURRENCY"
+
+# Statuses that mean the service wants us to slow down
+BACKOFF_STATUSES = {429, 500, 502, 503, 504}
+# Statuses after which a request can safely be sent again, it wasn't processed
+RETRY_STATUSES = {429, 503}
+MAX_RETRIES = 3
+# Longer waits than this are left to the caller, like the outbox's backoff
+MAX_RETRY_AFTER = 60.0
+# A response slower than this many times the usual latency isn't healthy
+LATENCY_TOLERANCE = 2.0
+
+K = TypeVar("K")
+R = TypeVar("R")
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = monotonic()
+        self._lock = Lock()
+
+    def take(self):
+        """Wait for a token"""
+        while True:
+            with self._lock:
+                now = monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            sleep(wait)
+
+
+class AdaptiveLimit:
+    """How many requests may be in flight, adjusted by additive increase and
+    multiplicative decrease"""
+
+    def __init__(self, initial: int, maximum: int):
+        self.limit = max(1, min(initial, maximum))
+        self.maximum = maximum
+        self.in_flight = 0
+        self.healthy = 0
+        # The latency of a healthy response, creeping towards what's typical
+        self.baseline: Optional[float] = None
+        self.last_decrease = 0.0
+        self._condition = Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def succeeded(self, latency: float):
+        with self._condition:
+            if self.baseline is None or latency < self.baseline:
+                self.baseline = latency
+            else:
+                self.baseline += (latency - self.baseline) * 0.01
+
+            if latency > self.baseline * LATENCY_TOLERANCE:
+                return
+            self.healthy += 1
+            if self.healthy >= self.limit and self.limit < self.maximum:
+                self.limit += 1
+                self.healthy = 0
+                self._condition.notify()
+
+    def failed(self):
+        with self._condition:
+            # Requests that were already out when the service started struggling
+            # fail together, they only count as one signal
+            now = monotonic()
+            if now - self.last_decrease < (self.baseline or 0) * LATENCY_TOLERANCE:
+                return
+            self.last_decrease = now
+            self.limit = max(1, self.limit // 2)
+            self.healthy = 0
+
+
+class HostScheduler:
+    def __init__(self):
+        rate = float(getenv(RATE_LIMIT_KEY, 25))
+        self.bucket = TokenBucket(rate, max(1.0, rate))
+        self.limit = AdaptiveLimit(
+            int(getenv(FETCH_CONCURRENCY_KEY, 4)), max_concurrency()
+        )
+        self.paused_until = 0.0
+        self._lock = Lock()
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self.paused_until = max(self.paused_until, monotonic() + seconds)
+
+    def wait_for_turn(self):
+        while (wait := self.paused_until - monotonic()) > 0:
+            sleep(wait)
+        self.bucket.take()
+
+
+_schedulers: dict[tuple[str, str], HostScheduler] = {}
+_schedulers_lock = Lock()
+
+
+def scheduler_for(service: str, host: str) -> HostScheduler:
+    with _schedulers_lock:
+        if (service, host) not in _schedulers:
+            _schedulers[(service, host)] = HostScheduler()
+        return _schedulers[(service, host)]
+
+
+def max_concurrency() -> int:
+    return int(getenv(MAX_CONCURRENCY_KEY, 16))
+
+
+def retry_after(response: Response) -> Optional[float]:
+    """Seconds to wait, from a Retry-After header with either seconds or a date"""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time())
+    except (TypeError, ValueError):
+        return None
+
+
+class SchedulingAdapter(BaseAdapter):
+    """Sends requests through another adapter when the host's scheduler allows it"""
+
+    def __init__(self, adapter: BaseAdapter, service: str):
+        self.adapter = adapter
+        self.service = service
+        super().__init__()
+
+    def send(self, request: PreparedRequest, *args, **kwargs) -> Response:
+        scheduler = scheduler_for(self.service, urlsplit(request.url or "").netloc)
+        for attempt in range(MAX_RETRIES + 1):
+            scheduler.wait_for_turn()
+            scheduler.limit.acquire()
+            start = monotonic()
+            try:
+                response = self.adapter.send(request, *args, **kwargs)
+            except Exception:
+                scheduler.limit.failed()
+                raise
+            finally:
+                scheduler.limit.release()
+
+            if response.status_code not in BACKOFF_STATUSES:
+                scheduler.limit.succeeded(monotonic() - start)
+                return response
+
+            scheduler.limit.failed()
+            wait = retry_after(response)
+            if (
+                response.status_code not in RETRY_STATUSES
+                or wait is None
+                or wait > MAX_RETRY_AFTER
+                or attempt == MAX_RETRIES
+            ):
+                return response
+
+            scheduler.pause(wait)
+            response.close()
+
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+def install(session: Session, service: str):
+    """Schedule the session's requests, on top of whatever adapters are mounted"""
+    for prefix in ("https://", "http://"):
+        adapter = session.get_adapter(prefix)
+        if not isinstance(adapter, SchedulingAdapter):
+            session.mount(prefix, SchedulingAdapter(adapter, service))
+
+
+_pools: dict[str, ThreadPoolExecutor] = {}
+_pools_lock = Lock()
+
+
+def _pool_prefix(service: str) -> str:
+    return f"ttcli-{service}"
+
+
+def submit_all(
+    service: str, work: Callable[[K], R], items: Iterable[K]
+) -> list["Future[R]"]:
+    """Start work for every item on the service's pool, returning the futures in the
+    same order. Work submitted from the pool itself runs right away instead, so it
+    can't wait for a worker that's waiting for it."""
+    items = list(items)
+    if current_thread().name.startswith(_pool_prefix(service)):
+        futures: list[Future[R]] = []
+        for item in items:
+            future: Future[R] = Future()
+            try:
+                future.set_result(work(item))
+            except Exception as e:
+                future.set_exception(e)
+            futures.append(future)
+        return futures
+
+    with _pools_lock:
+        if service not in _pools:
+            _pools[service] = ThreadPoolExecutor(
+                max_workers=max_concurrency(), thread_name_prefix=_pool_prefix(service)
+            )
+        pool = _pools[service]
+    return [pool.submit(work, item) for item in items]
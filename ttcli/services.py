@@ -0,0 +1,132 @@
+"""The registry of timesheet services.
+
+Every service is described by a `ServiceSpec`: its name, the config keys it can't do
+without, and where its client class and command group live. Specs are found through
+the "ttcli.services" entry point group, so another package can add a service by
+declaring one in its own metadata:
+
+    [tool.poetry.plugins."ttcli.services"]
+    harvest = "ttcli_harvest.spec:HARVEST"
+
+This module stays light on imports. Listing services, and finding out which ones are
+configured, only reads the specs and the stored config keys, and doesn't import any
+client module until a client is actually needed.
+"""
+
+import os
+from dataclasses import dataclass
+from functools import cache
+from importlib import import_module
+from importlib.metadata import entry_points
+from typing import TYPE_CHECKING, Any, Collection, Optional, Type
+
+import dotenv
+
+from ttcli.config.reader import read_stored_configs
+
+if TYPE_CHECKING:
+    import click
+
+    from ttcli.ApiClient import ApiClient
+
+ENTRY_POINT_GROUP = "ttcli.services"
+
+
+def load_object(path: str) -> Any:
+    """What an import path like "package.module:attribute" points at"""
+    module, _, attribute = path.partition(":")
+    found: Any = import_module(module)
+    for part in attribute.split(".") if attribute else []:
+        found = getattr(found, part)
+    return found
+
+
+@dataclass(frozen=True)
+class ServiceSpec:
+    name: str
+    required_keys: tuple[str, ...]
+    # Import paths, "package.module:attribute"
+    client: str
+    command: Optional[str] = None
+    # The name of the command group under tt-cli, like "tripletex"
+    command_name: Optional[str] = None
+
+    def load_client(self) -> Type["ApiClient"]:
+        return load_object(self.client)
+
+    def load_command(self) -> Optional["click.Command"]:
+        return load_object(self.command) if self.command else None
+
+    def is_configured(self, keys: Collection[str]) -> bool:
+        return all(key in keys for key in self.required_keys)
+
+
+TRIPLETEX = ServiceSpec(
+    "TripleTex",
+    ("TT_EMPLOYEE_TOKEN", "TT_SERVICE_URL"),
+    "ttcli.tripletex.TripleTex:TripleTex",
+    "ttcli.tripletex.TripleTex:tripletex_command",
+    "tripletex",
+)
+SEVERA = ServiceSpec(
+    "Severa",
+    ("SEVERA_USERNAME", "SEVERA_PASSWORD"),
+    "ttcli.Severa:Severa",
+    "ttcli.Severa:severa_command",
+    "severa",
+)
+NOA = ServiceSpec(
+    "Noa Workbook",
+    ("NOA_USERNAME", "NOA_PASSWORD"),
+    "ttcli.noa.NoaWorkbook:NoaWorkbook",
+    "ttcli.noa.NoaWorkbook:noa_command",
+    "noa",
+)
+
+# Used when running from a checkout that isn't installed, and has no entry points
+BUILTIN_SERVICES = (TRIPLETEX, SEVERA, NOA)
+
+
+@cache
+def service_specs() -> tuple[ServiceSpec, ...]:
+    """Every known service, the builtin ones first"""
+    specs = {spec.name: spec for spec in BUILTIN_SERVICES}
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        spec = entry_point.load()
+        if isinstance(spec, ServiceSpec):
+            specs.setdefault(spec.name, spec)
+    return tuple(specs.values())
+
+
+def service_spec(name: str) -> ServiceSpec:
+    """:raises: KeyError if there's no such service"""
+    for spec in service_specs():
+        if spec.name == name:
+            return spec
+    raise KeyError(name)
+
+
+def configured_keys(profile: Optional[str] = None) -> set[str]:
+    """The config keys that are set, like `service_settings` would find them, but
+    without creating any clients. Without a profile that's the current profile's
+    stored config, .env and the environment, with one it's only what's stored."""
+    try:
+        stored = read_stored_configs(profile=profile)
+    except ValueError:
+        # A key that can't decrypt the config, which read_config knows what to do with
+        stored = None
+    if stored is None:
+        from ttcli.config.settings import read_config
+
+        stored = read_config(profile) or []
+
+    keys = {key for config in stored for key in config.config}
+    if profile is None:
+        keys.update(os.environ)
+        keys.update(dotenv.dotenv_values(dotenv.find_dotenv()))
+    return keys
+
+
+def configured_specs(profile: Optional[str] = None) -> list[ServiceSpec]:
+    keys = configured_keys(profile)
+    return [spec for spec in service_specs() if spec.is_configured(keys)]
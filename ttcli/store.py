@@ -0,0 +1,195 @@
+"""A compact, columnar store for many normalized timesheet entries.
+
+Every entry is a row across a handful of typed arrays: the date as an ordinal, the
+hours, and indexes into tables of service names, project names and descriptions.
+Each distinct string is stored once, however many entries use it. A row takes a few
+dozen bytes instead of the hundreds a model or dict does, so years of entries for a
+whole team fit comfortably in memory.
+
+Group-bys walk whole columns at once rather than materializing an `Entry` per row,
+and weeks and months are rolled up from the far fewer distinct days.
+"""
+
+from array import array
+from collections import defaultdict
+from datetime import date
+from itertools import compress
+from typing import Hashable, Iterable, Iterator, Optional
+
+from ttcli.utils import Entry, TimeSpan
+
+# What `EntryStore.hours_by` and `EntryStore.rows_by` can group on
+DAY = "day"
+WEEK = "week"
+MONTH = "month"
+PROJECT = "project"
+SERVICE = "service"
+DESCRIPTION = "description"
+
+
+class StringTable:
+    """Interned strings, each stored once and referred to by its index"""
+
+    def __init__(self):
+        self.strings: list[Optional[str]] = []
+        self._index: dict[Optional[str], int] = {}
+
+    def intern(self, value: Optional[str]) -> int:
+        index = self._index.get(value)
+        if index is None:
+            index = self._index[value] = len(self.strings)
+            self.strings.append(value)
+        return index
+
+    def __getitem__(self, index: int) -> Optional[str]:
+        return self.strings[index]
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+
+def week_of(ordinal: int) -> tuple[int, int]:
+    year, week, _ = date.fromordinal(ordinal).isocalendar()
+    return year, week
+
+
+def month_of(ordinal: int) -> tuple[int, int]:
+    day = date.fromordinal(ordinal)
+    return day.year, day.month
+
+
+class EntryStore:
+    def __init__(
+        self,
+        services: Optional[StringTable] = None,
+        projects: Optional[StringTable] = None,
+        descriptions: Optional[StringTable] = None,
+    ):
+        self.days = array("i")
+        self.hours = array("d")
+        self.service_ids = array("i")
+        self.project_ids = array("i")
+        self.description_ids = array("i")
+        self.services = services or StringTable()
+        self.projects = projects or StringTable()
+        self.descriptions = descriptions or StringTable()
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Entry]) -> "EntryStore":
+        store = cls()
+        store.extend(entries)
+        return store
+
+    def append(self, entry: Entry):
+        self.days.append(entry.day.toordinal())
+        self.hours.append(entry.hours)
+        self.service_ids.append(self.services.intern(entry.service))
+        self.project_ids.append(self.projects.intern(entry.project))
+        self.description_ids.append(self.descriptions.intern(entry.description))
+
+    def extend(self, entries: Iterable[Entry]):
+        for entry in entries:
+            self.append(entry)
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def entry(self, row: int) -> Entry:
+        return Entry(
+            service=self.services[self.service_ids[row]] or "",
+            day=date.fromordinal(self.days[row]),
+            hours=self.hours[row],
+            description=self.descriptions[self.description_ids[row]] or "",
+            project=self.projects[self.project_ids[row]],
+        )
+
+    def __iter__(self) -> Iterator[Entry]:
+        return (self.entry(row) for row in range(len(self)))
+
+    def _columns(self) -> tuple[array, ...]:
+        return (
+            self.days,
+            self.hours,
+            self.service_ids,
+            self.project_ids,
+            self.description_ids,
+        )
+
+    def nbytes(self) -> int:
+        """Size of the columns, not counting the string tables"""
+        return sum(column.itemsize * len(column) for column in self._columns())
+
+    def within(self, span: TimeSpan) -> "EntryStore":
+        """The rows inside span, sharing this store's string tables"""
+        first, last = span.start_date.toordinal(), span.end_date.toordinal()
+        mask = [first <= day <= last for day in self.days]
+        selected = EntryStore(self.services, self.projects, self.descriptions)
+        for source, target in zip(self._columns(), selected._columns()):
+            target.extend(compress(source, mask))
+        return selected
+
+    def _codes(self, by: str) -> Iterable[Hashable]:
+        """One group code per row. Days, weeks and months are all grouped on the
+        day ordinal first, see `_labels`."""
+        if by in (DAY, WEEK, MONTH):
+            return self.days
+        if by == PROJECT:
+            return self.project_ids
+        if by == SERVICE:
+            return self.service_ids
+        if by == DESCRIPTION:
+            return self.description_ids
+        raise ValueError(f"Can't group entries by {by}")
+
+    def _labels(self, by: str, codes: Iterable) -> dict:
+        """What each distinct code stands for"""
+        if by == DAY:
+            return {code: date.fromordinal(code) for code in codes}
+        if by == WEEK:
+            return {code: week_of(code) for code in codes}
+        if by == MONTH:
+            return {code: month_of(code) for code in codes}
+        table = {
+            PROJECT: self.projects,
+            SERVICE: self.services,
+            DESCRIPTION: self.descriptions,
+        }[by]
+        return {code: table[code] for code in codes}
+
+    def hours_by(self, by: str) -> dict:
+        """Total hours per day (dates), week or month (year and number), or project,
+        service or description (strings)"""
+        totals: dict[Hashable, float] = defaultdict(float)
+        for code, hours in zip(self._codes(by), self.hours):
+            totals[code] += hours
+
+        rolled_up: dict[Hashable, float] = defaultdict(float)
+        for code, label in self._labels(by, totals).items():
+            rolled_up[label] += totals[code]
+        return dict(rolled_up)
+
+    def rows_by(self, *by: str) -> dict[tuple, list[int]]:
+        """Row numbers grouped on one or more of day, week, month, project, service
+        and description, like `store.rows_by(DAY, SERVICE)`"""
+        groups: dict[tuple, list[int]] = defaultdict(list)
+        for row, codes in enumerate(zip(*(self._codes(column) for column in by))):
+            groups[codes].append(row)
+
+        labels = [
+            self._labels(column, {codes[i] for codes in groups})
+            for i, column in enumerate(by)
+        ]
+        merged: dict[tuple, list[int]] = defaultdict(list)
+        for codes, rows in groups.items():
+            merged[tuple(label[code] for label, code in zip(labels, codes))] += rows
+        return dict(merged)
+
+    def total(self, rows: Optional[Iterable[int]] = None) -> float:
+        if rows is None:
+            return sum(self.hours)
+        return sum(self.hours[row] for row in rows)
+
+    def descriptions_of(self, rows: Iterable[int]) -> list[str]:
+        """The distinct non-empty descriptions of rows, in order"""
+        ids = dict.fromkeys(self.description_ids[row] for row in rows)
+        return [text for text in (self.descriptions[i] for i in ids) if text]
@@ -0,0 +1,163 @@
+"""Writing hours for a whole team at once.
+
+Every employee is a profile with its own service configuration. A csv with an
+employee column is split per employee, and every employee's writes to every service
+they have configured run in parallel, at most TTCLI_TEAM_CONCURRENCY employees per
+service at a time, so no single service gets a burst of logins. The writes go straight
+to the services instead of through the queue, so the results are known when the
+command is done.
+"""
+
+import csv
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime
+from io import BufferedReader
+from os import getenv
+from threading import BoundedSemaphore
+from typing import Optional, Type
+
+import click
+from click_help_colors import HelpColorsGroup
+from rich.table import Table
+
+from ttcli.ApiClient import ApiClient, ConfigurationException, get_all_services
+from ttcli.config.config import list_profiles
+from ttcli.output import print
+
+TEAM_CONCURRENCY_KEY = "TTCLI_TEAM_CONCURRENCY"
+
+
+@dataclass
+class TeamRow:
+    day: date
+    hours: float
+    description: str
+
+
+@dataclass
+class WriteResult:
+    """How one employee's writes to one service went"""
+
+    configured: bool
+    written: int = 0
+    error: Optional[str] = None
+
+
+def read_team_csv(file: BufferedReader) -> dict[str, list[TeamRow]]:
+    """Rows by employee, from a csv with employee, date, hours and description"""
+    lines = [line.decode() for line in file.readlines()]
+    rows: dict[str, list[TeamRow]] = {}
+    for item in csv.DictReader(lines):
+        rows.setdefault(item["employee"], []).append(
+            TeamRow(
+                datetime.fromisoformat(item["date"]).date(),
+                float(item["hours"]),
+                item["description"],
+            )
+        )
+    return rows
+
+
+def write_rows(
+    service: Type[ApiClient],
+    profile: str,
+    rows: list[TeamRow],
+    lock: bool,
+    limit: BoundedSemaphore,
+) -> WriteResult:
+    try:
+        client = service(profile=profile)  # type: ignore
+    except ConfigurationException:
+        return WriteResult(configured=False)
+
+    result = WriteResult(configured=True)
+    with limit:
+        try:
+            for row in rows:
+                client.write_hours(row.hours, row.description, row.day)
+                if lock:
+                    client.lock_day(day=row.day)
+                result.written += 1
+        except ConfigurationException as e:
+            result.error = e.message
+        except Exception as e:
+            result.error = str(e) or e.__class__.__name__
+    return result
+
+
+def write_team(
+    rows: dict[str, list[TeamRow]], lock: bool
+) -> dict[str, dict[str, WriteResult]]:
+    """Write every employee's rows to their configured services, results by employee
+    and service name"""
+    services = list(get_all_services())
+    concurrency = int(getenv(TEAM_CONCURRENCY_KEY, 4))
+    limits = {service: BoundedSemaphore(concurrency) for service in services}
+
+    workers = max(1, min(len(rows), concurrency) * len(services))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            employee: {
+                service.name(): executor.submit(
+                    write_rows, service, employee, employee_rows, lock, limits[service]
+                )
+                for service in services
+            }
+            for employee, employee_rows in rows.items()
+        }
+        return {
+            employee: {name: future.result() for name, future in by_service.items()}
+            for employee, by_service in futures.items()
+        }
+
+
+def render_results(
+    rows: dict[str, list[TeamRow]], results: dict[str, dict[str, WriteResult]]
+):
+    services = [service.name() for service in get_all_services()]
+    table = Table(title="Team writes", show_lines=True)
+    table.add_column("Employee", style="cyan")
+    for service in services:
+        table.add_column(service)
+
+    for employee, by_service in results.items():
+        total = len(rows[employee])
+        cells = []
+        for service in services:
+            result = by_service[service]
+            if not result.configured:
+                cells.append("[bright_black]–[/bright_black]")
+            elif result.error is None:
+                cells.append(f"[green]✓[/green] {result.written}/{total}")
+            else:
+                cells.append(
+                    f"[red]✗[/red] {result.written}/{total}\n"
+                    f"[bright_black]{result.error}[/bright_black]"
+                )
+        table.add_row(employee, *cells)
+
+    print(table)
+
+
+@click.group(
+    cls=HelpColorsGroup, help_headers_color="yellow", help_options_color="green"
+)
+def team_command():
+    """Write hours for several employees, each with their own profile"""
+    pass
+
+
+@team_command.command(name="write")
+@click.option("--lock/--no-lock", default=True)
+@click.argument("file", type=click.File("rb"))
+def team_write(file: BufferedReader, lock: bool):
+    """Write a csv with employee, date, hours and description columns. The employee
+    is the name of the profile whose services are written to."""
+    rows = read_team_csv(file)
+    known = set(list_profiles())
+    for employee in rows.keys() - known:
+        print(f"[blink]Warning:[/blink] no profile called {employee}")
+
+    results = write_team(rows, lock)
+    render_results(rows, results)
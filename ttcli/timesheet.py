@@ -0,0 +1,179 @@
+"""One timesheet across every configured service, fetched concurrently"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from functools import cached_property
+from typing import Iterable, Optional
+
+import click
+from click_help_colors import HelpColorsCommand
+from rich.table import Table
+
+from ttcli.ApiClient import (
+    ApiClient,
+    ConfigurationException,
+    get_configured_services_instances,
+)
+from ttcli.export import format_option, write_entries
+from ttcli.output import print
+from ttcli.reports import resolve_span
+from ttcli.store import EntryStore
+from ttcli.utils import Entry, TimeSpan
+
+
+@dataclass
+class Timesheet:
+    span: TimeSpan
+    entries: dict[str, list[Entry]] = field(default_factory=dict)
+    errors: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def services(self) -> list[str]:
+        return list(self.entries)
+
+    def days(self) -> list[date]:
+        return sorted(
+            {entry.day for entries in self.entries.values() for entry in entries}
+        )
+
+    def on(self, service: str, day: date) -> list[Entry]:
+        return [entry for entry in self.entries[service] if entry.day == day]
+
+    def total(self, service: str) -> float:
+        return sum(entry.hours for entry in self.entries[service])
+
+    @cached_property
+    def store(self) -> EntryStore:
+        """Every service's entries in one compact store, built on first use"""
+        return EntryStore.from_entries(
+            entry for entries in self.entries.values() for entry in entries
+        )
+
+
+def fetch_timesheet(span: TimeSpan, services: Iterable[ApiClient]) -> Timesheet:
+    """Fetch entries from every service at once, so this takes about as long as the
+    slowest one. A failing service is reported in `errors` instead of failing it all."""
+    services = list(services)
+    timesheet = Timesheet(span)
+    if not services:
+        return timesheet
+
+    with ThreadPoolExecutor(max_workers=len(services)) as executor:
+        futures = {
+            service.name(): executor.submit(service.get_entries, span)
+            for service in services
+        }
+        for name, future in futures.items():
+            try:
+                timesheet.entries[name] = sorted(
+                    future.result(), key=lambda entry: entry.day
+                )
+            except ConfigurationException as e:
+                timesheet.errors[name] = e.message
+            except Exception as e:
+                timesheet.errors[name] = str(e) or e.__class__.__name__
+
+    return timesheet
+
+
+def render_timesheet(timesheet: Timesheet):
+    span = timesheet.span
+    table = Table(
+        title=f"{span.start_date.isoformat()} – {span.end_date.isoformat()}",
+        show_footer=True,
+        show_lines=True,
+    )
+    table.add_column("Day", footer="Total", style="green")
+    for service in timesheet.services:
+        table.add_column(service, footer=f"{timesheet.total(service)}h")
+
+    for day in timesheet.days():
+        cells = []
+        for service in timesheet.services:
+            lines = []
+            for entry in timesheet.on(service, day):
+                hour_color = "yellow" if entry.hours == 7.5 else "red"
+                project = (
+                    f" [bright_black]({entry.project})[/bright_black]"
+                    if entry.project
+                    else ""
+                )
+                lines.append(
+                    f"[{hour_color}]{entry.hours}[/{hour_color}]{project}: "
+                    f"{entry.description}"
+                )
+            cells.append("\n".join(lines))
+
+        table.add_row(
+            f"{day.strftime('%A')}\n[bright_black]{day.isoformat()}[/bright_black]",
+            *cells,
+        )
+
+    print(table)
+    for service, error in timesheet.errors.items():
+        print(f"[blink]Warning:[/blink] couldn't fetch {service}: {error}")
+
+
+@click.command(
+    cls=HelpColorsCommand, help_headers_color="yellow", help_options_color="green"
+)
+@click.option("-w", "--week", type=int, help="ISO week number")
+@click.option("-m", "--month", type=int, help="Month number")
+@click.option(
+    "-y",
+    "--year",
+    type=int,
+    help="Year of --week or --month, defaults to this year. Alone, the whole year",
+)
+@click.option(
+    "--from",
+    "from_date",
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    help="First day of a range",
+)
+@click.option(
+    "--to",
+    "to_date",
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    help="Last day of a range, defaults to today",
+)
+@click.option("--include-future/--no-include-future", default=False)
+@format_option
+def timesheet_command(
+    week: Optional[int],
+    month: Optional[int],
+    year: Optional[int],
+    from_date: Optional[datetime],
+    to_date: Optional[datetime],
+    include_future: bool,
+    output_format: str,
+):
+    """Show what's logged in every configured service side by side.
+
+    Defaults to the current week, pass --week, --month, --year or --from/--to for
+    another span.
+    """
+    span = resolve_span(
+        year,
+        from_date,
+        to_date,
+        include_future,
+        week=week,
+        month=month,
+        this_week_by_default=True,
+    )
+    timesheet = fetch_timesheet(span, get_configured_services_instances())
+    if output_format == "text":
+        render_timesheet(timesheet)
+        return
+
+    for service, error in timesheet.errors.items():
+        click.echo(f"Warning: couldn't fetch {service}: {error}", err=True)
+    write_entries(
+        sorted(
+            (entry for entries in timesheet.entries.values() for entry in entries),
+            key=lambda entry: (entry.day, entry.service),
+        ),
+        output_format,
+    )
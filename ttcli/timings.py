@@ -0,0 +1,167 @@
+"""Wall clock instrumentation, for finding out where an invocation spends its time.
+
+Phases and http requests are always recorded, which is cheap. Whether anything is
+reported is decided by `enable`, which the --timings option calls, or by setting
+TTCLI_TIMINGS. The report is printed to stderr at exit, and optionally written as json
+to the path given by --timings-json or TTCLI_TIMINGS_JSON.
+"""
+
+import atexit
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from functools import wraps
+from json import dump
+from os import getenv
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Iterator, Optional, ParamSpec, TypeVar
+from urllib.parse import urlparse
+
+TIMINGS_KEY = "TTCLI_TIMINGS"
+TIMINGS_JSON_KEY = "TTCLI_TIMINGS_JSON"
+
+_process_start = perf_counter()
+
+
+@dataclass
+class Span:
+    kind: str
+    name: str
+    start: float
+    duration: float
+    method: Optional[str] = None
+    status: Optional[int] = None
+    bytes: Optional[int] = None
+
+
+class _Recorder:
+    def __init__(self):
+        self.spans: list[Span] = []
+        self.enabled = False
+        self.json_path: Optional[str] = None
+        self._lock = Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def enable(self, json_path: Optional[str] = None):
+        if not self.enabled:
+            atexit.register(self.report)
+        self.enabled = True
+        self.json_path = json_path or self.json_path
+
+    def report(self):
+        spans = sorted(self.spans, key=lambda span: span.start)
+        total = perf_counter() - _process_start
+
+        if self.json_path:
+            with open(self.json_path, "w") as json_file:
+                dump(
+                    {"total": total, "spans": [asdict(span) for span in spans]},
+                    json_file,
+                    indent=2,
+                )
+
+        _print_waterfall(spans, total)
+
+
+recorder = _Recorder()
+
+
+def enable(json_path: Optional[str] = None):
+    recorder.enable(json_path)
+
+
+def mark(name: str):
+    """Record a phase running from process start until now, e.g. imports"""
+    recorder.add(Span("phase", name, 0.0, perf_counter() - _process_start))
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        end = perf_counter()
+        recorder.add(Span("phase", name, start - _process_start, end - start))
+
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+
+def timed(name: str) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    def decorator(func: Callable[P, R]) -> Callable[P, R]:
+        @wraps(func)
+        def wrapped(*args: P.args, **kwargs: P.kwargs) -> R:
+            with phase(name):
+                return func(*args, **kwargs)
+
+        return wrapped
+
+    return decorator
+
+
+def record_response(response, *args, **kwargs):
+    """A requests response hook, see `instrument`"""
+    duration = response.elapsed.total_seconds()
+    url = urlparse(response.url)
+    recorder.add(
+        Span(
+            "request",
+            f"{url.netloc}{url.path}",
+            perf_counter() - _process_start - duration,
+            duration,
+            method=response.request.method,
+            status=response.status_code,
+            bytes=len(response.content),
+        )
+    )
+    return response
+
+
+def instrument(session):
+    """Record every request made through a requests session"""
+    hooks = session.hooks["response"]
+    if record_response not in hooks:
+        hooks.append(record_response)
+
+
+def _print_waterfall(spans: list[Span], total: float):
+    from rich.console import Console
+    from rich.table import Table
+
+    width = 20
+    table = Table(title=f"Timings, {total * 1000:.0f}ms total", title_justify="left")
+    table.add_column("Start", justify="right", style="bright_black")
+    table.add_column("Duration", justify="right", style="yellow")
+    table.add_column("What")
+    table.add_column("Status", justify="right")
+    table.add_column("Bytes", justify="right", style="bright_black")
+    table.add_column("", no_wrap=True, min_width=width + 1)
+
+    for span in spans:
+        offset = int(span.start / total * width) if total else 0
+        length = max(1, int(span.duration / total * width)) if total else 1
+        bar_color = "cyan" if span.kind == "request" else "magenta"
+        what = f"{span.method} {span.name}" if span.method else span.name
+        status = "" if span.status is None else str(span.status)
+        if span.status is not None and span.status >= 400:
+            status = f"[red]{status}[/red]"
+
+        table.add_row(
+            f"{span.start * 1000:.1f}ms",
+            f"{span.duration * 1000:.1f}ms",
+            what,
+            status,
+            "" if span.bytes is None else str(span.bytes),
+            " " * offset + f"[{bar_color}]" + "█" * length + f"[/{bar_color}]",
+        )
+
+    Console(stderr=True, highlight=False).print(table)
+
+
+if getenv(TIMINGS_KEY) or getenv(TIMINGS_JSON_KEY):
+    enable(getenv(TIMINGS_JSON_KEY))
@@ -1,26 +1,35 @@
 from dataclasses import dataclass
 from datetime import date, datetime, timedelta
 from json import dumps, loads
-from os import environ, getenv
 from textwrap import dedent
-from typing import Optional
+from typing import Optional, TypeVar
 
 import click
 from click_help_colors import HelpColorsCommand, HelpColorsGroup
-from requests import JSONDecodeError, Session, post
+from requests import JSONDecodeError, Session
 from rich.console import Console
 from rich.prompt import IntPrompt, Prompt
 from rich.table import Table
 
+from ttcli import timings
 from ttcli.ApiClient import ApiClient, ConfigurationException
-from ttcli.config.config import (
-    clear_service_config,
-    configure_command,
-    read_service_config,
-    source_config,
-    write_config,
-)
+from ttcli.config.config import clear_service_config, configure_command, write_config
+from ttcli.config.settings import read_service_config, service_settings, source_config
+from ttcli.export import format_option, write_entries
 from ttcli.output import print
+from ttcli.reports import Summary, print_summary, resolve_span, span_options
+from ttcli.tripletex.index import MAX_AGE as INDEX_MAX_AGE
+from ttcli.tripletex.index import (
+    complete_activities,
+    complete_projects,
+    current_index,
+    describe,
+    load_index,
+    match_activities,
+    match_projects,
+    search,
+    update_index,
+)
 from ttcli.tripletex.types import (
     ActivityDTO,
     ConfiguredActivity,
@@ -28,16 +37,31 @@ from ttcli.tripletex.types import (
     ProjectDTO,
     SessionTokenResponse,
     TimesheetEntry,
+    TimesheetHours,
+)
+from ttcli.utils import (
+    Entry,
+    TimeSpan,
+    get_mondays,
+    get_month_span,
+    get_week_number,
+    get_week_span,
+    instance_cache,
+    list_adapter,
+    prefetch,
 )
-from ttcli.utils import get_month_span, get_week_number
 
 TT_EMPLOYEE_TOKEN_KEY = "TT_EMPLOYEE_TOKEN"
 TT_SERVICE_URL_KEY = "TT_SERVICE_URL"
 TT_CONFIGURED_ACTIVITY_KEY = "TT_CONFIGURED_ACTIVITY"
 
+E = TypeVar("E", TimesheetEntry, TimesheetHours)
+
 
 class TripleTex(ApiClient):
-    def __init__(self):
+    def __init__(self, profile: Optional[str] = None):
+        self.profile = profile
+        self.settings = service_settings(TripleTex, profile)
         self.raise_configuration_exception()
 
         super(TripleTex, self).__init__(client=Session())
@@ -49,7 +73,7 @@ class TripleTex(ApiClient):
         return "TripleTex"
 
     def own_config(self) -> dict[str, str] | None:
-        db_model = read_service_config(self.__class__)
+        db_model = read_service_config(self.__class__, self.profile)
         if db_model:
             return db_model.config
 
@@ -71,8 +95,13 @@ class TripleTex(ApiClient):
         if not config:
             return
 
-        config["SESSION_TOKEN"] = token.json()
-        write_config(self.__class__, config)
+        serialized = token.model_dump_json()
+        # Logging in with the saved token shouldn't write it back
+        if config.get("SESSION_TOKEN") == serialized:
+            return
+
+        config["SESSION_TOKEN"] = serialized
+        write_config(self.__class__, config, self.profile)
 
     @property
     def login(self) -> EmployeeDTO:
@@ -84,10 +113,15 @@ class TripleTex(ApiClient):
                 self.login = token
                 return self.employee
 
-        login_service_url = getenv(TT_SERVICE_URL_KEY, "http://localhost:8000/login")
-        employee_token = getenv(TT_EMPLOYEE_TOKEN_KEY, "dev")
-        response = post(login_service_url, json={"employeeToken": employee_token})
-        token = SessionTokenResponse(**response.json())
+        login_service_url = self.settings.get(
+            TT_SERVICE_URL_KEY, "http://localhost:8000/login"
+        )
+        employee_token = self.settings.get(TT_EMPLOYEE_TOKEN_KEY, "dev")
+        with timings.phase("TripleTex login"):
+            response = self.client.post(
+                login_service_url, json={"employeeToken": employee_token}
+            )
+            token = SessionTokenResponse(**response.json())
 
         self.login = token
         return self.employee
@@ -110,7 +144,7 @@ class TripleTex(ApiClient):
         self.login
         try:
             configured_activity = ConfiguredActivity(
-                **loads(getenv(TT_CONFIGURED_ACTIVITY_KEY, ""))
+                **loads(self.settings.get(TT_CONFIGURED_ACTIVITY_KEY, ""))
             )
             activity_id = (
                 activity_id if activity_id else configured_activity.activity.id
@@ -195,14 +229,21 @@ class TripleTex(ApiClient):
         return self._employee
 
     def is_configured(self):
-        return all(k in environ for k in (TT_EMPLOYEE_TOKEN_KEY, TT_SERVICE_URL_KEY))
+        return all(
+            k in self.settings for k in (TT_EMPLOYEE_TOKEN_KEY, TT_SERVICE_URL_KEY)
+        )
+
+    def refresh_session(self):
+        if self._token is not None and self._token.expiration_date <= date.today():
+            self._token = None
+        self.login
 
     def raise_configuration_exception(self):
-        if TT_EMPLOYEE_TOKEN_KEY not in environ:
+        if TT_EMPLOYEE_TOKEN_KEY not in self.settings:
             raise ConfigurationException(
                 message="Missing username", missing_key=TT_EMPLOYEE_TOKEN_KEY
             )
-        elif TT_SERVICE_URL_KEY not in environ:
+        elif TT_SERVICE_URL_KEY not in self.settings:
             raise ConfigurationException(
                 message="Missing password", missing_key=TT_SERVICE_URL_KEY
             )
@@ -216,11 +257,13 @@ class TripleTex(ApiClient):
         projects_resp = loads(self.api_get("/timesheet/entry/>recentProjects"))[
             "values"
         ]
-        projects = [ProjectDTO(**proj) for proj in projects_resp]
+        projects = list_adapter(ProjectDTO).validate_python(projects_resp)
         general_activities = loads(self.api_get("/timesheet/entry/>recentActivities"))
 
         result = self.RecentActivities(
-            general=[ActivityDTO(**act) for act in general_activities["values"]],
+            general=list_adapter(ActivityDTO).validate_python(
+                general_activities["values"]
+            ),
             project=[],
         )
 
@@ -234,28 +277,77 @@ class TripleTex(ApiClient):
             result.project.append(
                 (
                     project,
-                    [ActivityDTO(**act) for act in project_activities_resp["values"]],
+                    list_adapter(ActivityDTO).validate_python(
+                        project_activities_resp["values"]
+                    ),
                 )
             )
 
         return result
 
-    def get_timesheet_week(self, week_number: int) -> list[TimesheetEntry]:
+    def get_timesheet_between(self, span: TimeSpan) -> list[TimesheetEntry]:
+        return self._search_timesheet(span, TimesheetEntry, "project(*),activity(*),*")
+
+    def get_hours_between(self, span: TimeSpan) -> list[TimesheetHours]:
+        """Like `get_timesheet_between`, but only asks for and validates the fields
+        that summaries and exports use"""
+        return self._search_timesheet(
+            span, TimesheetHours, "date,hours,comment,project(name),activity(name)"
+        )
+
+    def _search_timesheet(self, span: TimeSpan, model: type[E], fields: str) -> list[E]:
+        page_size = 1000
+        entries: list[E] = []
+        while True:
+            result = loads(
+                self.api_get(
+                    "/timesheet/entry",
+                    params={
+                        "dateFrom": span.start_date.isoformat(),
+                        # dateTo is exclusive
+                        "dateTo": (span.end_date + timedelta(days=1)).isoformat(),
+                        "employeeId": self.employee.employee_id,
+                        "from": len(entries),
+                        "count": page_size,
+                        "fields": fields,
+                    },
+                )
+            )
+            entries.extend(list_adapter(model).validate_python(result["values"]))
+            if len(result["values"]) < page_size:
+                return sorted(entries, key=lambda entry: entry.date)
+
+    def get_entries(self, span: TimeSpan) -> list[Entry]:
+        return [
+            Entry(
+                service=self.name(),
+                day=entry.date,
+                hours=entry.hours,
+                description=entry.comment,
+                project=entry.project_name,
+            )
+            for entry in self.get_hours_between(span)
+        ]
+
+    @instance_cache
+    def get_timesheet_week(
+        self, week_number: int, year: Optional[int] = None
+    ) -> list[TimesheetEntry]:
+        year = year or date.today().year
         result = loads(
             self.api_get(
                 "/timesheet/week",
                 params={
-                    "weekYear": f"{date.today().year}-{week_number}",
+                    "weekYear": f"{year}-{week_number}",
                     "employeeIds": self.employee.employee_id,
                     "fields": "timesheetEntries(project(*),activity(*),*)",
                 },
             )
         )
         return sorted(
-            [
-                TimesheetEntry(**data)
-                for data in result["values"][0]["timesheetEntries"]
-            ],
+            list_adapter(TimesheetEntry).validate_python(
+                result["values"][0]["timesheetEntries"]
+            ),
             key=lambda entry: entry.date,
         )
 
@@ -279,6 +371,32 @@ def tripletex_command():
     pass
 
 
+@tripletex_command.command(
+    name="index",
+    cls=HelpColorsCommand,
+    help_headers_color="yellow",
+    help_options_color="green",
+)
+@click.option(
+    "--rebuild",
+    is_flag=True,
+    default=False,
+    help="Fetch everything again, instead of just projects that changed",
+)
+def index_activities(rebuild: bool):
+    """Update the local index of projects and activities that find, hours and tab
+    completion look names up in"""
+    tripletex = TripleTex.instance()
+    index, fetched = update_index(tripletex, rebuild=rebuild)
+    activities = sum(len(project.activities) for project in index.projects)
+    print(
+        f"Indexed [green]{len(index.projects)}[/green] projects with "
+        f"[green]{activities}[/green] activities, and "
+        f"[green]{len(index.general)}[/green] general activities "
+        f"[bright_black](fetched activities for {fetched} projects)[/bright_black]"
+    )
+
+
 @tripletex_command.command(
     name="find",
     cls=HelpColorsCommand,
@@ -291,33 +409,134 @@ def tripletex_command():
     "--json",
     is_flag=True,
     default=False,
-    help="Output as json with additional activity data from the api call instead of formatted list",
+    help="Output the matches as json instead of a table",
+)
+@click.option(
+    "-n", "--limit", type=int, default=20, show_default=True, help="Show at most N"
 )
-def find_activities(name: str, json: bool):
-    """Iterate over all activities applicable to employee's timesheet looking for a name that matches.
-    This will give you the activity id, which you will need to set as an environment variable.
+@click.option(
+    "--refresh",
+    is_flag=True,
+    default=False,
+    help="Update the index first, even if it's recent",
+)
+def find_activities(name: str, json: bool, limit: int, refresh: bool):
+    """Find the activities you can log hours to whose name, or whose project's name,
+    matches NAME. This will give you the activity id, for the -a option of hours.
 
-    NAME is part of (or the entirety of) the activity you are looking for. It is case insensitive.
+    NAME is matched case insensitively, by prefix, anywhere in the name, or roughly.
+    The local activity index is used, and updated first when it's more than a day old.
     """
-    tripletex = TripleTex()
-    tripletex.login
-    result: dict = loads(tripletex.api_get("/activity", {"name": name}))
+    tripletex = TripleTex.instance()
+    if refresh:
+        index = update_index(tripletex)[0]
+    else:
+        index = current_index(tripletex, max_age=INDEX_MAX_AGE)
+    matches = search(index, name)
 
-    if result["count"] == 0:
+    if not matches:
         click.echo(
             """Sorry, we couldn't find that activity.
             Double check that you spelled it just like how it appears in the dropdown in your timesheet."""
         )
-    else:
-        if json:
-            print(dumps(result))
-            return
+        return
+
+    if json:
+        print(
+            dumps(
+                [
+                    {
+                        "activity": match.activity.model_dump(by_alias=True),
+                        "project": (
+                            match.project.model_dump(
+                                by_alias=True, exclude={"activities"}
+                            )
+                            if match.project
+                            else None
+                        ),
+                    }
+                    for match in matches[:limit]
+                ]
+            )
+        )
+        return
+
+    table = Table(title=f"Activities matching {name}")
+    table.add_column("Project", style="cyan")
+    table.add_column("Activity", style="green")
+    table.add_column("Project ID", justify="right")
+    table.add_column("Activity ID", justify="right")
+    for match in matches[:limit]:
+        table.add_row(
+            match.project_name,
+            match.activity.display_name,
+            str(match.project.id) if match.project else "",
+            str(match.activity.id),
+        )
+    print(table)
+    if len(matches) > limit:
+        print(
+            f"[bright_black]Showing {limit} of {len(matches)}, "
+            "use --limit to see more[/bright_black]"
+        )
 
-        for i, activity in enumerate(result["values"], start=1):
-            print(f'Name: [green]{activity["name"]}[/green]')
-            print(f'Activity ID: [green]{str(activity["id"])}[/green]')
-            if i < len(result["values"]):
-                print("[bright_black]--[/bright_black]")
+
+def resolve_activity(
+    tripletex: TripleTex, activity: Optional[str], project: Optional[str]
+) -> tuple[int, Optional[int]]:
+    """The activity and project ids for the names given to hours, looked up in the
+    index without asking the api
+    :raises: click.BadParameter"""
+    index = load_index(tripletex.profile)
+    if index is None:
+        print("[bright_black]Building the activity index first[/bright_black]")
+        index = update_index(tripletex)[0]
+
+    indexed_project = None
+    if project is not None:
+        projects = match_projects(index, project)
+        if not projects:
+            raise click.BadParameter(
+                "no such project, `tt-cli tripletex index` picks up new ones",
+                param_hint="--project",
+            )
+        if len(projects) > 1:
+            names = ", ".join(p.display_name for p in projects[:5])
+            raise click.BadParameter(
+                f"{len(projects)} projects match: {names}", param_hint="--project"
+            )
+        indexed_project = projects[0]
+
+    if activity is None:
+        assert indexed_project is not None
+        activities = indexed_project.activities
+        # The configured activity, if the project has it, or the only one it has
+        if configured := tripletex.settings.get(TT_CONFIGURED_ACTIVITY_KEY):
+            configured_id = ConfiguredActivity(**loads(configured)).activity.id
+            if any(a.id == configured_id for a in activities):
+                return configured_id, indexed_project.id
+        if len(activities) == 1:
+            return activities[0].id, indexed_project.id
+        names = ", ".join(a.display_name for a in activities[:10])
+        raise click.BadParameter(
+            f"the project has {len(activities)} activities, pick one with "
+            f"--activity: {names}",
+            param_hint="--project",
+        )
+
+    matches = match_activities(index, activity, indexed_project)
+    if not matches:
+        raise click.BadParameter(
+            "no such activity, `tt-cli tripletex index` picks up new ones",
+            param_hint="--activity",
+        )
+    if len(matches) > 1:
+        names = ", ".join(describe(match) for match in matches[:5])
+        raise click.BadParameter(
+            f"{len(matches)} activities match: {names}", param_hint="--activity"
+        )
+    match = matches[0]
+    return match.activity.id, match.project.id if match.project else None
 
 
 @tripletex_command.command(
@@ -329,6 +548,17 @@ def find_activities(name: str, json: bool):
 @click.argument("hours", type=float)
 @click.argument("comment")
 @click.option("-a", "--activity-id", type=int)
+@click.option(
+    "--activity",
+    shell_complete=complete_activities,
+    help="Name of the activity, looked up in the activity index",
+)
+@click.option(
+    "-p",
+    "--project",
+    shell_complete=complete_projects,
+    help="Name or number of the project, looked up in the activity index",
+)
 @click.option(
     "-d",
     "--day",
@@ -336,18 +566,34 @@ def find_activities(name: str, json: bool):
     default=date.today().isoformat(),
 )
 def write_to_other_activity(
-    hours: float, comment: str, activity_id: int, day: datetime
+    hours: float,
+    comment: str,
+    activity_id: Optional[int],
+    activity: Optional[str],
+    project: Optional[str],
+    day: datetime,
 ):
-    """Write hours to an activity. By default we write to the activity defined by the TRIPLETEX_DEFAULT_ACTIVITY_ID
-    environment variable, but a different variable can be specified via the -a option.
+    """Write hours to an activity. By default we write to the activity chosen with
+    `tt-cli configure tripletex`, but a different one can be given by id with -a, or
+    by name with --activity and --project.
     """
+    if activity_id is not None and (activity or project):
+        raise click.UsageError("Give either --activity-id or names, not both")
+
     day_actual = day.date()
-    tt = TripleTex()
+    tt = TripleTex.instance()
+    project_id = None
+    if activity or project:
+        activity_id, project_id = resolve_activity(tt, activity, project)
     try:
         tt.write_hours(
-            hours=hours, description=comment, activity_id=activity_id, day=day_actual
+            hours=hours,
+            description=comment,
+            activity_id=activity_id,
+            project_id=project_id,
+            day=day_actual,
         )
-        print("f[green]Done![/green]")
+        print("[green]Done![/green]")
     except ConfigurationException as e:
         print(f"[blink]Warning:[/blink] {e.message}")
 
@@ -455,11 +701,12 @@ def timesheet(
     week: int,
     client: Optional[TripleTex] = None,
     first_day_mask: Optional[date] = None,
+    year: Optional[int] = None,
 ) -> list[TimesheetEntry]:
     if not client:
-        client = TripleTex()
+        client = TripleTex.instance()
 
-    entries = client.get_timesheet_week(week)
+    entries = list(client.get_timesheet_week(week, year))
     date_groups = dict()
 
     for entry in entries:
@@ -495,27 +742,51 @@ def timesheet(
 
 @tripletex_command.command(name="timesheet")
 @click.argument("week", type=int, default=get_week_number())
-def timesheet_cmd(week: int):
-    timesheet(week)
+@click.option("-y", "--year", type=int, help="Defaults to this year")
+@format_option
+def timesheet_cmd(week: int, year: Optional[int], output_format: str):
+    if output_format != "text":
+        span = get_week_span(week, year)
+        write_entries(TripleTex.instance().get_entries(span), output_format)
+        return
+
+    timesheet(week, year=year)
 
 
 @tripletex_command.command()
 @click.argument("month", type=int, default=datetime.today().month)
+@click.option("-y", "--year", type=int, help="Defaults to this year")
 @click.option("--include-future/--no-include-future", default=False)
-def timesheet_month(month: int, include_future: bool):
-    client = TripleTex()
-    first_day, last_day = get_month_span(month, include_future=include_future)
-    first_week, last_week = get_week_number(first_day), get_week_number(last_day)
-    if first_week > last_week and first_week == 52:
-        first_week = 1
+@format_option
+def timesheet_month(
+    month: int, year: Optional[int], include_future: bool, output_format: str
+):
+    client = TripleTex.instance()
+    span = get_month_span(month, include_future=include_future, year=year)
+    if output_format != "text":
+        write_entries(client.get_entries(span), output_format)
+        return
+
+    first_day = span.start_date
+    weeks_of_month = [monday.isocalendar() for monday in get_mondays(span)]
+
+    # Log in first, so the prefetching threads share one session
+    client.refresh_session()
+    prefetch(
+        lambda w: client.get_timesheet_week(w.week, w.year),
+        weeks_of_month,
+        client.name(),
+    )
 
     weeks = []
 
-    for week in range(first_week, last_week + 1):
+    for iso_week in weeks_of_month:
         result: list[TimesheetEntry] = list(
             filter(
                 lambda entry: entry.date.month == month,
-                timesheet(week, client, first_day_mask=first_day),
+                timesheet(
+                    iso_week.week, client, first_day_mask=first_day, year=iso_week.year
+                ),
             )
         )
         if len(result):
@@ -534,6 +805,20 @@ def timesheet_month(month: int, include_future: bool):
     print(f"[green]Total {first_day.strftime('%b')}:[/green] {month_total}")
 
 
+@tripletex_command.command()
+@span_options
+def summary(
+    year: Optional[int],
+    from_date: Optional[datetime],
+    to_date: Optional[datetime],
+    include_future: bool,
+):
+    """Totals per week, month and project, for a year or --from/--to"""
+    client = TripleTex.instance()
+    span = resolve_span(year, from_date, to_date, include_future)
+    print_summary(client.name(), Summary.of(span, client.get_entries(span)))
+
+
 if __name__ == "__main__":
     tt = TripleTex()
     print(tt.employee)
@@ -1,42 +1,242 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import date, timedelta
+from functools import cache
+from hashlib import sha256
+from json import load, loads
 from os import getenv
+from threading import Lock
 
 from fastapi import Body, FastAPI, HTTPException
-from requests import put
+from requests import RequestException, Session
+from requests.adapters import HTTPAdapter
 
-from ttcli.tripletex.types import ApiTokenEnvelope, SessionTokenResponse
+from ttcli.tripletex.types import (
+    ApiTokenEnvelope,
+    BatchLoginResult,
+    SessionTokenResponse,
+)
 
 app = FastAPI()
+logger = logging.getLogger(__name__)
+
+PROD_API_URL = "https://tripletex.no/v2/"
+TEST_API_URL = "https://api.tripletex.io/v2/"
+DEFAULT_TENANT = "default"
+# Seconds to connect and to answer, so a hung tripletex request can't hold on to a
+# batch worker for good
+UPSTREAM_TIMEOUT = (5.0, 30.0)
+
+
+@dataclass
+class Tenant:
+    """A consumer token and the tripletex environment it belongs to.
+
+    Every tenant gets its own upstream connection pool and its own token cache, so
+    tenants never share sessions or connections with each other.
+    """
+
+    name: str
+    consumer_token: str
+    api_url: str
+    client: Session = field(default_factory=Session, repr=False)
+    _tokens: dict[str, SessionTokenResponse] = field(default_factory=dict, repr=False)
+    _lock: Lock = field(default_factory=Lock, repr=False)
+
+    def __post_init__(self):
+        pool_size = int(getenv("TT_POOL_SIZE", 10))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.client.mount("https://", adapter)
+        self.client.mount("http://", adapter)
+
+    @staticmethod
+    def cache_key(employee_token: str) -> str:
+        return sha256(employee_token.encode()).hexdigest()
+
+    def cached_token(self, employee_token: str) -> SessionTokenResponse | None:
+        with self._lock:
+            token = self._tokens.get(self.cache_key(employee_token))
+        if token is not None and token.expiration_date > date.today():
+            return token
+
+        return None
+
+    def create_token(self, employee_token: str) -> SessionTokenResponse:
+        if token := self.cached_token(employee_token):
+            return token
+
+        expire_at = date.today() + timedelta(days=7)
+        try:
+            response = self.client.put(
+                self.api_url + "token/session/:create",
+                params={
+                    "consumerToken": self.consumer_token,
+                    "employeeToken": employee_token,
+                    "expirationDate": expire_at.isoformat(),
+                },
+                timeout=UPSTREAM_TIMEOUT,
+            )
+        except RequestException as e:
+            # Not the message, which has the url with the employee token in it
+            logger.warning(
+                "Tripletex didn't answer for tenant %s: %s",
+                self.name,
+                e.__class__.__name__,
+            )
+            raise HTTPException(502, "Tripletex didn't answer")
+
+        try:
+            data = response.json()
+            api_token = ApiTokenEnvelope(**data).value
+            token = SessionTokenResponse(
+                **api_token.model_dump() | {"api_url": self.api_url}
+            )
+        except (ValueError, TypeError):
+            # Pydantic's ValidationError and an unreadable body are both ValueErrors
+            logger.warning(
+                "Tripletex refused a session token for tenant %s with status %s: %s",
+                self.name,
+                response.status_code,
+                response.text,
+            )
+            raise HTTPException(401)
+
+        with self._lock:
+            self._tokens[self.cache_key(employee_token)] = token
+
+        return token
+
+    def create_tokens(self, employee_tokens: list[str]) -> list[BatchLoginResult]:
+        """Create session tokens for many employees, reusing cached ones where we can.
+
+        Uncached tokens are fetched concurrently, bounded by TT_BATCH_CONCURRENCY, and
+        duplicates within the batch only hit tripletex once.
+        """
+        unique_tokens = list(dict.fromkeys(employee_tokens))
+        uncached = [t for t in unique_tokens if self.cached_token(t) is None]
+
+        def try_create(employee_token: str) -> SessionTokenResponse | str:
+            try:
+                return self.create_token(employee_token)
+            except HTTPException as e:
+                return str(e.detail)
+            except Exception as e:
+                return str(e) or e.__class__.__name__
+
+        outcomes: dict[str, SessionTokenResponse | str] = {}
+        if uncached:
+            concurrency = min(int(getenv("TT_BATCH_CONCURRENCY", 8)), len(uncached))
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                outcomes |= zip(uncached, executor.map(try_create, uncached))
+
+        results = []
+        for index, employee_token in enumerate(employee_tokens):
+            outcome = outcomes.get(employee_token) or try_create(employee_token)
+            if isinstance(outcome, str):
+                results.append(BatchLoginResult(index=index, error=outcome))
+            else:
+                results.append(BatchLoginResult(index=index, token=outcome))
+
+        return results
+
+
+def _tenant_from_config(name: str, config: dict) -> Tenant:
+    prod = str(config.get("prod", False)).lower() in ("1", "true", "yes")
+    api_url = config.get("api_url") or (PROD_API_URL if prod else TEST_API_URL)
+    return Tenant(
+        name=name,
+        consumer_token=config["consumer_token"],
+        api_url=api_url.rstrip("/") + "/",
+    )
+
+
+@cache
+def get_tenants() -> dict[str, Tenant]:
+    """Read tenants from TT_TENANTS (json) or the file pointed to by TT_TENANTS_FILE.
+
+    The format is {"<tenant>": {"consumer_token": "...", "prod": true}}, with an optional
+    "api_url" overriding the environment. The classic TT_CONSUMER_TOKEN and TT_PROD
+    variables still work, and configure the tenant named "default".
+    """
+    tenants: dict[str, Tenant] = {}
+
+    if consumer_token := getenv("TT_CONSUMER_TOKEN"):
+        tenants[DEFAULT_TENANT] = _tenant_from_config(
+            DEFAULT_TENANT,
+            {"consumer_token": consumer_token, "prod": getenv("TT_PROD", False)},
+        )
+
+    raw_config: dict = {}
+    if tenants_file := getenv("TT_TENANTS_FILE"):
+        with open(tenants_file) as config_file:
+            raw_config |= load(config_file)
+    if tenants_json := getenv("TT_TENANTS"):
+        raw_config |= loads(tenants_json)
 
+    for name, config in raw_config.items():
+        tenants[name] = _tenant_from_config(name, config)
 
-consumer_token = getenv("TT_CONSUMER_TOKEN")
-prod = getenv("TT_PROD", False)
+    return tenants
 
-api_url = "https://tripletex.no/v2/" if prod else "https://api.tripletex.io/v2/"
+
+def get_tenant(name: str | None) -> Tenant:
+    tenants = get_tenants()
+    if name is None:
+        if DEFAULT_TENANT in tenants:
+            return tenants[DEFAULT_TENANT]
+        if len(tenants) == 1:
+            return next(iter(tenants.values()))
+        raise HTTPException(400, "No tenant given and no default tenant configured")
+
+    if name not in tenants:
+        raise HTTPException(404, f"Unknown tenant {name}")
+
+    return tenants[name]
 
 
 @app.post(
     "/login",
     response_model=SessionTokenResponse,
 )
-def create_token(employee_token: str = Body(alias="employeeToken", embed=True)):
-    expire_at = date.today() + timedelta(days=7)
-    response = put(
-        api_url + "token/session/:create",
-        params={
-            "consumerToken": consumer_token,
-            "employeeToken": employee_token,
-            "expirationDate": expire_at.isoformat(),
-        },
-    )
-    data = response.json()
-    try:
-        api_token = ApiTokenEnvelope(**data).value
-        response = SessionTokenResponse(**api_token.dict() | {"api_url": api_url})
-        return response
-    except:
-        print(data)
-        raise HTTPException(401)
+def create_token(
+    employee_token: str = Body(alias="employeeToken"),
+    tenant: str | None = Body(default=None),
+):
+    return get_tenant(tenant).create_token(employee_token)
+
+
+@app.post(
+    "/{tenant}/login",
+    response_model=SessionTokenResponse,
+)
+def create_tenant_token(
+    tenant: str, employee_token: str = Body(alias="employeeToken", embed=True)
+):
+    return get_tenant(tenant).create_token(employee_token)
+
+
+@app.post(
+    "/login/batch",
+    response_model=list[BatchLoginResult],
+)
+def create_tokens(
+    employee_tokens: list[str] = Body(alias="employeeTokens"),
+    tenant: str | None = Body(default=None),
+):
+    """Results are returned in the same order as the given employee tokens, with an
+    error instead of a token for the ones tripletex refused."""
+    return get_tenant(tenant).create_tokens(employee_tokens)
+
+
+@app.post(
+    "/{tenant}/login/batch",
+    response_model=list[BatchLoginResult],
+)
+def create_tenant_tokens(
+    tenant: str, employee_tokens: list[str] = Body(alias="employeeTokens", embed=True)
+):
+    return get_tenant(tenant).create_tokens(employee_tokens)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,305 @@
+"""A local index of everything the employee can log hours to in TripleTex.
+
+Activities are looked up by name in a json file per profile in the cache directory,
+instead of asking the api every time. The index has every project from
+/project/>forTimeSheet with its activities from /activity/>forTimeSheet, and the
+general activities, all fetched PAGE_SIZE at a time, with the projects' activities
+fetched in parallel. Updating it only fetches activities again for projects that are
+new or whose version changed.
+
+Searching ranks exact names first, then names starting with the query, then names
+with a word starting with it, then names containing it, and last names that have its
+letters in the same order or are close enough to be a typo.
+"""
+
+import difflib
+import os
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from json import loads
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Optional, TypeVar
+
+import click
+from appdirs import user_cache_dir
+from pydantic import BaseModel
+
+from ttcli.config.reader import current_profile
+from ttcli.tripletex.types import ActivityDTO, ActivityIndex, IndexedProject, ProjectDTO
+from ttcli.utils import list_adapter, prefetch
+
+if TYPE_CHECKING:
+    from ttcli.tripletex.TripleTex import TripleTex
+
+PAGE_SIZE = 1000
+# How old the index may get before `tripletex find` updates it
+MAX_AGE = timedelta(days=1)
+# How alike a name must be to a query to count as a typo of it, from 0 to 1
+FUZZY_CUTOFF = 0.75
+
+PROJECT_FIELDS = "id,name,displayName,number,version"
+ACTIVITY_FIELDS = "id,name,displayName,isProjectActivity"
+
+M = TypeVar("M", bound=BaseModel)
+
+
+@dataclass
+class IndexMatch:
+    activity: ActivityDTO
+    project: Optional[IndexedProject]
+    # Lower is better, see `score`
+    score: int
+
+    @property
+    def project_name(self) -> str:
+        return self.project.display_name if self.project else "General"
+
+
+def index_dir() -> Path:
+    return Path(user_cache_dir(appname="tt-cli", appauthor="brbcoffee")) / "tripletex"
+
+
+def index_file(profile: Optional[str] = None) -> Path:
+    return index_dir() / f"activities-{profile or current_profile()}.json"
+
+
+def load_index(profile: Optional[str] = None) -> Optional[ActivityIndex]:
+    try:
+        return ActivityIndex.model_validate_json(index_file(profile).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def save_index(index: ActivityIndex, profile: Optional[str] = None):
+    path = index_file(profile)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Through a rename, so a reader never sees half a file
+    partial = path.with_name(f"{path.name}.{os.getpid()}")
+    partial.write_text(index.model_dump_json())
+    os.replace(partial, path)
+
+
+def fetch_all(client: "TripleTex", path: str, params: dict, model: type[M]) -> list[M]:
+    """Every value of a list endpoint, a page at a time"""
+    values: list[M] = []
+    while True:
+        page = {"from": len(values), "count": PAGE_SIZE}
+        result = loads(client.api_get(path, params={**params, **page}))
+        values.extend(list_adapter(model).validate_python(result["values"]))
+        if len(result["values"]) < PAGE_SIZE:
+            return values
+
+
+def build_index(
+    client: "TripleTex", previous: Optional[ActivityIndex] = None
+) -> tuple[ActivityIndex, int]:
+    """A fresh index, reusing the activities of projects that haven't changed since
+    the previous one. Also returns for how many projects activities were fetched."""
+    # Log in first, so the fetching threads share one session
+    client.refresh_session()
+    employee_id = client.employee.employee_id
+    today = date.today().isoformat()
+
+    projects = fetch_all(
+        client,
+        "/project/>forTimeSheet",
+        {"employeeId": employee_id, "date": today, "fields": PROJECT_FIELDS},
+        IndexedProject,
+    )
+    general = fetch_all(
+        client,
+        "/activity",
+        {"isProjectActivity": False, "isInactive": False, "fields": ACTIVITY_FIELDS},
+        ActivityDTO,
+    )
+
+    known = {}
+    if previous is not None and previous.employee_id == employee_id:
+        known = {project.id: project for project in previous.projects}
+    changed = []
+    for project in projects:
+        before = known.get(project.id)
+        if before is not None and before.version == project.version:
+            project.activities = before.activities
+        else:
+            changed.append(project)
+
+    activities = prefetch(
+        lambda project_id: fetch_all(
+            client,
+            "/activity/>forTimeSheet",
+            {
+                "projectId": project_id,
+                "employeeId": employee_id,
+                "date": today,
+                "fields": ACTIVITY_FIELDS,
+            },
+            ActivityDTO,
+        ),
+        [project.id for project in changed],
+        client.name(),
+    )
+    for project in changed:
+        project.activities = activities[project.id]
+
+    index = ActivityIndex(
+        employee_id=employee_id,
+        updated_at=datetime.now(),
+        projects=projects,
+        general=general,
+    )
+    return index, len(changed)
+
+
+def update_index(
+    client: "TripleTex", rebuild: bool = False
+) -> tuple[ActivityIndex, int]:
+    profile = client.profile
+    index, fetched = build_index(client, None if rebuild else load_index(profile))
+    save_index(index, profile)
+    return index, fetched
+
+
+def current_index(
+    client: "TripleTex", max_age: Optional[timedelta] = None
+) -> ActivityIndex:
+    """The stored index, built first if there is none, or updated first if it's older
+    than max_age"""
+    index = load_index(client.profile)
+    if index is None:
+        return update_index(client)[0]
+    if max_age is not None and datetime.now() - index.updated_at > max_age:
+        return update_index(client)[0]
+    return index
+
+
+def is_subsequence(query: str, text: str) -> bool:
+    letters = iter(text)
+    return all(letter in letters for letter in query)
+
+
+def score(query: str, text: str) -> Optional[int]:
+    """How well text matches query, lower is better, or None if it doesn't"""
+    query, text = query.strip().casefold(), text.casefold()
+    if not query:
+        return None
+    if text == query:
+        return 0
+    if text.startswith(query):
+        return 1
+    if any(word.startswith(query) for word in re.split(r"\W+", text)):
+        return 2
+    if query in text:
+        return 3
+    if query.isdigit():
+        # A project number that's off by one is a different project
+        return None
+    if is_subsequence(query.replace(" ", ""), text):
+        return 4
+    if difflib.SequenceMatcher(None, query, text).ratio() >= FUZZY_CUTOFF:
+        return 5
+    return None
+
+
+def best_score(query: str, texts: Iterable[str]) -> Optional[int]:
+    scores = [s for text in texts if (s := score(query, text)) is not None]
+    return min(scores) if scores else None
+
+
+def project_texts(project: ProjectDTO) -> list[str]:
+    return [project.name, project.display_name, str(project.number)]
+
+
+def all_activities(
+    index: ActivityIndex,
+) -> Iterable[tuple[ActivityDTO, Optional[IndexedProject]]]:
+    for project in index.projects:
+        for activity in project.activities:
+            yield activity, project
+    for activity in index.general:
+        yield activity, None
+
+
+def search(
+    index: ActivityIndex, query: str, include_projects: bool = True
+) -> list[IndexMatch]:
+    """Activities matching query, best first. With include_projects, the activities of
+    projects that match are included too."""
+    matches = []
+    for activity, project in all_activities(index):
+        scores = [best_score(query, [activity.name, activity.display_name])]
+        if include_projects and project is not None:
+            scores.append(best_score(query, project_texts(project)))
+        found = [s for s in scores if s is not None]
+        if found:
+            matches.append(IndexMatch(activity, project, min(found)))
+
+    return sorted(
+        matches,
+        key=lambda match: (
+            match.score,
+            match.project is not None,
+            match.project_name,
+            match.activity.name,
+        ),
+    )
+
+
+def best_matches(matches: list[IndexMatch]) -> list[IndexMatch]:
+    return [match for match in matches if match.score == matches[0].score]
+
+
+def match_projects(index: ActivityIndex, query: str) -> list[IndexedProject]:
+    """The projects that match query best"""
+    scored = [
+        (s, project)
+        for project in index.projects
+        if (s := best_score(query, project_texts(project))) is not None
+    ]
+    if not scored:
+        return []
+    best = min(s for s, _ in scored)
+    return [project for s, project in scored if s == best]
+
+
+def match_activities(
+    index: ActivityIndex, query: str, project: Optional[IndexedProject] = None
+) -> list[IndexMatch]:
+    """The activities that match query best, in the project if one is given. Without
+    a project, a general activity wins over project activities with the same name."""
+    matches = [
+        match
+        for match in search(index, query, include_projects=False)
+        if project is None or (match.project and match.project.id == project.id)
+    ]
+    if not matches:
+        return []
+
+    best = best_matches(matches)
+    general = [match for match in best if match.project is None]
+    return general if project is None and len(general) == 1 else best
+
+
+def describe(match: IndexMatch) -> str:
+    return f"{match.project_name} / {match.activity.display_name}"
+
+
+def complete_activities(
+    ctx: click.Context, param: click.Parameter, incomplete: str
+) -> list[str]:
+    index = load_index()
+    if index is None:
+        return []
+    names = {activity.name for activity, _ in all_activities(index)}
+    return sorted(name for name in names if name.startswith(incomplete))
+
+
+def complete_projects(
+    ctx: click.Context, param: click.Parameter, incomplete: str
+) -> list[str]:
+    index = load_index()
+    if index is None:
+        return []
+    names = {project.name for project in index.projects}
+    return sorted(name for name in names if name.startswith(incomplete))
@@ -1,4 +1,4 @@
-from datetime import date
+from datetime import date, datetime
 from re import match
 
 from humps.camel import case as camel_case
@@ -54,12 +54,20 @@ class SessionTokenResponse(TripletexToken):
     api_url: HttpUrl
 
 
+class BatchLoginResult(BaseModel):
+    index: int
+    token: SessionTokenResponse | None = None
+    error: str | None = None
+
+
 class EmployeeDTO(BaseModel):
     employee_id: int
     employee: dict
     company_id: int
     company: dict
-    model_config = ConfigDict(alias_generator=camel_case, populate_by_name=True)
+    model_config = ConfigDict(
+        alias_generator=camel_case, populate_by_name=True, defer_build=True
+    )
 
 
 class ProjectDTO(BaseModel):
@@ -67,7 +75,9 @@ class ProjectDTO(BaseModel):
     name: str
     display_name: str
     number: int
-    model_config = ConfigDict(alias_generator=camel_case, populate_by_name=True)
+    model_config = ConfigDict(
+        alias_generator=camel_case, populate_by_name=True, defer_build=True
+    )
 
 
 class ActivityDTO(BaseModel):
@@ -75,13 +85,31 @@ class ActivityDTO(BaseModel):
     is_project_activity: bool
     name: str
     display_name: str
-    model_config = ConfigDict(alias_generator=camel_case, populate_by_name=True)
+    model_config = ConfigDict(
+        alias_generator=camel_case, populate_by_name=True, defer_build=True
+    )
+
+
+class IndexedProject(ProjectDTO):
+    """A project in the activity index, with what can be logged to it"""
+
+    version: int = 0
+    activities: list[ActivityDTO] = []
+
+
+class ActivityIndex(BaseModel):
+    employee_id: int
+    updated_at: datetime
+    projects: list[IndexedProject] = []
+    general: list[ActivityDTO] = []
+    model_config = ConfigDict(defer_build=True)
 
 
 class ConfiguredActivity(BaseModel):
     activity: ActivityDTO
     project: ProjectDTO | None = None
     is_project: bool
+    model_config = ConfigDict(defer_build=True)
 
 
 class TimesheetEntry(BaseModel):
@@ -90,4 +118,26 @@ class TimesheetEntry(BaseModel):
     date: date
     hours: float
     comment: str
-    model_config = ConfigDict(alias_generator=camel_case, populate_by_name=True)
+    model_config = ConfigDict(
+        alias_generator=camel_case, populate_by_name=True, defer_build=True
+    )
+
+
+class NamedRef(BaseModel):
+    name: str
+    model_config = ConfigDict(defer_build=True)
+
+
+class TimesheetHours(BaseModel):
+    """Just what summaries, exports and reconciling need from a timesheet entry"""
+
+    activity: NamedRef
+    project: NamedRef | None = None
+    date: date
+    hours: float
+    comment: str
+    model_config = ConfigDict(defer_build=True)
+
+    @property
+    def project_name(self) -> str:
+        return self.project.name if self.project else self.activity.name
@@ -1,12 +1,18 @@
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import date, datetime, timedelta
-from functools import cache
-from typing import Callable, TypeVar
+from functools import cache, wraps
+from os import getenv
+from typing import TYPE_CHECKING, Callable, Iterable, Optional, TypeVar
 
+import click
 from dateutil.relativedelta import relativedelta
 
 # Necessary for python < 3.10, could be directly imported from typing
-from typing_extensions import ParamSpec
+from typing_extensions import Concatenate, ParamSpec
+
+if TYPE_CHECKING:
+    from pydantic import TypeAdapter
 
 
 @dataclass
@@ -29,14 +35,47 @@ class TimeSpan:
             raise StopIteration
 
 
-def get_week_span(week: int) -> TimeSpan:
-    year = date.today().year
-    start_datetime = datetime.strptime(f"{year}-W{week}-1", "%Y-W%W-%w").date()
+@dataclass(frozen=True)
+class Entry:
+    """A timesheet entry from any service, reduced to what they all have in common"""
+
+    service: str
+    day: date
+    hours: float
+    description: str
+    project: Optional[str] = None
+
+
+def weeks_in_year(year: int) -> int:
+    """52 or 53, the 28th of December is always in the last ISO week"""
+    return date(year, 12, 28).isocalendar().week
+
+
+def get_week_span(week: int, year: Optional[int] = None) -> TimeSpan:
+    """:raises: click.BadParameter if the year doesn't have that week"""
+    if year is None:
+        year = date.today().year
+    if not 1 <= week <= weeks_in_year(year):
+        raise click.BadParameter(
+            f"{year} has weeks 1 to {weeks_in_year(year)}", param_hint="'--week'"
+        )
+    start_datetime = date.fromisocalendar(year, week, 1)
     end_datetime = start_datetime + timedelta(days=6)
 
     return TimeSpan(start_datetime, end_datetime)
 
 
+def get_mondays(span: TimeSpan) -> list[date]:
+    """The first day of every week overlapping the span"""
+    monday = span.start_date - timedelta(days=span.start_date.weekday())
+    mondays = []
+    while monday <= span.end_date:
+        mondays.append(monday)
+        monday += timedelta(weeks=1)
+
+    return mondays
+
+
 def get_week_number(day: date = date.today()) -> int:
     calendar = day.isocalendar()
     return calendar.week
@@ -44,6 +83,31 @@ def get_week_number(day: date = date.today()) -> int:
 
 P = ParamSpec("P")
 R = TypeVar("R")
+K = TypeVar("K")
+S = TypeVar("S")
+
+FETCH_CONCURRENCY_KEY = "TTCLI_FETCH_CONCURRENCY"
+
+
+def prefetch(
+    fetch: Callable[[K], R], keys: Iterable[K], service: Optional[str] = None
+) -> dict[K, R]:
+    """Call fetch for every key on a thread pool, at most TTCLI_FETCH_CONCURRENCY
+    at a time. Fetches from a service can be submitted to its scheduler instead,
+    which goes as fast as the service allows."""
+    keys = list(dict.fromkeys(keys))
+    if service is not None:
+        from ttcli.scheduler import submit_all
+
+        futures = submit_all(service, fetch, keys)
+        return {key: future.result() for key, future in zip(keys, futures)}
+
+    workers = min(int(getenv(FETCH_CONCURRENCY_KEY, 4)), len(keys))
+    if workers <= 1:
+        return {key: fetch(key) for key in keys}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(keys, executor.map(fetch, keys)))
 
 
 def typed_cache(func: Callable[P, R]) -> Callable[P, R]:
@@ -52,9 +116,44 @@ def typed_cache(func: Callable[P, R]) -> Callable[P, R]:
     return cache(func)  # type: ignore
 
 
+INSTANCE_CACHE_ATTRIBUTE = "_instance_cache"
+
+
+def instance_cache(
+    method: Callable[Concatenate[S, P], R]
+) -> Callable[Concatenate[S, P], R]:
+    """typed_cache for methods, but with the results kept on the instance, so they go
+    away with it instead of keeping it alive. `clear_instance_cache` forgets them."""
+
+    @wraps(method)
+    def wrapper(self: S, *args: P.args, **kwargs: P.kwargs) -> R:
+        results = self.__dict__.setdefault(INSTANCE_CACHE_ATTRIBUTE, {})
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        if key not in results:
+            results[key] = method(self, *args, **kwargs)
+        return results[key]
+
+    return wrapper
+
+
+def clear_instance_cache(instance: object):
+    instance.__dict__.pop(INSTANCE_CACHE_ATTRIBUTE, None)
+
+
+@cache
+def list_adapter(model: type[R]) -> "TypeAdapter[list[R]]":
+    """Validates a whole list of api objects in one call, instead of one model at a
+    time. Built the first time a model needs it and then kept."""
+    from pydantic import TypeAdapter
+
+    return TypeAdapter(list[model])  # type: ignore
+
+
 def get_month_span(
-    month: int, include_future: bool = False, year: int = datetime.today().year
+    month: int, include_future: bool = False, year: Optional[int] = None
 ) -> TimeSpan:
+    if year is None:
+        year = date.today().year
     first_day = datetime.strptime(f"{year}-{month}-1", "%Y-%m-%d").date()
     last_day_of_month = first_day + relativedelta(months=1, days=-1)
     last_day = (